@@ -0,0 +1,229 @@
+"""
+Sustitutos locales de los servicios de Mojang y Fabric para los benchmarks.
+
+`FakeEndpoints` levanta un servidor HTTP en 127.0.0.1 que imita las rutas que
+usa el instalador (manifest de versiones, JSON de cada versión, meta de
+Fabric, server.jar y el jar del instalador en Maven) con latencia y ancho de
+banda configurables, y cuenta las peticiones por ruta. `write_fake_java`
+crea un `java` falso que responde a `-version`, simula el instalador de
+Fabric y arranca un "servidor" que imprime la línea `Done (...)` y sale al
+recibir `stop`.
+"""
+
+import os
+import sys
+import json
+import time
+import stat
+import hashlib
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+MANIFEST_PATH = '/mc/game/version_manifest.json'
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """Sin trazas por clientes que cortan: el resolver de Fabric cancela las sondas que pierden."""
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeEndpoints:
+    """
+    Servidor HTTP de pruebas.
+
+    - `latency`: segundos añadidos a cada petición (simula el RTT).
+    - `bandwidth`: bytes/s para los cuerpos de respuesta (None = sin límite).
+    - `jar_size`: tamaño de los jars servidos.
+    - `loaders`: versiones de loader de Fabric anunciadas (la primera es la
+      más nueva); las `broken_loaders` primeras devuelven 404 en server/jar
+      para obligar al resolver a sondear.
+    """
+
+    def __init__(self, versions=('1.20.1', '1.20.4'), latency=0.0, bandwidth=None,
+                 jar_size=8 * 1024 * 1024, loaders=('0.15.3', '0.15.2', '0.15.1', '0.14.24'),
+                 installers=('1.0.1', '1.0.0'), broken_loaders=1):
+        self.versions = list(versions)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.loaders = list(loaders)
+        self.installers = list(installers)
+        self.broken_loaders = broken_loaders
+        self.jar = os.urandom(jar_size)
+        self.jar_sha1 = hashlib.sha1(self.jar).hexdigest()
+        self.manifest_etag = '"manifest-1"'
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    # --- Ciclo de vida ---
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    @property
+    def manifest_url(self):
+        return self.base_url + MANIFEST_PATH
+
+    def start(self):
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                owner._handle(self)
+
+        self._server = _QuietHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def snapshot(self):
+        """Copia de los contadores de peticiones por ruta."""
+        with self._lock:
+            return dict(self.counts)
+
+    # --- Rutas ---
+
+    def _route(self, path):
+        """Devuelve (clave de contador, status, cuerpo, cabeceras extra)."""
+        base = self.base_url
+        parts = path.split('?', 1)[0].strip('/').split('/')
+        if path == MANIFEST_PATH:
+            latest = self.versions[-1]
+            body = {
+                'latest': {'release': latest, 'snapshot': latest},
+                'versions': [
+                    {'id': v, 'type': 'release', 'url': f'{base}/v1/packages/{v}.json',
+                     'releaseTime': f'2023-{i + 1:02d}-01T00:00:00+00:00'}
+                    for i, v in enumerate(self.versions)
+                ],
+            }
+            return 'manifest', 200, json.dumps(body).encode(), {'ETag': self.manifest_etag}
+        if parts[:2] == ['v1', 'packages'] and len(parts) == 3:
+            version = parts[2][:-len('.json')]
+            if version not in self.versions:
+                return 'version_json', 404, b'', {}
+            body = {'id': version, 'downloads': {'server': {
+                'url': f'{base}/objects/{self.jar_sha1}/server.jar',
+                'sha1': self.jar_sha1, 'size': len(self.jar)}}}
+            return 'version_json', 200, json.dumps(body).encode(), {}
+        if parts[0] == 'objects':
+            return 'vanilla_jar', 200, self.jar, {}
+        if parts[:3] == ['v2', 'versions', 'installer']:
+            body = [{'version': v, 'stable': True} for v in self.installers]
+            return 'fabric_installers', 200, json.dumps(body).encode(), {}
+        if parts[:3] == ['v2', 'versions', 'loader'] and len(parts) == 4:
+            if parts[3] not in self.versions:
+                return 'fabric_loaders', 200, b'[]', {}
+            body = [{'loader': {'version': v, 'stable': True}} for v in self.loaders]
+            return 'fabric_loaders', 200, json.dumps(body).encode(), {}
+        if parts[:3] == ['v2', 'versions', 'loader'] and parts[-2:] == ['server', 'jar'] and len(parts) == 8:
+            mc, loader = parts[3], parts[4]
+            if mc not in self.versions or loader in self.loaders[:self.broken_loaders]:
+                return 'fabric_server_jar', 404, b'', {}
+            return 'fabric_server_jar', 200, self.jar, {}
+        if parts[:3] == ['net', 'fabricmc', 'fabric-installer']:
+            return 'fabric_installer_jar', 200, self.jar, {}
+        return 'unknown', 404, b'', {}
+
+    def _handle(self, req):
+        time.sleep(self.latency)
+        key, status, body, headers = self._route(req.path)
+        with self._lock:
+            self.counts[key] += 1
+        if key == 'manifest' and req.headers.get('If-None-Match') == headers.get('ETag'):
+            status, body = 304, b''
+
+        # Rango (reanudación de descargas)
+        rng = req.headers.get('Range')
+        if status == 200 and rng and rng.startswith('bytes='):
+            start = int(rng[len('bytes='):].split('-', 1)[0] or 0)
+            if start >= len(body):
+                status, body = 416, b''
+            else:
+                headers['Content-Range'] = f'bytes {start}-{len(body) - 1}/{len(body)}'
+                status, body = 206, body[start:]
+
+        req.send_response(status)
+        req.send_header('Content-Length', str(len(body)))
+        for k, v in headers.items():
+            req.send_header(k, v)
+        req.end_headers()
+        try:
+            self._write_body(req.wfile, body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _write_body(self, wfile, body):
+        if not self.bandwidth:
+            wfile.write(body)
+            return
+        chunk = max(4096, int(self.bandwidth / 20))
+        for i in range(0, len(body), chunk):
+            piece = body[i:i + chunk]
+            wfile.write(piece)
+            time.sleep(len(piece) / self.bandwidth)
+
+
+FAKE_JAVA = r'''#!{python}
+import os, sys, time
+args = sys.argv[1:]
+if args[:1] == ['-version']:
+    print('openjdk version "21.0.1" 2023-10-17 (fake)', file=sys.stderr)
+    sys.exit(0)
+if 'server' in args and '-dir' in args:
+    # Instalador de Fabric: genera server.jar en -dir
+    target = args[args.index('-dir') + 1]
+    time.sleep(float(os.environ.get('CNP_BENCH_INSTALLER_SECS', '0.2')))
+    with open(os.path.join(target, 'server.jar'), 'wb') as f:
+        f.write(b'fake fabric server')
+    print('Done installing fabric server', flush=True)
+    sys.exit(0)
+print('[Server thread/INFO]: Starting minecraft server', flush=True)
+boot = float(os.environ.get('CNP_BENCH_BOOT_SECS', '0.5'))
+time.sleep(boot)
+os.makedirs('world', exist_ok=True)
+print('[12:00:00] [Server thread/INFO]: Done (%.3fs)! For help, type "help"' % boot, flush=True)
+for line in sys.stdin:
+    if line.strip() == 'stop':
+        print('[Server thread/INFO]: Stopping server', flush=True)
+        break
+sys.exit(0)
+'''
+
+
+def write_fake_java(bin_dir):
+    """
+    Escribe el `java` falso en `bin_dir` y devuelve la ruta.
+
+    En Windows también se crea `java.cmd`, pero `create_subprocess_exec` solo
+    resuelve `.exe`: el benchmark está pensado para ejecutarse en Linux/macOS.
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, 'java')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(FAKE_JAVA.replace('{python}', sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    if os.name == 'nt':
+        with open(path + '.cmd', 'w', encoding='utf-8') as f:
+            f.write(f'@"{sys.executable}" "{path}" %*\n')
+    return path
@@ -0,0 +1,115 @@
+"""
+Servidor RCON local que imita al de Minecraft para benchmarks y pruebas.
+
+Reproduce lo que importa del lector de vanilla: procesa un paquete por
+lectura (si llegan dos juntos cierra la conexión, como el real), contesta
+la autenticación fallida con id -1, trocea las respuestas en paquetes de
+4096 bytes y responde "Unknown request" a los tipos que no conoce. Cuenta
+conexiones, autenticaciones y comandos en `counts`.
+"""
+
+import os
+import sys
+import asyncio
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from utils.rcon import (encode_packet, read_packet, TYPE_AUTH, TYPE_AUTH_RESPONSE,  # noqa: E402
+                        TYPE_COMMAND, TYPE_RESPONSE, MAX_RESPONSE_CHUNK)
+
+
+class FakeRconServer:
+    """
+    - `latency`: segundos antes de cada respuesta (simula el RTT y el tick).
+    - `players`: nombres que devuelve `list`.
+    - `strict`: cerrar la conexión si llegan varios paquetes en una lectura.
+
+    Comandos: `list`, `say <texto>`, `save-all`, `seed`, `stop` (cierra la
+    conexión) y `dump <n>` (respuesta de n bytes, para probar el troceo).
+    Cualquier otro devuelve "Unknown or incomplete command".
+    """
+
+    def __init__(self, password='test', latency=0.0, players=('Alex', 'Steve'), strict=True):
+        self.password = password
+        self.latency = latency
+        self.players = list(players)
+        self.strict = strict
+        self.counts = Counter()
+        self.executed = []
+        self._server = None
+        self._writers = set()
+        self.port = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._client, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Como un servidor que se apaga: cortar también las conexiones abiertas
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def run_command(self, cmd):
+        name, _, rest = cmd.strip().lstrip('/').partition(' ')
+        if name == 'list':
+            names = ', '.join(self.players)
+            return f'There are {len(self.players)} of a max of 20 players online: {names}'
+        if name == 'say':
+            return ''
+        if name == 'save-all':
+            return 'Saving the game (this may take a moment!)Saved the game'
+        if name == 'seed':
+            return 'Seed: [-123456789]'
+        if name == 'dump':
+            return ('x' * 63 + '\n') * (int(rest or 10000) // 64)
+        return f'Unknown or incomplete command, see below for error{cmd}<--[HERE]'
+
+    async def _send(self, writer, request_id, ptype, body):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        writer.write(encode_packet(request_id, ptype, body))
+        await writer.drain()
+
+    async def _client(self, reader, writer):
+        self.counts['connections'] += 1
+        self._writers.add(writer)
+        authed = False
+        try:
+            while True:
+                request_id, ptype, body = await read_packet(reader)
+                if self.strict and reader._buffer:
+                    # Vanilla lee un bloque y exige que sea exactamente un paquete
+                    self.counts['dropped_pipelined'] += 1
+                    break
+                if ptype == TYPE_AUTH:
+                    self.counts['auths'] += 1
+                    authed = body == self.password
+                    await self._send(writer, request_id if authed else -1, TYPE_AUTH_RESPONSE, '')
+                elif ptype == TYPE_COMMAND:
+                    if not authed:
+                        await self._send(writer, -1, TYPE_AUTH_RESPONSE, '')
+                        continue
+                    self.counts['commands'] += 1
+                    self.executed.append(body)
+                    out = self.run_command(body).encode('utf-8')
+                    chunks = [out[i:i + MAX_RESPONSE_CHUNK] for i in range(0, len(out), MAX_RESPONSE_CHUNK)] or [b'']
+                    for chunk in chunks:
+                        await self._send(writer, request_id, TYPE_RESPONSE, chunk.decode('utf-8', errors='replace'))
+                    if body.strip().lstrip('/') == 'stop':
+                        break
+                else:
+                    self.counts['pings'] += 1
+                    await self._send(writer, request_id, TYPE_RESPONSE, f'Unknown request {ptype:x}')
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
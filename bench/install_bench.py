@@ -0,0 +1,309 @@
+"""
+Benchmark de extremo a extremo de `!install` contra servicios locales falsos.
+
+Ejecuta el cog `Installer` real (cola de trabajos, descargas, caché,
+resolver de Fabric y primer arranque) con un bot y un canal de Discord
+simulados, apuntando a `FakeEndpoints` y a un `java` falso. Cada escenario
+se ejecuta en una carpeta temporal propia:
+
+- `vanilla-cold` / `fabric-cold`: sin caché ni metadatos previos.
+- `vanilla-warm` / `fabric-warm`: misma carpeta de caché, con un cog nuevo
+  (como tras reiniciar el bot), para medir manifest/matriz/caché en disco.
+
+Por escenario se guardan los tiempos de cada etapa del trabajo (layout,
+config, metadata, download, loader, first_boot, register), el tiempo de hash
+dentro de la descarga, las peticiones que hizo el Downloader y las que
+recibió el servidor falso por ruta.
+
+Uso (desde la raíz del repositorio, en Linux/macOS):
+
+    python bench/install_bench.py                      # ejecutar y mostrar
+    python bench/install_bench.py --save-baseline      # guardar como referencia
+    python bench/install_bench.py --compare            # comparar con la referencia
+    python bench/install_bench.py --latency 0.05 --bandwidth 20e6 --repeat 3
+
+Con `--compare` el proceso termina con código 1 si hay regresiones: tiempos
+por encima de la referencia más la tolerancia, o más peticiones de red.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import platform
+from statistics import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bench.fake_endpoints import FakeEndpoints, write_fake_java  # noqa: E402
+
+STAGES = ('layout', 'config', 'metadata', 'download', 'loader', 'first_boot', 'register')
+SCENARIOS = ('vanilla-cold', 'vanilla-warm', 'fabric-cold', 'fabric-warm')
+DEFAULT_BASELINE = os.path.join(ROOT, 'bench', 'baselines', 'install.json')
+RESULTS_DIR = os.path.join(ROOT, 'bench', 'results')
+
+
+# --- Discord simulado ---
+
+class _Message:
+    async def edit(self, **kwargs):
+        pass
+
+
+class _Author:
+    id = 0
+    name = 'bench'
+
+
+class BenchContext:
+    """Lo mínimo de `commands.Context` que usa el instalador."""
+
+    def __init__(self):
+        self.author = _Author()
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content if content is not None else sorted(kwargs))
+        return _Message()
+
+
+class BenchBot:
+    def __init__(self):
+        from utils.config import Config
+        self.config_manager = Config()
+
+    def get_cog(self, name):
+        return None
+
+    async def is_owner(self, user):
+        return True
+
+
+# --- Ejecución ---
+
+async def _install_once(fake, server_type, version, name):
+    """Instala un servidor con un cog nuevo y devuelve sus métricas."""
+    from cogs.installer import Installer
+
+    inst = Installer(BenchBot())
+    await inst.cog_load()
+    before = fake.snapshot()
+    ctx = BenchContext()
+    started = time.perf_counter()
+    try:
+        await inst.install_server.callback(inst, ctx, server_type, version, name)
+        job = inst.jobs.recent(1)[0] if inst.jobs.jobs else None
+        if job is None:
+            raise RuntimeError(f'No se creó el trabajo de instalación: {ctx.sent}')
+        while not job.finished_state:
+            await asyncio.sleep(0.02)
+        wall = time.perf_counter() - started
+    finally:
+        await inst.cog_unload()
+    after = fake.snapshot()
+
+    stages = {}
+    for stage in STAGES:
+        took = job.stage_elapsed(stage)
+        if took is not None:
+            stages[stage] = round(took, 4)
+    return {
+        'status': job.status,
+        'error': job.error,
+        'wall': round(wall, 4),
+        'job_elapsed': round(job.elapsed(), 4),
+        'stages': stages,
+        'hash_seconds': round(inst.downloader.hash_seconds, 4),
+        'client_requests': inst.downloader.request_count,
+        'bytes_downloaded': inst.downloader.bytes_downloaded,
+        'server_requests': {k: after.get(k, 0) - before.get(k, 0)
+                            for k in after if after.get(k, 0) - before.get(k, 0)},
+    }
+
+
+async def _run_family(fake, server_type, version, workdir, wanted):
+    """Instalación en frío y, con la misma caché, otra en caliente."""
+    results = {}
+    cold = await _install_once(fake, server_type, version, 'cold')
+    if f'{server_type}-cold' in wanted:
+        results[f'{server_type}-cold'] = cold
+    if f'{server_type}-warm' in wanted:
+        results[f'{server_type}-warm'] = await _install_once(fake, server_type, version, 'warm')
+    return results
+
+
+def run_scenarios(args):
+    fake = FakeEndpoints(latency=args.latency, bandwidth=args.bandwidth,
+                         jar_size=int(args.jar_mb * 1024 * 1024),
+                         broken_loaders=args.broken_loaders).start()
+    base_dir = tempfile.mkdtemp(prefix='cnp_bench_')
+    old_cwd = os.getcwd()
+    old_env = dict(os.environ)
+    runs = {}
+    try:
+        bin_dir = os.path.join(base_dir, 'bin')
+        write_fake_java(bin_dir)
+        os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+        os.environ['CNP_BENCH_BOOT_SECS'] = str(args.boot_secs)
+        os.environ['CNP_MOJANG_MANIFEST_URL'] = fake.manifest_url
+        os.environ['CNP_FABRIC_META_URL'] = fake.base_url
+        os.environ['CNP_FABRIC_MAVEN_URL'] = fake.base_url
+        os.environ['CNP_FIRST_BOOT_TIMEOUT'] = '60'
+
+        for i in range(args.repeat):
+            for server_type in ('vanilla', 'fabric'):
+                wanted = [s for s in args.scenarios if s.startswith(server_type + '-')]
+                if not wanted:
+                    continue
+                workdir = os.path.join(base_dir, f'{server_type}-{i}')
+                os.makedirs(workdir)
+                os.chdir(workdir)
+                os.environ['CNP_DEFAULT_SERVERS_PATH'] = os.path.join(workdir, 'servers')
+                os.environ['CNP_ARTIFACT_CACHE'] = os.path.join(workdir, 'cache')
+                family = asyncio.run(_run_family(fake, server_type, args.version, workdir, wanted))
+                for name, result in family.items():
+                    runs.setdefault(name, []).append(result)
+                os.chdir(old_cwd)
+    finally:
+        os.chdir(old_cwd)
+        os.environ.clear()
+        os.environ.update(old_env)
+        fake.stop()
+        shutil.rmtree(base_dir, ignore_errors=True)
+    return {name: _summarize(samples) for name, samples in runs.items()}
+
+
+def _summarize(samples):
+    """Mediana de los tiempos; las peticiones son deterministas y se toman de la primera."""
+    first = samples[0]
+    summary = dict(first)
+    summary['samples'] = len(samples)
+    summary['status'] = first['status'] if all(s['status'] == first['status'] for s in samples) else 'mixed'
+    for key in ('wall', 'job_elapsed', 'hash_seconds'):
+        summary[key] = round(median(s[key] for s in samples), 4)
+    summary['stages'] = {
+        stage: round(median(s['stages'].get(stage, 0.0) for s in samples), 4)
+        for stage in first['stages']
+    }
+    return summary
+
+
+# --- Informe y comparación ---
+
+def _print_table(results):
+    header = f"{'escenario':<14}{'total':>8}" + ''.join(f'{s[:10]:>11}' for s in STAGES) + f"{'hash':>8}{'reqs':>6}"
+    print(header)
+    print('-' * len(header))
+    for name in SCENARIOS:
+        r = results.get(name)
+        if not r:
+            continue
+        row = f"{name:<14}{r['job_elapsed']:>8.3f}"
+        for stage in STAGES:
+            took = r['stages'].get(stage)
+            row += f'{took:>11.3f}' if took is not None else f"{'-':>11}"
+        row += f"{r['hash_seconds']:>8.3f}{r['client_requests']:>6}"
+        if r['status'] != 'done':
+            row += f"  [{r['status']}: {r.get('error')}]"
+        print(row)
+        routes = ', '.join(f'{k}={v}' for k, v in sorted(r['server_requests'].items()))
+        print(f"{'':<14}peticiones: {routes or 'ninguna'}")
+
+
+def compare(results, baseline, tolerance, min_delta):
+    """Lista de regresiones (texto) respecto a la referencia."""
+    problems = []
+    for name, current in results.items():
+        ref = baseline.get('results', {}).get(name)
+        if not ref:
+            continue
+        if current['status'] != ref.get('status'):
+            problems.append(f"{name}: estado {ref.get('status')} -> {current['status']}")
+        timings = [('total', current['job_elapsed'], ref.get('job_elapsed')),
+                   ('hash', current['hash_seconds'], ref.get('hash_seconds'))]
+        timings += [(stage, took, ref.get('stages', {}).get(stage)) for stage, took in current['stages'].items()]
+        for label, now, before in timings:
+            if before is None:
+                continue
+            if now > before * (1 + tolerance) and now - before > min_delta:
+                problems.append(f'{name}: {label} {before:.3f}s -> {now:.3f}s')
+        if current['client_requests'] > ref.get('client_requests', current['client_requests']):
+            problems.append(f"{name}: peticiones {ref['client_requests']} -> {current['client_requests']}")
+        for route, count in current['server_requests'].items():
+            ref_count = ref.get('server_requests', {}).get(route, 0)
+            if count > ref_count:
+                problems.append(f'{name}: {route} {ref_count} -> {count} peticiones')
+    return problems
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de !install contra endpoints locales falsos.')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--version', default='1.20.1', help='Versión de Minecraft a instalar')
+    parser.add_argument('--repeat', type=int, default=1, help='Repeticiones (se usa la mediana)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latencia añadida por petición (s)')
+    parser.add_argument('--bandwidth', type=float, default=None, help='Ancho de banda del servidor falso (bytes/s)')
+    parser.add_argument('--jar-mb', type=float, default=8.0, help='Tamaño de los jars servidos (MB)')
+    parser.add_argument('--broken-loaders', type=int, default=1,
+                        help='Loaders de Fabric más nuevos que devuelven 404 (fuerzan sondeos)')
+    parser.add_argument('--boot-secs', type=float, default=0.5, help='Duración del arranque del java falso')
+    parser.add_argument('--output', help='Fichero JSON de resultados (por defecto bench/results/)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Fichero JSON de referencia')
+    parser.add_argument('--save-baseline', action='store_true', help='Guardar estos resultados como referencia')
+    parser.add_argument('--compare', action='store_true', help='Comparar con la referencia y fallar si hay regresiones')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Margen relativo para los tiempos')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='Diferencia mínima (s) para contar como regresión')
+    args = parser.parse_args(argv)
+
+    results = run_scenarios(args)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'params': {k: getattr(args, k) for k in ('version', 'repeat', 'latency', 'bandwidth', 'jar_mb',
+                                                 'broken_loaders', 'boot_secs')},
+        'results': results,
+    }
+    _print_table(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"install-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    _write_json(output, report)
+    print(f'\nResultados guardados en {output}')
+    if args.save_baseline:
+        _write_json(args.baseline, report)
+        print(f'Referencia actualizada: {args.baseline}')
+
+    if args.compare:
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f'No se pudo leer la referencia {args.baseline}: {e}')
+            return 2
+        if baseline.get('params') != report['params']:
+            print('⚠️ Los parámetros difieren de los de la referencia; la comparación puede no ser válida.')
+        problems = compare(results, baseline, args.tolerance, args.min_delta)
+        if problems:
+            print('\n❌ Regresiones respecto a la referencia:')
+            for p in problems:
+                print(f'  - {p}')
+            return 1
+        print('\n✅ Sin regresiones respecto a la referencia.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
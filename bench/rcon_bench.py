@@ -0,0 +1,94 @@
+"""
+Coste por comando RCON: conexión nueva por comando frente a sesión en pool.
+
+Compara, contra `FakeRconServer` con la latencia indicada:
+
+- `oneshot`: lo que hacía el bot antes, sondeo con `socket.create_connection`
+  y luego una conexión al estilo de `mcrcon.MCRcon` (conexión,
+  autenticación, comando y cierre) dentro de `asyncio.to_thread`.
+- `pooled`: `RconPool`, una sesión autenticada reutilizada.
+
+Uso (desde la raíz del repositorio):
+
+    python bench/rcon_bench.py --latency 0.02 --commands 50
+"""
+
+import os
+import sys
+import time
+import socket
+import struct
+import asyncio
+import argparse
+from statistics import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bench.fake_rcon import FakeRconServer  # noqa: E402
+from utils.rcon import RconPool, encode_packet, TYPE_AUTH, TYPE_COMMAND  # noqa: E402
+
+
+def _oneshot_command(port, password, cmd):
+    """Como mcrcon.MCRcon (que en Linux no funciona fuera del hilo principal por SIGALRM)."""
+    def recv_packet(sock):
+        data = b''
+        while len(data) < 4:
+            data += sock.recv(4 - len(data))
+        (length,) = struct.unpack('<i', data)
+        data = b''
+        while len(data) < length:
+            data += sock.recv(length - len(data))
+        return struct.unpack('<i', data[:4])[0], data[8:-2].decode('utf-8')
+
+    with socket.create_connection(('127.0.0.1', port), timeout=3):
+        pass
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+        sock.sendall(encode_packet(0, TYPE_AUTH, password))
+        if recv_packet(sock)[0] == -1:
+            raise RuntimeError('auth')
+        sock.sendall(encode_packet(0, TYPE_COMMAND, cmd))
+        return recv_packet(sock)[1]
+
+
+async def bench_oneshot(server, commands):
+    times = []
+    for _ in range(commands):
+        started = time.perf_counter()
+        await asyncio.to_thread(_oneshot_command, server.port, server.password, 'list')
+        times.append(time.perf_counter() - started)
+    return times
+
+
+async def bench_pooled(server, commands):
+    pool = RconPool(password=server.password, keepalive=0)
+    times = []
+    try:
+        for _ in range(commands):
+            started = time.perf_counter()
+            await pool.command('127.0.0.1', server.port, 'list')
+            times.append(time.perf_counter() - started)
+    finally:
+        await pool.close_all()
+    return times
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.01, help='segundos por respuesta del servidor falso')
+    parser.add_argument('--commands', type=int, default=30)
+    args = parser.parse_args()
+
+    for name, fn in (('oneshot', bench_oneshot), ('pooled', bench_pooled)):
+        server = await FakeRconServer(latency=args.latency).start()
+        try:
+            times = await fn(server, args.commands)
+        finally:
+            await server.stop()
+        print(f'{name:8} mediana {median(times) * 1000:7.1f} ms  total {sum(times):6.2f} s  '
+              f'conexiones {server.counts["connections"]:3}  autenticaciones {server.counts["auths"]:3}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
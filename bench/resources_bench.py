@@ -0,0 +1,70 @@
+"""
+Coste del muestreo de recursos (`ResourceSampler`) con muchos servidores.
+
+Lanza `--servers` árboles de procesos falsos (un `sh` con dos `sleep`, como
+script → java), toma `--samples` muestras seguidas y muestra lo que exporta
+el propio muestreador: `cnp_sampler_cpu_seconds_total` y la duración de cada
+muestra, separando las que recorren todo /proc (`rescan`) de las que solo
+leen los PIDs conocidos. Solo Linux.
+
+Uso (desde la raíz del repositorio):
+
+    python bench/resources_bench.py --servers 50 --samples 60
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+from statistics import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from utils.resources import ResourceSampler, proc_available  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--servers', type=int, default=50)
+    parser.add_argument('--samples', type=int, default=60)
+    parser.add_argument('--interval', type=float, default=5.0, help='CNP_METRICS_INTERVAL supuesto para el % de CPU')
+    parser.add_argument('--rescan', type=int, default=12)
+    args = parser.parse_args()
+    if not proc_available():
+        sys.exit('Sin /proc: el muestreo solo funciona en Linux')
+
+    procs = [subprocess.Popen(['sh', '-c', 'sleep 1000 & sleep 1000 & wait'], start_new_session=True)
+             for _ in range(args.servers)]
+    try:
+        time.sleep(0.3)
+        sampler = ResourceSampler(interval=args.interval, rescan=args.rescan)
+        targets = {f'srv{i}': p.pid for i, p in enumerate(procs)}
+        full, known = [], []
+        for i in range(args.samples):
+            started = time.perf_counter()
+            sampler.sample(targets)
+            (full if i % args.rescan == 0 else known).append(time.perf_counter() - started)
+
+        metrics = dict(line.split(' ', 1) for line in sampler.prometheus().splitlines()
+                       if line.startswith('cnp_sampler'))
+        cpu = float(metrics['cnp_sampler_cpu_seconds_total'])
+        processes = sum(sampler.get(name).processes for name in targets)
+        print(f'{args.servers} servidores, {processes} procesos, {args.samples} muestras')
+        print(f'rescan     mediana {median(full) * 1000:6.2f} ms  ({len(full)} muestras)')
+        if known:
+            print(f'conocidos  mediana {median(known) * 1000:6.2f} ms  ({len(known)} muestras)')
+        print(f'cnp_sampler_cpu_seconds_total {cpu:.4f}  '
+              f'-> {cpu / args.samples * 1000:.2f} ms por muestra, '
+              f'{cpu / args.samples / args.interval * 100:.2f} % de un núcleo cada {args.interval:g} s')
+    finally:
+        for p in procs:
+            os.killpg(p.pid, signal.SIGKILL)
+            p.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,22 @@
 import os
 import json
+import asyncio
 from discord.ext import commands
-import urllib.request
-import urllib.error
-import shutil
 import time
-import subprocess
-import asyncio
+from utils.downloader import Downloader, DownloadError, describe_progress, format_bytes
+from utils.artifact_cache import ArtifactCache
+from utils.mojang_manifest import VersionManifest, LATEST_ALIASES, MANIFEST_URL
+from utils.fabric_resolver import FabricResolver, FABRIC_META_URL, FABRIC_MAVEN_URL
+from utils.process_runner import run_streamed, check_java
+from utils.server_boot import first_boot
+from utils.jobs import JobQueue
+from utils.errors import log_exception
+from utils.templates import TemplateStore, clone_tree, rewrite_properties
+from utils.progress import ProgressReporter
+from utils.install_checkpoint import InstallCheckpoint, INSTALL_STAGES
+from utils.ports import PortAllocator, server_ports
+from utils.memory import MemoryPlanner, JVM_ARGS_FILE, format_mb
+from utils.process_backend import write_start_scripts, default_script
 
 class Installer(commands.Cog):
     """
@@ -16,17 +26,160 @@ class Installer(commands.Cog):
         self.bot = bot
         # Usar el manager central que está en el bot
         self.config = bot.config_manager 
+        # Reparto de puertos compartido con ServerManagement (ver main.py)
+        self.ports = getattr(bot, 'port_allocator', None) or PortAllocator(self.config)
+        # Heap y flags de la JVM según la RAM del host y el perfil elegido
+        self.memory = getattr(bot, 'memory_planner', None) or MemoryPlanner(self.config)
         # Ruta por defecto donde crear servidores si no se indica
         self.default_parent = os.environ.get('CNP_DEFAULT_SERVERS_PATH', r'C:/Documents/servers')
+        # Descargas en hilos propios: el event loop nunca espera a la red
+        self.downloader = Downloader(max_concurrent=int(os.environ.get('CNP_MAX_DOWNLOADS', 3)))
+        # Caché de jars por SHA-1 (en el mismo disco que los servidores para poder usar hard links)
+        cache_root = os.environ.get('CNP_ARTIFACT_CACHE', os.path.join(self.default_parent, '.cnp_cache'))
+        cache_max = float(os.environ.get('CNP_CACHE_MAX_GB', 5)) * 1024 ** 3
+        self.artifacts = ArtifactCache(cache_root, max_bytes=cache_max)
+        # Manifest de Mojang persistido en disco; solo se revalida al caducar el TTL
+        self.manifest = VersionManifest(self.downloader, os.path.join(cache_root, 'meta'),
+                                        ttl=int(os.environ.get('CNP_MANIFEST_TTL', 3600)),
+                                        url=os.environ.get('CNP_MOJANG_MANIFEST_URL', MANIFEST_URL))
+        # Matriz de compatibilidad Fabric (mc -> loader/installer) aprendida en instalaciones previas
+        self.fabric = FabricResolver(self.downloader, os.path.join(cache_root, 'meta', 'fabric_matrix.json'),
+                                     ttl=int(os.environ.get('CNP_FABRIC_MATRIX_TTL', 7 * 86400)),
+                                     meta_url=os.environ.get('CNP_FABRIC_META_URL', FABRIC_META_URL),
+                                     maven_url=os.environ.get('CNP_FABRIC_MAVEN_URL', FABRIC_MAVEN_URL))
+        # Límite superior del primer arranque (generación del mundo)
+        self.first_boot_timeout = int(os.environ.get('CNP_FIRST_BOOT_TIMEOUT', 300))
+        self.boot_times_path = os.path.join(cache_root, 'meta', 'boot_times.json')
+        # Cola de instalaciones: pool de workers y cupos por etapa
+        self.jobs = JobQueue(
+            'install_jobs.json',
+            workers=int(os.environ.get('CNP_INSTALL_WORKERS', 2)),
+            stage_limits={
+                'download': int(os.environ.get('CNP_STAGE_DOWNLOAD', 3)),
+                'loader': int(os.environ.get('CNP_STAGE_LOADER', os.environ.get('CNP_STAGE_EXTRACT', 2))),
+                'first_boot': int(os.environ.get('CNP_STAGE_FIRST_BOOT', 1)),
+            },
+        )
+        self.jobs.register('install', self._run_install_job, on_cancel=self._cancel_queued_job)
+        # Contexto de Discord de cada trabajo (solo en memoria)
+        self._job_contexts = {}
+        # Servidores "plantilla" a partir de los que se clonan otros
+        self.templates = TemplateStore('templates.json')
+
+    async def cog_load(self):
+        if self.jobs.restored:
+            print(f'  ↺ {len(self.jobs.restored)} instalación(es) en cola recuperadas: '
+                  f'{", ".join(j.id for j in self.jobs.restored)}.')
+        self.jobs.start()
+
+    async def cog_unload(self):
+        await self.jobs.stop()
+        self.downloader.close()
+
+    def _record_boot_time(self, server_type, version, seconds):
+        """Guarda el tiempo hasta 'Done' del primer arranque por tipo y versión (últimas 20 medidas)."""
+        try:
+            with open(self.boot_times_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            data = {}
+        key = f'{server_type.lower()}-{version}'
+        data[key] = (data.get(key, []) + [round(seconds, 2)])[-20:]
+        tmp_path = self.boot_times_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.boot_times_path)
+        except Exception:
+            pass
+
+    def _progress_callback(self, report, label):
+        """Callback de descarga que actualiza el progreso en vivo del mensaje de la instalación."""
+        def on_progress(p):
+            text = f'{label}: {describe_progress(p)}'
+            if report.job is not None:
+                # El progreso del trabajo se limpia al cambiar de etapa
+                report.job.set_progress(text)
+                report.touch()
+            else:
+                report.detail(text)
+
+        return on_progress
+
+    def _debug_logger(self, server_path):
+        """Función que añade líneas con marca de tiempo a `install_debug.log` del servidor."""
+        debug_log_path = os.path.join(server_path, 'install_debug.log')
+
+        def log_debug(msg):
+            ts = time.strftime('%Y-%m-%d %H:%M:%S')
+            try:
+                with open(debug_log_path, 'a', encoding='utf-8') as df:
+                    df.write(f'[{ts}] {msg}\n')
+            except Exception:
+                pass
+
+        return log_debug
+
+    async def _try_download(self, url, dest_path, log_debug):
+        """Descarga en streaming con traza; devuelve (ok, status, tamaño)."""
+        log_debug(f'Trying download URL: {url}')
+        try:
+            result = await self.downloader.download(url, dest_path)
+            log_debug(f'HTTP {result.status} for {url}; downloaded {result.size} bytes to {dest_path} '
+                      f'in {result.elapsed:.1f}s (resumed {result.resumed}x)')
+            return True, result.status, result.size
+        except DownloadError as de:
+            log_debug(f'Download failed for {url}: {de}')
+            return False, de.status, None
+        except Exception as e:
+            log_debug(f'Error downloading {url}: {e}')
+            return False, None, None
+
+    def _resume_hint(self, server_path):
+        folder = os.path.basename(server_path)
+        target = folder if os.path.dirname(server_path) == self.default_parent else server_path
+        return f'♻️ Progreso guardado. Reintenta solo lo pendiente con `!install --resume {target}`.'
 
     @commands.command(name='install')
     @commands.is_owner()
-    async def install_server(self, ctx, server_type: str, version: str, base_name: str, parent_path: str = None):
+    async def install_server(self, ctx, *args):
         """
         Crea la estructura de carpetas, EULA y config. de RAM para un nuevo servidor.
-        Uso: !install <tipo> <version> <nombre> <ruta_padre>
+        Uso: !install <tipo> <version> <nombre> [ruta_padre] [--resume]
+        Reanudar una instalación interrumpida: !install --resume <carpeta>
         Ejemplo: !install neoforge 1.21.1 mi_servidor D:\\ServidoresMC
         """
+        resume = any(a.lower() == '--resume' for a in args)
+        args = [a for a in args if a.lower() != '--resume']
+        if resume and len(args) == 1:
+            # `!install --resume <carpeta>`: los parámetros salen del checkpoint
+            target = args[0] if os.path.isabs(args[0]) else os.path.join(self.default_parent, args[0])
+            ckpt = InstallCheckpoint.load(target)
+            if ckpt is None or not ckpt.params:
+                await ctx.send(f'❌ `{args[0]}` no tiene un checkpoint de instalación; no se puede reanudar.')
+                return
+            p = ckpt.params
+            args = [p['server_type'], p['version'], p['name'], os.path.dirname(target)]
+        if not 3 <= len(args) <= 4:
+            await ctx.send('❌ Faltan argumentos. Uso correcto: `!install <tipo> <version> <nombre> [ruta_padre] [--resume]` '
+                           'o `!install --resume <carpeta>`')
+            return
+        server_type, version, base_name = args[:3]
+        parent_path = args[3] if len(args) == 4 else None
+
+        # 0. Traducir alias de versión (`latest`, `latest-snapshot`) al id real
+        if version.lower() in LATEST_ALIASES:
+            try:
+                await self.manifest.ensure_fresh()
+                resolved = self.manifest.resolve_alias(version)
+            except Exception as e:
+                await ctx.send(f'❌ No se pudo resolver la versión `{version}`: {e}')
+                return
+            alias_note = f'ℹ️ `{version}` → `{resolved}`'
+            version = resolved
+        else:
+            alias_note = None
+
         # 1. Determinar y validar la ruta padre
         if not parent_path:
             parent_path = self.default_parent
@@ -42,407 +195,685 @@ class Installer(commands.Cog):
         folder_name = f"{base_name}_{version}_{server_type}"
         full_server_path = os.path.join(parent_path, folder_name)
 
-        if os.path.exists(full_server_path):
+        if resume:
+            ckpt = InstallCheckpoint.load(full_server_path)
+            if ckpt is None:
+                await ctx.send(f'❌ `{folder_name}` no tiene un checkpoint de instalación; no se puede reanudar.')
+                return
+            if ckpt.is_complete:
+                await ctx.send(f'ℹ️ La instalación de `{folder_name}` ya está completa.')
+                return
+        elif os.path.exists(full_server_path):
+            ckpt = InstallCheckpoint.load(full_server_path)
+            if ckpt is not None and not ckpt.is_complete:
+                await ctx.send(f'⚠️ La carpeta `{folder_name}` tiene una instalación a medias '
+                               f'(pendiente: {", ".join(ckpt.pending())}). '
+                               f'Usa `!install {server_type} {version} {base_name} --resume` para continuarla.')
+                return
             # CAMBIO: Solo mostramos folder_name
             await ctx.send(f'⚠️ La carpeta `{folder_name}` ya existe. No se ha realizado ninguna acción.')
             return
 
+        pending = next((j for j in self.jobs.active() if j.params.get('path') == full_server_path), None)
+        if pending:
+            await ctx.send(f'⚠️ Ya hay una instalación en curso para `{folder_name}` (trabajo `{pending.id}`).')
+            return
+
+        # Toda la instalación se informa editando un único mensaje
+        title = 'Reanudación' if resume else 'Instalación'
+        report = ProgressReporter(ctx, f'{title} de {base_name} ({server_type} {version})')
+        job = self.jobs.submit('install', {
+            'server_type': server_type,
+            'version': version,
+            'name': base_name,
+            'path': full_server_path,
+            'resume': resume,
+            # Para volver a informar en el mismo canal si el bot se reinicia con el trabajo en cola
+            'channel_id': getattr(getattr(ctx, 'channel', None), 'id', None),
+        })
+        report.job = job
+        self._job_contexts[job.id] = report
+        if alias_note:
+            report.line(alias_note)
+        report.line(f'🧾 En cola como trabajo `{job.id}` (posición {self.jobs.position(job)}). '
+                    f'Detalle con `!job {job.id}`.')
+        await report.start()
+
+    async def _run_install_job(self, job):
+        """Worker de la cola: ejecuta una instalación informando en su mensaje de progreso."""
+        report = self._job_contexts.pop(job.id, None)
+        p = job.params
+        if report is None:
+            # Trabajo recuperado de la cola tras reiniciar el bot: nuevo mensaje en su canal
+            channel = await self._job_channel(p.get('channel_id'))
+            if channel is None:
+                job.error = 'Sin canal de Discord asociado'
+                return False
+            title = 'Reanudación' if p.get('resume') else 'Instalación'
+            report = ProgressReporter(channel, f"{title} de {p['name']} ({p['server_type']} {p['version']})")
+            report.job = job
+            report.line(f'♻️ Trabajo `{job.id}` recuperado de la cola tras reiniciar el bot.')
+            await report.start()
         try:
-            os.makedirs(full_server_path)
+            ok = await self._install(job, report, p['server_type'], p['version'], p['name'], p['path'],
+                                     resume=p.get('resume', False))
+        except asyncio.CancelledError:
+            await report.finish(ok=False, summary=f'🛑 Instalación cancelada en la etapa `{job.stage}`. '
+                                                  + self._resume_hint(p['path']))
+            raise
+        except Exception as e:
+            await report.finish(ok=False, summary=f'❌ Error inesperado durante la instalación: {e}')
+            raise
+        await report.finish(ok=ok is not False)
+        return ok
+
+    async def _job_channel(self, channel_id):
+        if not channel_id:
+            return None
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            try:
+                channel = await self.bot.fetch_channel(channel_id)
+            except Exception as e:
+                log_exception(e, context=f'Channel {channel_id} for queued job not available')
+        return channel
+
+    async def _cancel_queued_job(self, job):
+        """Cancelado antes de salir de la cola: cierra su mensaje de progreso y olvida el contexto."""
+        report = self._job_contexts.pop(job.id, None)
+        if report is not None:
+            await report.finish(ok=False, summary='🛑 cancelado')
+
+    async def _install(self, job, report, server_type, version, base_name, full_server_path, resume=False):
+        """
+        Instalación por etapas (`INSTALL_STAGES`) con un checkpoint en la carpeta
+        del servidor tras cada una. Con `resume` se saltan las etapas ya hechas y
+        se comprueban por SHA-1 los jars descargados. Devuelve False si no pudo
+        completarse.
+        """
+        state = {
+            'type': server_type.lower(),
+            'version': version,
+            'name': base_name,
+            'path': full_server_path,
+            'folder': os.path.basename(full_server_path),
+        }
+        ckpt = InstallCheckpoint.load(full_server_path) if resume else None
+        if ckpt is not None:
+            for rel in await asyncio.to_thread(ckpt.verify_artifacts):
+                report.line(f'♻️ `{rel}` falta o no coincide con su SHA-1; se repetirá su etapa.')
+            if ckpt.done('config'):
+                self._reclaim_ports(report, ckpt, state)
+            done = [s for s in INSTALL_STAGES if ckpt.done(s)]
+            report.line(f'♻️ Reanudando instalación. Etapas ya completadas: {", ".join(done) or "ninguna"}.')
+        else:
+            ckpt = InstallCheckpoint(full_server_path)
+            ckpt.params = {'server_type': server_type, 'version': version, 'name': base_name}
+
+        runners = {
+            'layout': self._stage_layout,
+            'config': self._stage_config,
+            'download': self._stage_download,
+            'loader': self._stage_loader,
+            'first_boot': self._stage_first_boot,
+            'register': self._stage_register,
+        }
+        for stage in INSTALL_STAGES:
+            if ckpt.done(stage):
+                continue
+            started = time.monotonic()
+            try:
+                result = await runners[stage](job, report, ckpt, state)
+            except asyncio.CancelledError:
+                ckpt.fail(stage, 'cancelada')
+                raise
+            except Exception as e:
+                ckpt.fail(stage, str(e))
+                raise
+            if result is False:
+                ckpt.fail(stage, job.error)
+                report.line(self._resume_hint(full_server_path))
+                return False
+            ckpt.mark(stage, elapsed=round(time.monotonic() - started, 2), **(result or {}))
+
+        ckpt.complete()
+        report.line(f'✅ Instalación completada. Usa `!iniciar {base_name}` para encenderlo definitivamente.')
+
+    async def _stage_layout(self, job, report, ckpt, state):
+        """Carpeta del servidor y EULA aceptado."""
+        await job.enter_stage('layout')
+        try:
+            os.makedirs(state['path'], exist_ok=True)
             # CAMBIO: Mensaje más corto y seguro
-            await ctx.send(f'✅ Carpeta del servidor creada: `{folder_name}`')
+            report.line(f'✅ Carpeta del servidor creada: `{state["folder"]}`')
         except OSError as e:
-            await ctx.send(f'❌ Error al crear la carpeta: {e}')
-            return
+            report.line(f'❌ Error al crear la carpeta: {e}')
+            job.error = f'No se pudo crear la carpeta: {e}'
+            return False
 
-        # 3. Crear y aceptar el EULA automáticamente
+        # Crear y aceptar el EULA automáticamente
         try:
-            eula_path = os.path.join(full_server_path, 'eula.txt')
+            eula_path = os.path.join(state['path'], 'eula.txt')
             with open(eula_path, 'w') as f:
                 f.write('eula=true\n')
-            await ctx.send('✅ `eula.txt` creado y aceptado.')
+            report.line('✅ `eula.txt` creado y aceptado.')
         except Exception as e:
-            await ctx.send(f'❌ Error al crear `eula.txt`: {e}')
-            return # Detener si esto falla
+            report.line(f'❌ Error al crear `eula.txt`: {e}')
+            job.error = f'No se pudo crear eula.txt: {e}'
+            return False # Detener si esto falla
 
-        # 4. Crear el archivo de argumentos de RAM (para Fabric/NeoForge/Forge)
-        # Estimación de RAM por tipo
-        if server_type.lower() == 'vanilla':
-            ram = '4G'
-        else:
-            ram = '6G'
-
-        jvm_args_content = (
-            "# Configuración de JVM generada por CraftNPlay\n"
-            "# -Xms: RAM inicial asignada\n"
-            "# -Xmx: RAM máxima asignada\n"
-            f"-Xms{ram}\n"
-            f"-Xmx{ram}\n"
-        )
+    async def _stage_config(self, job, report, ckpt, state):
+        """Argumentos de la JVM, server.properties con RCON y script de inicio."""
+        await job.enter_stage('config')
+        full_server_path = state['path']
+
+        # Crear el archivo de argumentos de la JVM: heap según tipo y RAM del host, flags según perfil
+        plan = None
         try:
-            jvm_args_path = os.path.join(full_server_path, 'user_jvm_args.txt')
-            with open(jvm_args_path, 'w') as f:
-                f.write(jvm_args_content)
-            await ctx.send('✅ `user_jvm_args.txt` creado con 6GB de RAM por defecto.')
+            plan = self.memory.plan(state['type'])
+            self.memory.write(full_server_path, plan)
+            report.line(f'✅ `{JVM_ARGS_FILE}` creado: {format_mb(plan.heap_mb)} de heap, perfil `{plan.profile}`.')
+            budget = self.memory.budget_mb()
+            over = budget and self.memory.footprint_mb(plan.heap_mb) > budget
+            for note in plan.notes:
+                report.line(f'⚠️ {note}' if over else f'ℹ️ {note}')
         except Exception as e:
-            await ctx.send(f'❌ Error al crear `user_jvm_args.txt`: {e}')
-        # 4.5 Crear server.properties con RCON ACTIVADO automáticamente
+            report.line(f'❌ Error al crear `{JVM_ARGS_FILE}`: {e}')
+        # Puertos propios (juego, RCON, query) para poder tener varios servidores a la vez
+        prop_path = os.path.join(full_server_path, 'server.properties')
+        existing = server_ports({'path': full_server_path}) if os.path.exists(prop_path) else None
+        try:
+            ports = self.ports.allocate(full_server_path, prefer=existing)
+        except RuntimeError as e:
+            report.line(f'❌ {e}')
+            job.error = str(e)
+            return False
+
+        # Crear server.properties con RCON ACTIVADO automáticamente
         # Esto evita que tengas que editarlo a mano después de instalar.
         rcon_pass = os.getenv('RCON_PASSWORD', 'password_seguro_por_defecto')
-        
+
         properties_content = (
             "# Archivo generado por CraftNPlay\n"
             "enable-rcon=true\n"
-            "rcon.port=25575\n"
+            f"rcon.port={ports['rcon']}\n"
             f"rcon.password={rcon_pass}\n"
-            "server-port=25565\n"
-            f"motd=Servidor {base_name} - CraftNPlay\n"
+            f"server-port={ports['game']}\n"
+            f"query.port={ports['query']}\n"
+            f"motd=Servidor {state['name']} - CraftNPlay\n"
             "difficulty=normal\n"
         )
-        
+        port_note = f"juego {ports['game']}, RCON {ports['rcon']}, query {ports['query']}"
+
         try:
-            prop_path = os.path.join(full_server_path, 'server.properties')
             # Solo lo creamos si no existe para no sobrescribir configs de un server existente
-            if not os.path.exists(prop_path):
+            if existing is None:
                 with open(prop_path, 'w') as f:
                     f.write(properties_content)
-                await ctx.send('✅ `server.properties` creado con **RCON habilitado**.')
+                report.line(f'✅ `server.properties` creado con **RCON habilitado** ({port_note}).')
             else:
-                await ctx.send('ℹ️ `server.properties` ya existía, no se modificó (asegúrate de activar RCON manual).')
+                rewrite_properties(prop_path, self._port_properties(ports))
+                report.line(f'ℹ️ `server.properties` ya existía; solo se ajustaron los puertos ({port_note}). '
+                            'Asegúrate de activar RCON manualmente.')
         except Exception as e:
-            await ctx.send(f'⚠️ No se pudo crear server.properties: {e}')
+            report.line(f'⚠️ No se pudo crear server.properties: {e}')
 
-        # 4.6 Crear el script de inicio (run.bat)
+        # Crear los scripts de inicio (run.bat y run.sh)
         # Usamos los argumentos definidos en user_jvm_args.txt para mantenerlo limpio
-        run_bat_content = (
-            "@echo off\n"
-            "title CraftNPlay Server Console\n"
-            "java @user_jvm_args.txt -jar server.jar nogui\n"
-            # "pause\n"
-        )
-        
         try:
-            bat_path = os.path.join(full_server_path, 'run.bat')
-            with open(bat_path, 'w') as f:
-                f.write(run_bat_content)
-            await ctx.send('✅ `run.bat` creado correctamente.')
+            write_start_scripts(full_server_path)
+            report.line('✅ Scripts de inicio creados (`run.bat`, `run.sh`).')
+        except Exception as e:
+            report.line(f'⚠️ Error al crear los scripts de inicio: {e}')
+        return {'ports': ports, 'heap_mb': plan.heap_mb if plan else None, 'profile': plan.profile if plan else None}
+
+    @staticmethod
+    def _port_properties(ports):
+        return {'server-port': ports['game'], 'rcon.port': ports['rcon'], 'query.port': ports['query']}
+
+    def _reclaim_ports(self, report, ckpt, state):
+        """Al reanudar, vuelve a reservar los puertos elegidos (u otros si se ocuparon entretanto)."""
+        old = ckpt.data('config').get('ports') or server_ports({'path': state['path']})
+        try:
+            ports = self.ports.allocate(state['path'], prefer=old)
+        except RuntimeError as e:
+            report.line(f'⚠️ {e}')
+            return
+        if ports != old:
+            rewrite_properties(os.path.join(state['path'], 'server.properties'), self._port_properties(ports))
+            ckpt.stages['config'].setdefault('data', {})['ports'] = ports
+            ckpt.save()
+            report.line(f"ℹ️ Puertos reasignados: juego {ports['game']}, RCON {ports['rcon']}, query {ports['query']}.")
+
+    async def _stage_download(self, job, report, ckpt, state):
+        """Obtiene el server.jar (Vanilla, Fabric directo) o el instalador de Fabric."""
+        await job.enter_stage('metadata')
+        report.line('⬇️ Intentando descargar e instalar automáticamente los archivos del servidor...')
+        version = state['version']
+        full_server_path = state['path']
+        dest_jar = os.path.join(full_server_path, 'server.jar')
+
+        if state['type'] == 'vanilla':
+            # Descargar server.jar oficial de Mojang usando launchermeta
+            report.line('🔎 Descargando server.jar oficial (Mojang) para la versión solicitada...')
+            try:
+                if not await self.manifest.get(version):
+                    raise RuntimeError('Versión no encontrada en el manifest oficial de Mojang')
+
+                server_download = await self.manifest.server_download(version) or {}
+                server_url = server_download.get('url')
+                if not server_url:
+                    raise RuntimeError('No se encontró server.jar para esa versión (descarga no disponible)')
+
+                await job.enter_stage('download')
+                server_sha1 = server_download.get('sha1')
+                if server_sha1 and ckpt.artifacts.get('server.jar', {}).get('sha1') == server_sha1 \
+                        and await asyncio.to_thread(ckpt.artifact_ok, 'server.jar'):
+                    report.line('✅ server.jar (Vanilla) ya descargado en un intento anterior (SHA-1 verificado).')
+                elif server_sha1:
+                    method, hit = await self.artifacts.fetch(
+                        self.downloader, server_url, server_sha1, dest_jar,
+                        size=server_download.get('size'), name=f'vanilla-{version}-server.jar',
+                        progress=self._progress_callback(report, 'server.jar'), progress_interval=2.0)
+                    if hit:
+                        report.line(f'✅ server.jar (Vanilla) tomado de la caché local ({method}), sin descarga.')
+                    else:
+                        report.line('✅ server.jar (Vanilla) descargado y verificado (SHA-1) correctamente.')
+                    ckpt.record_artifact('server.jar', 'download', sha1=server_sha1)
+                else:
+                    await self.downloader.download(server_url, dest_jar,
+                                                   progress=self._progress_callback(report, 'server.jar'),
+                                                   progress_interval=2.0)
+                    report.line('✅ server.jar (Vanilla) descargado correctamente.')
+                    await asyncio.to_thread(ckpt.record_artifact, 'server.jar', 'download')
+            except Exception as e:
+                report.line(f'⚠️ No se pudo descargar el server.jar oficial automáticamente: {e}. '
+                            'También puedes mover manualmente el `server.jar` a la carpeta del servidor.')
+                job.error = f'Descarga de server.jar fallida: {e}'
+                return False
+            return {'source': 'mojang'}
+
+        if state['type'] == 'fabric':
+            # Intentar descargar el server.jar de Fabric (o su instalador, que se ejecuta en la etapa `loader`)
+            report.line('🔎 Intentando instalar Fabric para la versión solicitada...')
+            # Helper de debug: registrar en archivo (las trazas van al adjunto final, no al canal)
+            log_debug = self._debug_logger(full_server_path)
+            try:
+                log_debug(f'Starting Fabric install debug for mc_version={version}.')
+
+                # Comprobar que `java` esté disponible antes de ejecutar instaladores
+                java_ok, java_desc = await check_java()
+                if not java_ok:
+                    if java_desc is not None:
+                        report.line('⚠️ `java` no parece estar disponible o devuelve error. Instalación de Fabric necesita Java para ejecutar el instalador. Instala Java y vuelve a intentarlo.')
+                        log_debug(f'Java check failed: {java_desc}')
+                    else:
+                        report.line('⚠️ `java` no se encontró en el sistema. Instalación de Fabric requiere Java. Por favor instala Java en el host antes de usar esta función.')
+                        log_debug('Java not found in PATH')
+                    job.error = 'Java no disponible'
+                    return False
+                log_debug(f'Java detected: {java_desc}')
+
+                # Resolver (mc, loader, installer): matriz persistida o sondeo paralelo con parada temprana
+                combo = await self.fabric.resolve(version, log=log_debug)
+                await job.enter_stage('download')
+                if combo:
+                    direct_url = self.fabric.server_jar_url(version, combo.loader, combo.installer)
+                    ok, code, clen = await self._try_download(direct_url, dest_jar, log_debug)
+                    if not ok and combo.cached:
+                        # La combinación guardada ya no sirve: olvidarla y volver a sondear
+                        self.fabric.invalidate(version)
+                        combo = await self.fabric.resolve(version, log=log_debug, use_cache=False)
+                        if combo:
+                            direct_url = self.fabric.server_jar_url(version, combo.loader, combo.installer)
+                            ok, code, clen = await self._try_download(direct_url, dest_jar, log_debug)
+                    report.debug(f'Tried {direct_url} -> HTTP {code} Content-Length={clen}')
+                    if combo and ok and os.path.exists(dest_jar):
+                        origin = 'matriz de compatibilidad' if combo.cached else f'{combo.probes} sondeos'
+                        report.line(f'✅ Fabric server.jar descargado directamente (loader={combo.loader}, installer={combo.installer}; {origin}).')
+                        await asyncio.to_thread(ckpt.record_artifact, 'server.jar', 'download')
+                        return {'source': 'fabric-direct', 'loader': combo.loader, 'installer': combo.installer}
+                else:
+                    log_debug(f'No working Fabric combo found for {version} via meta endpoints')
+
+                # Fallback: descargar el instalador oficial de Fabric (se ejecuta en la etapa `loader`)
+                for inst_ver in await self.fabric.installer_versions():
+                    if await self._fetch_fabric_installer(inst_ver, ckpt, report, full_server_path, log_debug, 'download'):
+                        return {'source': 'fabric-installer', 'installer': inst_ver}
+            except Exception as e:
+                report.line(f'⚠️ No se pudo instalar Fabric automáticamente: {e}.')
+                job.error = f'Fabric: {e}'
+                return False
+            report.line('⚠️ No se pudo obtener `server.jar` automáticamente para Fabric con los loaders disponibles. Revisa `install_debug.log` en la carpeta del servidor.')
+            job.error = 'Sin server.jar ni instalador de Fabric disponibles'
+            return False
+
+        report.line('⚠️ Tipo solicitado no soportado para descarga automática (por ahora). Se creó la estructura; copia el `server.jar` manualmente.')
+        return {'source': 'manual'}
+
+    async def _fetch_fabric_installer(self, inst_ver, ckpt, report, full_server_path, log_debug, stage):
+        """Descarga (o reutiliza, si su SHA-1 cuadra) el jar del instalador de Fabric `inst_ver`."""
+        rel = f'fabric-installer-{inst_ver}.jar'
+        if await asyncio.to_thread(ckpt.artifact_ok, rel):
+            log_debug(f'Reusing verified installer JAR {rel}')
+            return True
+        maven_url = self.fabric.installer_jar_url(inst_ver)
+        installer_path = os.path.join(full_server_path, rel)
+        ok, code, clen = await self._try_download(maven_url, installer_path, log_debug)
+        report.debug(f'Tried maven {maven_url} -> HTTP {code} Content-Length={clen}')
+        if not ok or not os.path.exists(installer_path):
+            log_debug(f'Installer JAR not available at {maven_url} (installer={inst_ver})')
+            return False
+        await asyncio.to_thread(ckpt.record_artifact, rel, stage)
+        report.line(f'✅ Instalador de Fabric descargado (installer={inst_ver}).')
+        return True
+
+    async def _run_fabric_installer(self, inst_ver, job, report, ckpt, state, log_debug):
+        """Ejecuta el instalador de Fabric ya descargado; True si generó `server.jar`."""
+        full_server_path = state['path']
+        installer_path = os.path.join(full_server_path, f'fabric-installer-{inst_ver}.jar')
+        report.line(f'⚙️ Ejecutando instalador de Fabric (installer={inst_ver}, puede tardar)...')
+        # La salida del instalador se vuelca línea a línea en install_debug.log
+        job.set_progress(f'fabric-installer {inst_ver}')
+        log_debug(f'Running Fabric installer {inst_ver}')
+        result = await run_streamed([
+            'java', '-jar', installer_path, 'server', '-mcversion', state['version'], '-downloadMinecraft', '-dir', full_server_path
+        ], cwd=full_server_path, timeout=300, log_path=os.path.join(full_server_path, 'install_debug.log'))
+        log_debug(f'Installer exited with code {result.returncode} after {result.elapsed:.1f}s'
+                  + (' (timeout)' if result.timed_out else ''))
+        if result.ok and os.path.exists(os.path.join(full_server_path, 'server.jar')):
+            report.line(f'✅ Instalación de Fabric completada (installer={inst_ver}). `server.jar` generado correctamente.')
+            await asyncio.to_thread(ckpt.record_artifact, 'server.jar', 'loader')
+            # El instalador ya no hace falta para reanudar
+            ckpt.forget_artifact(f'fabric-installer-{inst_ver}.jar')
+            return True
+        reason = 'superó el tiempo límite' if result.timed_out else f'terminó (código {result.returncode})'
+        report.line(f'⚠️ El instalador de Fabric {reason} pero no generó `server.jar` (últimas líneas en el adjunto).')
+        report.debug(f'--- fabric-installer {inst_ver} (últimas líneas) ---\n{result.tail(n=40, max_chars=8000)}')
+        return False
+
+    async def _stage_loader(self, job, report, ckpt, state):
+        """Ejecuta el instalador de Fabric cuando no hubo descarga directa del server.jar."""
+        info = ckpt.data('download')
+        if info.get('source') != 'fabric-installer':
+            return {'skipped': True}
+        await job.enter_stage('loader')
+        log_debug = self._debug_logger(state['path'])
+        try:
+            if await self._run_fabric_installer(info['installer'], job, report, ckpt, state, log_debug):
+                return {'installer': info['installer']}
+            # Probar con las demás versiones del instalador
+            for inst_ver in await self.fabric.installer_versions():
+                if inst_ver == info['installer']:
+                    continue
+                if not await self._fetch_fabric_installer(inst_ver, ckpt, report, state['path'], log_debug, 'loader'):
+                    continue
+                if await self._run_fabric_installer(inst_ver, job, report, ckpt, state, log_debug):
+                    return {'installer': inst_ver}
+        except Exception as e:
+            log_debug(f'Error running Fabric installer: {e}')
+            report.line(f'⚠️ Error al ejecutar el instalador de Fabric: {e}')
+        report.line('⚠️ No se pudo obtener `server.jar` automáticamente para Fabric con los loaders disponibles. Revisa `install_debug.log` en la carpeta del servidor.')
+        job.error = 'El instalador de Fabric no generó server.jar'
+        return False
+
+    async def _stage_first_boot(self, job, report, ckpt, state):
+        """Arranca el servidor hasta que esté listo para generar `world` y lo detiene limpiamente."""
+        full_server_path = state['path']
+        server_jar = os.path.join(full_server_path, 'server.jar')
+        if not os.path.exists(server_jar):
+            report.line('⚠️ No se encontró `server.jar` en la carpeta; no se puede arrancar automáticamente.')
+            return {'skipped': True}
+
+        await job.enter_stage('first_boot')
+        # Los mismos argumentos que usarán run.bat / run.sh
+        jvm_args = [f'@{JVM_ARGS_FILE}'] if os.path.exists(os.path.join(full_server_path, JVM_ARGS_FILE)) else []
+        report.line(f'⚙️ Iniciando el servidor para generar archivos (`world`)... (máximo {self.first_boot_timeout}s)')
+        try:
+            boot = await first_boot(
+                ['java'] + jvm_args + ['-jar', 'server.jar', 'nogui'],
+                cwd=full_server_path,
+                timeout=self.first_boot_timeout,
+                log_path=os.path.join(full_server_path, 'install_debug.log'),
+            )
         except Exception as e:
-            await ctx.send(f'⚠️ Error al crear `run.bat`: {e}')
-        
-        # 5. Registrar el nuevo servidor usando el método del config manager
+            report.line(f'⚠️ No se pudo arrancar el servidor automáticamente: {e}')
+            return {'ready': False}
+        if boot.ready:
+            self._record_boot_time(state['type'], state['version'], boot.time_to_ready)
+            how = 'detenido con `stop`' if boot.stopped_cleanly else 'forzado a cerrar tras `stop`'
+            report.line(f'✅ Servidor listo en {boot.time_to_ready:.1f}s y {how}. `world` generado.')
+        elif boot.timed_out:
+            report.line(f'⚠️ El servidor no terminó de arrancar en {self.first_boot_timeout}s; se detuvo. '
+                           'Puede que el mundo no esté completo (ajusta `CNP_FIRST_BOOT_TIMEOUT`).')
+        else:
+            tail = '\n'.join(list(boot.lines)[-10:])[-1500:]
+            report.line(f'⚠️ El servidor se cerró durante el arranque (código {boot.returncode}).'
+                           + (f'\n```\n{tail}\n```' if tail else ''))
+        return {'ready': boot.ready, 'time_to_ready': boot.time_to_ready}
+
+    async def _stage_register(self, job, report, ckpt, state):
+        """Registra el servidor en servers.json (última etapa: solo se ven instalaciones completas)."""
+        await job.enter_stage('register')
+        base_name = state['name']
+        ports = ckpt.data('config').get('ports') or server_ports({'path': state['path']})
         if base_name in self.config.servers:
-            await ctx.send(f'⚠️ Ya existe una configuración para un servidor llamado `{base_name}`. Se sobrescribirá.')
-        
+            report.line(f'⚠️ Ya existe una configuración para un servidor llamado `{base_name}`. Se sobrescribirá.')
+
         self.config.add_server(
             name=base_name,
-            path=full_server_path,
-            script="run.bat", # Asumimos que el instalador creará "run.bat"
-            rcon_port=25575 # Puerto RCON por defecto
+            path=state['path'],
+            script=default_script(),  # run.bat en Windows, run.sh en Linux
+            rcon_port=ports['rcon'],
+            version=state['version'],
+            type=state['type'],
+            port=ports['game'],
+            query_port=ports['query']
         )
-        await ctx.send(f'💾 ¡Servidor `{base_name}` registrado! Ahora puedes usar `!iniciar {base_name}`.')
+        # Ya figuran en servers.json: la reserva en memoria sobra
+        self.ports.release(state['path'])
+        report.line(f'💾 ¡Servidor `{base_name}` registrado!')
+
+    def _server_type_version(self, info):
+        """Tipo y versión de un servidor registrado (de servers.json o del nombre de carpeta)."""
+        stype, version = info.get('type'), info.get('version')
+        if stype and version:
+            return stype, version
+        parts = os.path.basename(info.get('path', '')).split('_')
+        if len(parts) >= 3:
+            return stype or parts[-1].lower(), version or parts[-2]
+        return stype, version
+
+    @commands.command(name='plantilla', aliases=['template'])
+    @commands.is_owner()
+    async def template_command(self, ctx, server_name: str, template_name: str = None):
+        """Registra un servidor instalado como plantilla para `!clone`.
+        Uso: !plantilla <servidor> [nombre_plantilla]
+        """
+        info = self.config.get_server_info(server_name)
+        if not info or not os.path.isdir(info.get('path', '')):
+            await ctx.send(f'❌ No se encontró el servidor `{server_name}` o su carpeta.')
+            return
+        template_name = template_name or server_name
+        stype, version = self._server_type_version(info)
+        self.templates.add(template_name, server_name, info['path'], server_type=stype,
+                           version=version, script=info.get('script', 'run.bat'))
+        await ctx.send(f'📐 `{server_name}` registrado como plantilla `{template_name}`. '
+                       f'Usa `!clone {template_name} <nuevo_nombre>`.')
+
+    @commands.command(name='plantillas', aliases=['templates'])
+    async def templates_command(self, ctx):
+        """Lista las plantillas registradas."""
+        if not self.templates.templates:
+            await ctx.send('ℹ️ No hay plantillas. Registra una con `!plantilla <servidor>`.')
+            return
+        lines = [f"{name:<20} {t.get('type') or '?':<8} {t.get('version') or '?':<10} (de {t.get('server')})"
+                 for name, t in sorted(self.templates.templates.items())]
+        await ctx.send('```\n' + '\n'.join(lines) + '\n```')
 
-        # 6. Intentar descargar e instalar automáticamente según tipo
-        await ctx.send('⬇️ Intentando descargar e instalar automáticamente los archivos del servidor...')
+    @commands.command(name='clone', aliases=['clonar'])
+    @commands.is_owner()
+    async def clone_command(self, ctx, template_name: str, new_name: str, parent_path: str = None):
+        """Crea un servidor nuevo a partir de una plantilla, sin descargas ni primer arranque.
+        Uso: !clone <plantilla> <nuevo_nombre> [ruta_padre]
+        """
+        template = self.templates.get(template_name)
+        if not template or not os.path.isdir(template.get('path', '')):
+            await ctx.send(f'❌ No existe la plantilla `{template_name}` (o su carpeta ya no está).')
+            return
+        if new_name in self.config.servers:
+            await ctx.send(f'⚠️ Ya existe un servidor llamado `{new_name}`.')
+            return
+
+        # Copiar el mundo mientras el servidor escribe podría dejarlo inconsistente
+        manager = self.bot.get_cog('ServerManagement')
+        proc = getattr(manager, 'running_servers', {}).get(template.get('server'))
+        if proc is not None and proc.poll() is None:
+            await ctx.send(f'⚠️ El servidor plantilla `{template.get("server")}` está en marcha. Detenlo antes de clonar.')
+            return
 
+        parent_path = parent_path or os.path.dirname(template['path']) or self.default_parent
+        stype, version = template.get('type'), template.get('version')
+        folder_name = f'{new_name}_{version}_{stype}' if stype and version else new_name
+        dest = os.path.join(parent_path, folder_name)
+        if os.path.exists(dest):
+            await ctx.send(f'⚠️ La carpeta `{folder_name}` ya existe. No se ha realizado ninguna acción.')
+            return
+
+        started = time.monotonic()
         try:
-            if server_type.lower() == 'vanilla':
-                # Descargar server.jar oficial de Mojang usando launchermeta
-                await ctx.send('🔎 Descargando server.jar oficial (Mojang) para la versión solicitada...')
-                try:
-                    manifest_url = 'https://launchermeta.mojang.com/mc/game/version_manifest.json'
-                    with urllib.request.urlopen(manifest_url, timeout=10) as mf:
-                        manifest = json.load(mf)
-
-                    vinfo = next((v for v in manifest.get('versions', []) if v.get('id') == version), None)
-                    if not vinfo:
-                        raise RuntimeError('Versión no encontrada en el manifest oficial de Mojang')
-
-                    with urllib.request.urlopen(vinfo.get('url'), timeout=10) as vf:
-                        vjson = json.load(vf)
-
-                    server_download = vjson.get('downloads', {}).get('server', {})
-                    server_url = server_download.get('url')
-                    if not server_url:
-                        raise RuntimeError('No se encontró server.jar para esa versión (descarga no disponible)')
-
-                    dest_jar = os.path.join(full_server_path, 'server.jar')
-                    urllib.request.urlretrieve(server_url, dest_jar)
-                    await ctx.send('✅ server.jar (Vanilla) descargado correctamente.')
-                except Exception as e:
-                    await ctx.send(f'⚠️ No se pudo descargar el server.jar oficial automáticamente: {e}. Deberás mover manualmente el `server.jar` a la carpeta del servidor.')
-
-            elif server_type.lower() == 'fabric':
-                # Intentar descargar el instalador de Fabric y ejecutarlo
-                await ctx.send('🔎 Intentando instalar Fabric para la versión solicitada...')
-                try:
-                    # Preferir el endpoint específico por versión
-                    loaders_url = f'https://meta.fabricmc.net/v2/versions/loader/{version}'
-                    try:
-                        with urllib.request.urlopen(loaders_url, timeout=10) as r:
-                            loaders = json.load(r)
-                    except Exception:
-                        # Fallback al endpoint general
-                        with urllib.request.urlopen('https://meta.fabricmc.net/v2/versions/loader', timeout=10) as r:
-                            loaders = json.load(r)
-
-                    if not loaders:
-                        raise RuntimeError('No se encontró un loader de Fabric para esa versión.')
-
-                    # Helper de debug: registrar en archivo y enviar resumen a canal (recortado)
-                    debug_log_path = os.path.join(full_server_path, 'install_debug.log')
-                    def log_debug(msg):
-                        ts = time.strftime('%Y-%m-%d %H:%M:%S')
-                        entry = f'[{ts}] {msg}\n'
-                        try:
-                            with open(debug_log_path, 'a', encoding='utf-8') as df:
-                                df.write(entry)
-                        except Exception:
-                            pass
-
-                    async def send_debug_line(line):
-                        try:
-                            # Evitar mensajes excesivamente largos
-                            if len(line) > 1900:
-                                line = line[:1900] + '... (truncated)'
-                            await ctx.send(f'`[install-debug]` {line}')
-                        except Exception:
-                            pass
-
-                    log_debug(f'Starting Fabric install debug for mc_version={version}.')
-
-                    # Comprobar que `java` esté disponible antes de ejecutar instaladores
-                    try:
-                        java_check = subprocess.run(['java', '-version'], capture_output=True, text=True, timeout=5)
-                        if java_check.returncode != 0:
-                            await ctx.send('⚠️ `java` no parece estar disponible o devuelve error. Instalación de Fabric necesita Java para ejecutar el instalador. Instala Java y vuelve a intentarlo.')
-                            log_debug('Java check failed: non-zero returncode')
-                            return
-                    except Exception:
-                        await ctx.send('⚠️ `java` no se encontró en el sistema. Instalación de Fabric requiere Java. Por favor instala Java en el host antes de usar esta función.')
-                        log_debug('Java not found in PATH')
-                        return
-
-                    # Normalizador de versiones
-                    def _normalize_loader_version(v):
-                        # Handle common shapes returned by Fabric meta endpoints.
-                        if isinstance(v, str):
-                            return v
-                        if isinstance(v, dict):
-                            # Prefer nested 'loader' object -> 'version'
-                            loader_obj = v.get('loader')
-                            if isinstance(loader_obj, dict):
-                                ver = loader_obj.get('version')
-                                if isinstance(ver, str):
-                                    return ver
-                                maven = loader_obj.get('maven')
-                                if isinstance(maven, str):
-                                    parts = maven.split(':')
-                                    if parts:
-                                        return parts[-1]
-
-                            # Older/alternate shapes: top-level 'version' or 'maven' keys
-                            if 'version' in v and isinstance(v['version'], str):
-                                return v['version']
-                            if 'maven' in v and isinstance(v['maven'], str):
-                                parts = v['maven'].split(':')
-                                if parts:
-                                    return parts[-1]
-                            if 'id' in v and isinstance(v['id'], str):
-                                return v['id']
-                            # As a last resort, try 'name'
-                            if 'name' in v and isinstance(v['name'], str):
-                                return v['name']
-                            # If still unknown, return a compact string to avoid embedding full JSON
-                            try:
-                                return json.dumps(v, separators=(',', ':'), ensure_ascii=False)
-                            except Exception:
-                                return str(v)
-                        return str(v)
-
-                    # Priorizar combos conocidos (Option A)
-                    priority_combos = {
-                        # mc_version: list of (loader_version, installer_version) tuples
-                        '1.21.11': [('0.18.4', '1.1.0')],
-                    }
-
-                    # Función de descarga con comprobación previa (HEAD-like) y traza
-                    def try_download_stream(url, dest_path):
-                        log_debug(f'Trying download URL: {url}')
-                        req = urllib.request.Request(url, headers={'User-Agent': 'CraftNPlay/Installer'})
-                        try:
-                            with urllib.request.urlopen(req, timeout=15) as resp:
-                                code = getattr(resp, 'status', None) or getattr(resp, 'getcode', lambda: None)()
-                                headers = resp.headers if hasattr(resp, 'headers') else {}
-                                content_length = headers.get('Content-Length') or headers.get('content-length')
-                                log_debug(f'HTTP {code} for {url}; Content-Length={content_length}')
-                                if code and int(code) == 200:
-                                    # Stream to file
-                                    with open(dest_path, 'wb') as out_f:
-                                        shutil.copyfileobj(resp, out_f)
-                                    size = os.path.getsize(dest_path)
-                                    log_debug(f'Downloaded {size} bytes to {dest_path}')
-                                    return True, code, content_length
-                                else:
-                                    return False, code, content_length
-                        except urllib.error.HTTPError as he:
-                            log_debug(f'HTTPError {he.code} for {url}: {he}')
-                            return False, getattr(he, 'code', None), None
-                        except Exception as e:
-                            log_debug(f'Error downloading {url}: {e}')
-                            return False, None, None
-
-                    downloaded = False
-                    candidates = loaders if isinstance(loaders, list) else [loaders]
-
-                    # Build a map of loader_version -> installer_versions for candidates that actually match the requested mc version
-                    loader_map = {}
-                    for cand in candidates:
-                        loader_version = _normalize_loader_version(cand)
-                        loader_details = None
-                        # Try mc-specific endpoint first; if it fails (400), try loader-only endpoint
-                        urls_to_try = [
-                            f'https://meta.fabricmc.net/v2/versions/loader/{version}/{loader_version}',
-                            f'https://meta.fabricmc.net/v2/versions/loader/{loader_version}',
-                        ]
-                        for loader_detail_url in urls_to_try:
-                            try:
-                                log_debug(f'Fetching loader details from {loader_detail_url}')
-                                req = urllib.request.Request(loader_detail_url, headers={'User-Agent': 'CraftNPlay/Installer'})
-                                with urllib.request.urlopen(req, timeout=10) as rd:
-                                    loader_details = json.load(rd)
-                                    log_debug(f'Fetched loader details from {loader_detail_url} (len={len(str(loader_details))})')
-                                    break
-                            except urllib.error.HTTPError as he:
-                                log_debug(f'HTTPError {he.code} for {loader_detail_url}: {he}')
-                                # If 400, continue to next url; otherwise also continue but log
-                                continue
-                            except Exception as e:
-                                log_debug(f'Could not fetch loader details for {loader_version} from {loader_detail_url}: {e}')
-                                continue
-
-                        installer_versions = []
-                        if isinstance(loader_details, list) and loader_details:
-                            for it in loader_details:
-                                if isinstance(it, dict) and it.get('version'):
-                                    installer_versions.append(it.get('version'))
-                                elif isinstance(it, str):
-                                    installer_versions.append(it)
-                        if installer_versions:
-                            loader_map[loader_version] = installer_versions
-                            log_debug(f'Loader {loader_version} has installers: {installer_versions}')
-
-                    # First, try explicit priority combos if the mc version matches
-                    if version in priority_combos:
-                        for loader_v, inst_v in priority_combos[version]:
-                            direct_url = f'https://meta.fabricmc.net/v2/versions/loader/{version}/{loader_v}/{inst_v}/server/jar'
-                            dest_jar = os.path.join(full_server_path, 'server.jar')
-                            ok, code, clen = try_download_stream(direct_url, dest_jar)
-                            await send_debug_line(f'Tried priority URL {direct_url} -> HTTP {code} Content-Length={clen}')
-                            if ok and os.path.exists(dest_jar):
-                                await ctx.send(f'✅ Fabric server.jar descargado desde URL prioritaria (loader={loader_v}, installer={inst_v}).')
-                                downloaded = True
-                                break
-
-                    # If we have loader_map entries, try direct endpoints for those loaders only
-                    if not downloaded and loader_map:
-                        for loader_version, installer_versions in loader_map.items():
-                            for inst_ver in installer_versions:
-                                direct_url = f'https://meta.fabricmc.net/v2/versions/loader/{version}/{loader_version}/{inst_ver}/server/jar'
-                                dest_jar = os.path.join(full_server_path, 'server.jar')
-                                ok, code, clen = try_download_stream(direct_url, dest_jar)
-                                await send_debug_line(f'Tried {direct_url} -> HTTP {code} Content-Length={clen}')
-                                if ok and os.path.exists(dest_jar):
-                                    await ctx.send(f'✅ Fabric server.jar descargado directamente (loader={loader_version}, installer={inst_ver}).')
-                                    downloaded = True
-                                    break
-                            if downloaded:
-                                break
-
-                    # Fallback: only try installer JARs for loaders that matched (loader_map)
-                    if not downloaded and loader_map:
-                        for loader_version in loader_map.keys():
-                            try:
-                                maven_url = f'https://maven.fabricmc.net/net/fabricmc/fabric-installer/{loader_version}/fabric-installer-{loader_version}.jar'
-                                installer_path = os.path.join(full_server_path, f'fabric-installer-{loader_version}.jar')
-                                ok, code, clen = try_download_stream(maven_url, installer_path)
-                                await send_debug_line(f'Tried maven {maven_url} -> HTTP {code} Content-Length={clen}')
-                                if not ok or not os.path.exists(installer_path):
-                                    log_debug(f'Installer JAR not available at {maven_url} (loader={loader_version})')
-                                    continue
-                                await ctx.send(f'✅ Instalador de Fabric descargado (loader={loader_version}). Ejecutando instalador (puede tardar)...')
-                                proc = subprocess.run([
-                                    'java', '-jar', installer_path, 'server', '-mcversion', version, '-downloadMinecraft', '-dir', full_server_path
-                                ], check=False, capture_output=True, text=True, timeout=300)
-                                created = os.path.exists(os.path.join(full_server_path, 'server.jar'))
-                                stdout = (proc.stdout or '').strip()[:4000]
-                                stderr = (proc.stderr or '').strip()[:4000]
-                                log_debug(f'Installer stdout: {stdout[:1000]}')
-                                log_debug(f'Installer stderr: {stderr[:1000]}')
-                                if created:
-                                    await ctx.send(f'✅ Instalación de Fabric completada (loader={loader_version}). `server.jar` generado correctamente.')
-                                    downloaded = True
-                                    break
-                                else:
-                                    await ctx.send('⚠️ El instalador de Fabric terminó pero no generó `server.jar`. Resumen de salida:')
-                                    if stdout:
-                                        await ctx.send(f'```STDOUT:\n{stdout}```')
-                                    if stderr:
-                                        await ctx.send(f'```STDERR:\n{stderr}```')
-                            except Exception as e:
-                                log_debug(f'Error running installer for loader={loader_version}: {e}')
-                                continue
-                    if not downloaded:
-                        await ctx.send('⚠️ No se pudo obtener `server.jar` automáticamente para Fabric con los loaders disponibles. Revisa `install_debug.log` en la carpeta del servidor.')
-                except Exception as e:
-                    await ctx.send(f'⚠️ No se pudo instalar Fabric automáticamente: {e}.')
+            stats = await asyncio.to_thread(clone_tree, template['path'], dest)
+        except Exception as e:
+            await ctx.send(f'❌ Error al clonar la plantilla: {e}')
+            return
 
+        # El clon necesita puertos propios para poder convivir con la plantilla
+        try:
+            ports = self.ports.allocate(dest)
+        except RuntimeError as e:
+            await ctx.send(f'⚠️ Clon creado en `{folder_name}` pero sin registrar: {e}')
+            return
+        prop_path = os.path.join(dest, 'server.properties')
+        updates = {'motd': f'Servidor {new_name} - CraftNPlay', **self._port_properties(ports)}
+        rcon_pass = os.getenv('RCON_PASSWORD')
+        if rcon_pass:
+            updates['rcon.password'] = rcon_pass
+        rewrite_properties(prop_path, updates)
+
+        self.config.add_server(
+            name=new_name,
+            path=dest,
+            script=template.get('script', 'run.bat'),
+            rcon_port=ports['rcon'],
+            version=version,
+            type=stype,
+            port=ports['game'],
+            query_port=ports['query']
+        )
+        self.ports.release(dest)
+        took = time.monotonic() - started
+        methods = ', '.join(f'{n} {m}' for m, n in stats['methods'].items()) or 'ninguno'
+        await ctx.send(
+            f'🧬 `{new_name}` clonado de `{template_name}` en {took:.2f}s '
+            f'({stats["linked"]} ficheros enlazados: {methods}; {stats["copied"]} copiados, '
+            f'{format_bytes(stats["bytes_copied"])}; puerto {ports["game"]}, RCON {ports["rcon"]}). Usa `!iniciar {new_name}`.'
+        )
+
+    @commands.command(name='jobs', aliases=['trabajos'])
+    async def jobs_command(self, ctx):
+        """Lista los trabajos de instalación activos y los más recientes."""
+        jobs = self.jobs.recent(10)
+        if not jobs:
+            await ctx.send('ℹ️ No hay trabajos de instalación registrados.')
+            return
+        lines = []
+        for j in jobs:
+            where = j.stage or '-'
+            extra = f' #{self.jobs.position(j)}' if j.status == 'queued' else ''
+            lines.append(f"{j.id:<5} {j.status:<11}{extra:<4} {where:<10} {j.elapsed():6.0f}s  "
+                         f"{j.params.get('name', '')} ({j.params.get('server_type', '')} {j.params.get('version', '')})")
+        await ctx.send('```\n' + '\n'.join(lines) + '\n```')
+
+    @commands.command(name='job')
+    async def job_command(self, ctx, job_id: str, action: str = None):
+        """Muestra el detalle de un trabajo; `!job <id> cancelar` lo cancela."""
+        job = self.jobs.get(job_id)
+        if not job:
+            await ctx.send(f'❌ No existe el trabajo `{job_id}`.')
+            return
+
+        if action:
+            if action.lower() not in ('cancelar', 'cancel'):
+                await ctx.send('❌ Acción no válida. Uso: `!job <id> [cancelar]`')
+                return
+            if not await self.bot.is_owner(ctx.author):
+                await ctx.send('❌ Solo el dueño del bot puede cancelar instalaciones.')
+                return
+            if self.jobs.cancel(job.id):
+                await ctx.send(f'🛑 Cancelación solicitada para `{job.id}`.')
             else:
-                await ctx.send('⚠️ Tipo solicitado no soportado para descarga automática (por ahora). Se creó la estructura; copia el `server.jar` manualmente.')
+                await ctx.send(f'⚠️ `{job.id}` ya había terminado ({job.status}).')
+            return
 
+        p = job.params
+        lines = [
+            f"**{job.id}** · {p.get('name')} ({p.get('server_type')} {p.get('version')})",
+            f'Estado: `{job.status}`' + (f' (posición {self.jobs.position(job)})' if job.status == 'queued' else ''),
+            f'Tiempo total: {job.elapsed():.1f}s',
+        ]
+        for name in job.stages:
+            took = job.stage_elapsed(name)
+            marker = '▶️' if name == job.stage and not job.finished_state else '✅'
+            lines.append(f'{marker} {name}: {took:.1f}s')
+        if job.progress:
+            lines.append(f'Progreso: {job.progress}')
+        if job.error:
+            lines.append(f'Error: {job.error}')
+        await ctx.send('\n'.join(lines))
+
+    @commands.command(name='cache')
+    async def cache_command(self, ctx):
+        """Muestra el estado de la caché de artefactos (jars) y su tasa de aciertos."""
+        st = self.artifacts.stats()
+        lookups = st['hits'] + st['misses']
+        await ctx.send(
+            '📦 **Caché de artefactos**\n'
+            f'- Objetos: {st["entries"]}\n'
+            f'- Disco usado: {format_bytes(st["bytes"])} / {format_bytes(st["max_bytes"])}\n'
+            f'- Aciertos: {st["hits"]}/{lookups} ({st["hit_rate"] * 100:.0f}%)'
+        )
+
+    @commands.command(name='versiones', aliases=['versions'])
+    async def versions_command(self, ctx, prefix: str = '', version_type: str = 'release'):
+        """Busca versiones de Minecraft por prefijo.
+
+        Uso: !versiones [prefijo] [release|snapshot|todas]
+        Ejemplo: `!versiones 1.20` o `!versiones latest`.
+        """
+        try:
+            await self.manifest.ensure_fresh()
         except Exception as e:
-            await ctx.send(f'⚠️ Error durante la instalación automática: {e}')
+            await ctx.send(f'❌ No se pudo cargar el manifest de versiones: {e}')
+            return
 
-        # 7. Intentar arrancar brevemente el servidor para generar world (si hay server.jar)
-        server_jar = os.path.join(full_server_path, 'server.jar')
-        if os.path.exists(server_jar):
-            await ctx.send('⚙️ Iniciando el servidor brevemente para generar archivos (`world`)... (El bot esperará 60s)')
-            try:
-                # Usamos CREATE_NEW_CONSOLE para que sea un proceso independiente
-                proc = subprocess.Popen(
-                    ['java', f'-Xms{ram}', f'-Xmx{ram}', '-jar', 'server.jar', 'nogui'],
-                    cwd=full_server_path,
-                    creationflags=subprocess.CREATE_NEW_CONSOLE
-                )
-                
-                # Esperamos de forma asíncrona (el bot sigue vivo para otros comandos)
-                await asyncio.sleep(60) 
-
-                # CIERRE ROBUSTO Y SILENCIOSO
-                # 1. Intentamos matar el objeto proceso de Python
-                if proc.poll() is None: # Solo si sigue corriendo
-                    proc.kill()
-                    try:
-                        proc.wait(timeout=5) # Esperar a que muera para evitar zombies
-                    except subprocess.TimeoutExpired:
-                        pass
-
-                # 2. Aseguramos limpieza con taskkill (Solo si sigue vivo)
-                # Usamos subprocess.run en vez de os.system para redirigir la salida a la basura
-                # y evitar mensajes de error rojos en tu consola.
-                if proc.poll() is None:
-                    subprocess.run(
-                        ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
-                        stdout=subprocess.DEVNULL, # Silenciar éxito
-                        stderr=subprocess.DEVNULL  # Silenciar error "no running instance"
-                    )
-                
-                await ctx.send('✅ Proceso de arranque breve completado. Revisa la carpeta si se creó `world`.')
-            except Exception as e:
-                await ctx.send(f'⚠️ No se pudo arrancar el servidor automáticamente: {e}')
-        else:
-            await ctx.send('⚠️ No se encontró `server.jar` en la carpeta; no se puede arrancar automáticamente.')
+        if prefix.lower() in LATEST_ALIASES:
+            resolved = self.manifest.resolve_alias(prefix)
+            entry = self.manifest.by_id.get(resolved)
+            date = (entry or {}).get('releaseTime', '')[:10]
+            await ctx.send(f'🆕 `{prefix}` → `{resolved}` ({date})')
+            return
 
-        await ctx.send('✅ Instalación completada. Usa `!iniciar` para encenderlo definitivamente.')
+        vtype = None if version_type.lower() in ('todas', 'all') else version_type.lower()
+        matches = self.manifest.search(prefix, vtype=vtype, limit=25)
+        if not matches:
+            await ctx.send(f'❌ No hay versiones `{version_type}` que empiecen por `{prefix}`.')
+            return
+        lines = [f"{e['id'].ljust(20)} {e.get('type', ''):<9} {e.get('releaseTime', '')[:10]}" for e in matches]
+        latest = self.manifest.latest
+        await ctx.send(
+            f"Última release: `{latest.get('release', '?')}` · última snapshot: `{latest.get('snapshot', '?')}`\n"
+            '```\n' + '\n'.join(lines) + '\n```'
+        )
 
     @install_server.error
     async def install_error(self, ctx, error):
@@ -450,7 +881,7 @@ class Installer(commands.Cog):
         if isinstance(error, commands.NotOwner):
             await ctx.send('❌ Este comando solo puede ser usado por el dueño del bot.')
         elif isinstance(error, commands.MissingRequiredArgument):
-            await ctx.send(f'❌ Faltan argumentos. Uso correcto: `!install <tipo> <version> <nombre> <ruta_padre>`')
+            await ctx.send('❌ Faltan argumentos. Uso correcto: `!install <tipo> <version> <nombre> [ruta_padre] [--resume]`')
         else:
             await ctx.send(f'Ocurrió un error inesperado: {error}')
 
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import asyncio
+import datetime
+from discord.ext import commands
+from utils.errors import log_exception
+from utils.log_index import LogIndexes, parse_period
+
+ADMIN_ROLE = "Admin"
+
+# Vistas de !actividad y los tipos de evento que usa cada una
+VIEWS = {
+    'resumen': None,
+    'jugadores': ('join', 'leave'),
+    'lag': ('lag',),
+    'chat': ('chat',),
+    'muertes': ('death',),
+    'caidas': ('crash', 'start', 'stop'),
+}
+VIEW_ALIASES = {'players': 'jugadores', 'quien': 'jugadores', 'deaths': 'muertes', 'crashes': 'caidas',
+                'caídas': 'caidas', 'summary': 'resumen'}
+
+
+def _clock(ts):
+    return datetime.datetime.fromtimestamp(ts).strftime('%d/%m %H:%M:%S')
+
+
+def _duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f'{seconds // 3600}h {seconds // 60 % 60:02d}m'
+    return f'{seconds // 60}m {seconds % 60:02d}s'
+
+
+class ServerLogs(commands.Cog):
+    """
+    Actividad de los servidores a partir de su `logs/latest.log`: quién se
+    conectó, chat, muertes, avisos de lag ("Can't keep up!") y caídas.
+
+    Un índice por servidor (`utils.log_index`) sigue el log de forma
+    incremental; mientras un servidor está en marcha se actualiza cada
+    `CNP_LOG_INDEX_INTERVAL` segundos y, en cualquier caso, justo antes de
+    cada consulta.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.config = getattr(bot, "config_manager", None)
+        self.indexes = getattr(bot, "log_indexes", None) or LogIndexes(self.config)
+        self.interval = float(os.getenv('CNP_LOG_INDEX_INTERVAL', 10))
+        self._task = None
+
+    async def cog_load(self):
+        if self.interval > 0:
+            self._task = asyncio.ensure_future(self._follow_loop())
+
+    async def cog_unload(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def load_server_data(self):
+        """Carga la base de datos de servidores desde servers.json."""
+        if self.config:
+            return self.config.servers
+        try:
+            with open('servers.json', 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _running(self):
+        manager = self.bot.get_cog('ServerManagement')
+        running = getattr(manager, 'running_servers', {})
+        return [name for name, proc in running.items() if proc.poll() is None]
+
+    async def _follow_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            servers = self.load_server_data()
+            running = self._running()
+            for name in running:
+                await self._refresh(name, servers.get(name, {}), running)
+            for name, index in self.indexes.items():
+                if name not in running and index.online:
+                    await self._refresh(name, servers.get(name, {}), running)
+
+    async def _refresh(self, name, server_info, running):
+        """Lee lo nuevo del log; si el servidor ya no está en marcha, cierra las sesiones que queden abiertas."""
+        index = self.indexes.get(name, server_info)
+        if index is None:
+            return None
+        try:
+            await asyncio.to_thread(index.update)
+            if name not in running:
+                await asyncio.to_thread(index.server_stopped)
+        except Exception as e:
+            log_exception(e, context=f'Log index update failed for {name}')
+            return False
+        return index
+
+    def _default_server(self, servers):
+        if self.config and getattr(self.config, 'default_server', None) in servers:
+            return self.config.default_server
+        if len(servers) == 1:
+            return next(iter(servers))
+        return None
+
+    @commands.command(name='actividad', aliases=['activity'])
+    @commands.has_role(ADMIN_ROLE)
+    async def actividad_command(self, ctx, *args):
+        """Actividad de un servidor según sus logs.
+
+        Uso: `!actividad [servidor] [resumen|jugadores|lag|chat|muertes|caidas] [periodo]`
+        Periodo: `30m`, `6h`, `2d`, `hoy`, `ayer` o `anoche` (por defecto, las últimas 24h).
+        """
+        servers = self.load_server_data()
+        server_name, view, period = None, 'resumen', None
+        for arg in args:
+            lowered = VIEW_ALIASES.get(arg.lower(), arg.lower())
+            if arg in servers and server_name is None:
+                server_name = arg
+            elif lowered in VIEWS:
+                view = lowered
+            elif period is None and parse_period(arg):
+                period = parse_period(arg)
+            else:
+                await ctx.send(f'❌ No entiendo `{arg}`. Uso: `!actividad [servidor] '
+                               f'[{"|".join(VIEWS)}] [30m|6h|2d|hoy|ayer|anoche]`.')
+                return
+        server_name = server_name or self._default_server(servers)
+        if not server_name:
+            await ctx.send('❌ Debes especificar el nombre del servidor.')
+            return
+        since, until, label = period or parse_period('24h')
+
+        started = time.perf_counter()
+        index = await self._refresh(server_name, servers.get(server_name, {}), self._running())
+        if index is None:
+            await ctx.send(f'❌ `{server_name}` no tiene carpeta registrada.')
+            return
+        if index is False:
+            await ctx.send('⚠️ No se pudieron leer los logs nuevos; se usa el índice guardado.')
+            index = self.indexes.get(server_name, servers.get(server_name, {}))
+        if view == 'jugadores':
+            lines = self._players_view(index, since, until)
+        elif view == 'resumen':
+            lines = self._summary_view(index, since, until)
+        else:
+            lines = self._events_view(index, VIEWS[view], since, until)
+        elapsed = (time.perf_counter() - started) * 1000
+
+        body = '\n'.join(lines) if lines else 'Sin actividad en el periodo.'
+        if len(body) > 1800:
+            body = '…\n' + body[-1800:].split('\n', 1)[-1]
+        await ctx.send(f'📜 `{server_name}` · {view} · {label}\n```\n{body}\n```'
+                       f'⏱️ Índice actualizado y consultado en {elapsed:.0f} ms.')
+
+    @staticmethod
+    def _players_view(index, since, until):
+        sessions = index.sessions(since, until)
+        online = index.online
+        rows = sorted(((sum(b - a for a, b in spans), player, len(spans)) for player, spans in sessions.items()),
+                      reverse=True)
+        if not rows:
+            return []
+        width = min(20, max(len('Jugador'), *(len(p) for _, p, _ in rows)))
+        lines = [f"{'Jugador'.ljust(width)} | Tiempo    | Sesiones | Última", '-' * (width + 44)]
+        for total, player, count in rows:
+            last = max(b for _, b in sessions[player])
+            seen = 'conectado' if player in online else _clock(last)
+            lines.append(f'{player[:width].ljust(width)} | {_duration(total):<9} | {count:>8} | {seen}')
+        return lines
+
+    @staticmethod
+    def _summary_view(index, since, until):
+        events = index.events(since=since, until=until)
+        sessions = index.sessions(since, until)
+        lags = [e for e in events if e[1] == 'lag']
+        lines = [f'Jugadores distintos: {len(sessions)}'
+                 + (f' ({", ".join(sorted(sessions)[:15])})' if sessions else ''),
+                 f'Conectados ahora:    {", ".join(sorted(index.online)) or "nadie"}']
+        if lags:
+            worst = max(lags, key=lambda e: e[3][0])
+            lines.append(f'Avisos de lag:       {len(lags)} (peor: {worst[3][0]} ms / {worst[3][1]} ticks '
+                         f'el {_clock(worst[0])})')
+        else:
+            lines.append('Avisos de lag:       0')
+        counts = {kind: sum(1 for e in events if e[1] == kind) for kind in ('chat', 'death', 'crash', 'start')}
+        lines.append(f"Mensajes de chat:    {counts['chat']}")
+        lines.append(f"Muertes:             {counts['death']}")
+        lines.append(f"Arranques / caídas:  {counts['start']} / {counts['crash']}")
+        return lines
+
+    @staticmethod
+    def _events_view(index, kinds, since, until):
+        lines = []
+        for ts, kind, player, detail in index.events(kinds=kinds, since=since, until=until):
+            if kind == 'lag':
+                lines.append(f'{_clock(ts)}  {detail[0]:>6} ms  {detail[1]:>4} ticks')
+            elif kind == 'chat':
+                lines.append(f'{_clock(ts)}  <{player}> {detail}')
+            elif kind == 'death':
+                lines.append(f'{_clock(ts)}  {player} {detail}')
+            elif kind == 'crash':
+                lines.append(f'{_clock(ts)}  💥 {detail}')
+            else:
+                lines.append(f'{_clock(ts)}  {"▶ arranque" if kind == "start" else "■ parada"}')
+        return lines
+
+    async def cog_command_error(self, ctx, error):
+        if isinstance(error, commands.MissingRole):
+            await ctx.send(f"❌ No tienes el rol `{ADMIN_ROLE}` para usar este comando.")
+        else:
+            log_exception(error, context=f'Unhandled error in server_logs command: {ctx.command.name if hasattr(ctx, "command") else "?"}')
+            await ctx.send('❌ Ocurrió un error inesperado. Se ha registrado en el log del bot.')
+
+
+async def setup(bot):
+    await bot.add_cog(ServerLogs(bot))
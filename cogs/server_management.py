@@ -1,16 +1,28 @@
+import io
+import re
+import discord
 from discord.ext import commands
 import os
 import json
 import asyncio
-import subprocess
-from mcrcon import MCRcon
-import socket
+import time
 from utils.errors import log_exception
+from utils.ports import PortAllocator, PORT_KINDS, PORT_LABELS, server_ports
+from utils.templates import rewrite_properties
+from utils.memory import MemoryPlanner, PROFILES, host_memory, host_cpus, read_heap_mb, parse_size_mb, format_mb
+from utils.process_backend import get_backend
+from utils.rcon import RconPool, RconError, parse_script, broadcast
+from utils.supervisor import Supervisor
+from utils.shutdown import log_offset, wait_for_exit, wait_ports_free
+from utils.process_registry import ProcessRegistry, REGISTRY_FILE
+from utils.console import ConsoleBuffer, ConsoleMirror, read_log_tail, code_block
+from utils.tunnel import PlayitTunnel
+from utils.hibernation import Hibernator, HIBERNATION_FILE
+from utils.resources import ResourceSampler, MetricsServer, TUNNEL_TARGET
+from utils.config import Config
 
 # --- CONFIGURACIÓN ---
 ADMIN_ROLE = "Admin" 
-# Ruta a Playit (deberías moverla a config.py eventualmente)
-PLAYIT_PATH = 'C:/Program Files/playit_gg/bin/playit.exe' 
 
 class ServerManagement(commands.Cog):
     """
@@ -19,9 +31,149 @@ class ServerManagement(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.running_servers = {}
-        self.playit_process = None  # Añadimos el tracker para Playit
         self.rcon_password = os.getenv('RCON_PASSWORD')
         self.config = getattr(bot, "config_manager", None)
+        # Sesiones RCON persistentes compartidas con el resto de cogs
+        self.rcon = getattr(bot, "rcon_pool", None) or RconPool(self.rcon_password)
+        # Límites de !rcon: segundos por comando y por servidor, y líneas por guion
+        self.rcon_command_timeout = float(os.getenv('CNP_RCON_COMMAND_TIMEOUT', 10))
+        self.rcon_script_timeout = float(os.getenv('CNP_RCON_SCRIPT_TIMEOUT', 60))
+        self.rcon_script_max = int(os.getenv('CNP_RCON_SCRIPT_MAX', 50))
+        self.ports = getattr(bot, "port_allocator", None) or PortAllocator(self.config)
+        # Si un puerto está ocupado al arrancar: buscar otro (1) o negarse (0)
+        self.reassign_ports = os.getenv('CNP_PORT_REASSIGN', '1') != '0'
+        # Presupuesto de RAM del host: al arrancar se niega (refuse), se espera (queue) o no se comprueba (off)
+        self.memory = getattr(bot, "memory_planner", None) or MemoryPlanner(self.config)
+        self.admission_mode = os.getenv('CNP_MEMORY_ADMISSION', 'refuse').lower()
+        self.admission_timeout = int(os.getenv('CNP_MEMORY_QUEUE_TIMEOUT', 600))
+        self._admission_lock = asyncio.Lock()
+        # Se notifica cuando se libera memoria (un servidor se detiene, una reserva se suelta)
+        self._memory_changed = asyncio.Condition(self._admission_lock)
+        # Heap reservado por los arranques admitidos que aún no están en running_servers
+        self._reserved_heaps = {}
+        # Arranques esperando memoria en modo queue, por orden de llegada: [(servidor, heap MB)]
+        self._memory_waiters = []
+        # Un arranque a la vez por servidor: dos JVM sobre el mismo mundo lo corrompen
+        self._start_locks = {}
+        # Arranque en grupo de procesos propio y cierre escalonado (posix o windows)
+        self.backend = get_backend()
+        self.force_grace = int(os.getenv('CNP_FORCE_GRACE', 10))
+        # Apagado: plazo total, plazo de `save-all flush` y margen tras ver "All dimensions are saved"
+        self.stop_timeout = float(os.getenv('CNP_STOP_TIMEOUT', 60))
+        self.save_timeout = float(os.getenv('CNP_SAVE_TIMEOUT', 30))
+        self.saved_grace = float(os.getenv('CNP_SAVED_GRACE', 10))
+        self.stop_all_deadline = float(os.getenv('CNP_STOP_ALL_DEADLINE', 120))
+        # Cómo terminó la última parada de cada servidor: 'safe' o 'forced'
+        self.stop_outcomes = {}
+        # Vigilancia de caídas/cuelgues y reinicio automático; las alertas van a
+        # CNP_ALERT_CHANNEL_ID o, si no está, al canal desde el que se inició el servidor
+        alert_channel = os.getenv('CNP_ALERT_CHANNEL_ID')
+        self.alert_channel_id = int(alert_channel) if alert_channel else None
+        self._start_channels = {}
+        self.supervisor = Supervisor(self, self.rcon, self._alert)
+        # PID + instante de creación de cada proceso lanzado, para reengancharse tras reiniciar el bot
+        self.registry = ProcessRegistry(os.getenv('CNP_PROCESS_REGISTRY', REGISTRY_FILE))
+        # Agente de Playit.gg compartido: arranca con el primer servidor y se cierra con el último
+        playit_path = getattr(self.config, 'playit_path', None) or os.getenv('PLAYIT_PATH') or Config.default_playit_path()
+        playit_args = getattr(self.config, 'playit_args', None) or os.getenv('CNP_PLAYIT_ARGS', '').split()
+        self.tunnel = PlayitTunnel(playit_path, playit_args, backend=self.backend, registry=self.registry,
+                                   notify=self._tunnel_alert)
+        # Consola capturada: últimas CNP_CONSOLE_LINES líneas por servidor (se conservan tras una
+        # caída) y espejo opcional en Discord, automático en CNP_CONSOLE_CHANNEL_ID si está definido
+        self.console_capture = os.getenv('CNP_CONSOLE_CAPTURE', '1') != '0'
+        self.console_lines = int(os.getenv('CNP_CONSOLE_LINES', 1000))
+        self.console_line_max = int(os.getenv('CNP_CONSOLE_LINE_MAX', 1024))
+        self.mirror_interval = float(os.getenv('CNP_CONSOLE_MIRROR_INTERVAL', 3))
+        console_channel = os.getenv('CNP_CONSOLE_CHANNEL_ID')
+        self.console_channel_id = int(console_channel) if console_channel else None
+        self.consoles = {}
+        self.mirrors = {}
+        # Servidores vacíos durante `hibernate_minutes` (o CNP_HIBERNATE_MINUTES): se detienen y un
+        # respondedor ligero ocupa su puerto hasta que alguien intenta entrar
+        self.hibernator = Hibernator(self, self._alert, os.getenv('CNP_HIBERNATION_FILE', HIBERNATION_FILE))
+        # Uso de recursos de cada árbol de procesos; con CNP_METRICS_PORT se exporta para Prometheus
+        self.resources = getattr(bot, "resource_sampler", None) or ResourceSampler()
+        metrics_port = os.getenv('CNP_METRICS_PORT')
+        self.metrics = MetricsServer(self.resources, os.getenv('CNP_METRICS_BIND', '127.0.0.1'),
+                                     int(metrics_port)) if metrics_port else None
+
+    async def cog_load(self):
+        self._reattach()
+        self.supervisor.start()
+        await self.hibernator.start()
+        self.resources.start(self._sampled_processes)
+        if self.metrics is not None:
+            try:
+                await self.metrics.start()
+            except OSError as e:
+                log_exception(e, context=f'Could not open metrics endpoint on port {self.metrics.port}')
+
+    def _reattach(self):
+        """Recupera los servidores (y Playit) que siguen vivos de una ejecución anterior del bot."""
+        live, playit, stale = self.registry.reattach()
+        servers = self.load_server_data()
+        for name, process in live.items():
+            if name not in servers:
+                # Servidor borrado de servers.json mientras el bot estaba parado: se deja, pero sin gestionarlo
+                self.registry.remove(name)
+                continue
+            self.running_servers[name] = process
+            self.supervisor.watch(name, process)
+            print(f'  ↺ Reenganchado a `{name}` (PID {process.pid}).')
+            if self.tunnel.enabled:
+                self.tunnel.refs.add(name)
+        if playit is not None:
+            self.tunnel.adopt(playit)
+        for name in stale:
+            print(f'  ✗ `{name}` ya no está en marcha; eliminado del registro de procesos.')
+
+    def _sampled_processes(self):
+        """{nombre: PID} de lo que mide el muestreo de recursos: servidores en marcha y el agente de Playit."""
+        targets = {name: proc.pid for name, proc in self.running_servers.items() if proc.poll() is None}
+        if self.tunnel.running:
+            targets[TUNNEL_TARGET] = self.tunnel.process.pid
+        return targets
+
+    async def cog_unload(self):
+        await self.supervisor.stop()
+        await self.hibernator.stop()
+        await self.resources.stop()
+        if self.metrics is not None:
+            await self.metrics.close()
+        for mirror in self.mirrors.values():
+            await mirror.stop()
+        await self.tunnel.close()
+
+    async def _alert(self, server_name, text):
+        """Envía una alerta del supervisor al canal configurado (o al de arranque del servidor)."""
+        channel = None
+        if self.alert_channel_id:
+            channel = self.bot.get_channel(self.alert_channel_id)
+            if channel is None:
+                try:
+                    channel = await self.bot.fetch_channel(self.alert_channel_id)
+                except Exception as e:
+                    log_exception(e, context=f'Alert channel {self.alert_channel_id} not available')
+        channel = channel or self._start_channels.get(server_name)
+        if channel is None:
+            log_exception(RuntimeError(text), context=f'Supervisor alert for {server_name} (no channel)')
+            return
+        try:
+            await channel.send(text)
+        except Exception as e:
+            log_exception(e, context=f'Could not send supervisor alert for {server_name}')
+
+    async def _tunnel_alert(self, text):
+        """Avisos del túnel: al canal de alertas o al de arranque de alguno de los servidores que lo usan."""
+        await self._alert(next(iter(sorted(self.tunnel.refs)), 'playit'), text)
+
+    async def _announce_tunnel(self, ctx):
+        """Avisa cuando el túnel recién lanzado conecta, sin retrasar el arranque del servidor."""
+        if await self.tunnel.wait_ready(self.tunnel.ready_timeout):
+            await ctx.send(f'✅ Túnel de Playit.gg conectado ({self.tunnel.ready_after:.1f}s).')
+        elif self.tunnel.running:
+            await ctx.send(f'⚠️ Playit.gg sigue sin confirmar la conexión tras {self.tunnel.ready_timeout:.0f}s; '
+                           'revisa `!tunel`.')
 
     def load_server_data(self):
         """Carga la base de datos de servidores desde servers.json."""
@@ -63,8 +215,190 @@ class ServerManagement(commands.Cog):
 
     # --- LÓGICA INTERNA (NO SON COMANDOS) ---
 
+    def _console(self, server_name):
+        """Buffer de consola del servidor (uno por nombre, reutilizado entre arranques)."""
+        buffer = self.consoles.get(server_name)
+        if buffer is None:
+            buffer = ConsoleBuffer(self.console_lines, self.console_line_max)
+            self.consoles[server_name] = buffer
+        return buffer
+
+    async def _start_mirror(self, server_name, channel):
+        current = self.mirrors.get(server_name)
+        if current is not None:
+            await current.stop()
+        mirror = ConsoleMirror(server_name, self._console(server_name), channel, interval=self.mirror_interval)
+        mirror.start()
+        self.mirrors[server_name] = mirror
+
+    async def _auto_mirror(self, server_name):
+        """Espejo automático en CNP_CONSOLE_CHANNEL_ID para cada servidor que arranca."""
+        if not self.console_channel_id or server_name in self.mirrors:
+            return
+        channel = self.bot.get_channel(self.console_channel_id)
+        if channel is None:
+            try:
+                channel = await self.bot.fetch_channel(self.console_channel_id)
+            except Exception as e:
+                log_exception(e, context=f'Console channel {self.console_channel_id} not available')
+                return
+        await self._start_mirror(server_name, channel)
+
+    def _running_heaps(self):
+        """{servidor: heap MB} de los servidores que este bot tiene en marcha o arrancando."""
+        servers = self.load_server_data()
+        heaps = dict(self._reserved_heaps)
+        for name, proc in self.running_servers.items():
+            if proc.poll() is not None:
+                continue
+            info = servers.get(name) or {}
+            heaps[name] = read_heap_mb(info.get('path', '')) or 0
+        return heaps
+
+    def _fits(self, server_name, heap):
+        """admission() contando también el heap de quienes esperan antes que `server_name`."""
+        heaps = self._running_heaps()
+        for name, waiting in self._memory_waiters:
+            if name == server_name:
+                break
+            heaps[name] = waiting
+        return self.memory.admission(heaps, heap)
+
+    async def _memory_released(self):
+        """Despierta a los arranques que esperan memoria para que vuelvan a comprobar."""
+        async with self._memory_changed:
+            self._memory_changed.notify_all()
+
+    async def _admit(self, ctx, server_name, server_info):
+        """
+        Control de admisión por memoria: la suma de -Xmx (más margen) de los
+        servidores en marcha y el nuevo no debe superar el presupuesto del
+        host. Según `CNP_MEMORY_ADMISSION` se rechaza el arranque o se espera
+        a que haya hueco (como mucho `CNP_MEMORY_QUEUE_TIMEOUT` segundos).
+
+        Al admitir se reserva el heap en `_reserved_heaps` hasta que el
+        proceso está en `running_servers` (lo suelta `_internal_start_server`),
+        así dos arranques simultáneos no pueden pasar los dos con el mismo hueco.
+        La comprobación y la reserva van bajo `_admission_lock`, pero la espera
+        no (`_memory_changed` suelta el cerrojo): mientras uno espera, los
+        demás arranques se comprueban al momento. El heap de quienes esperan
+        cuenta como ocupado para los que llegan después, así que se atienden
+        por orden de llegada.
+        """
+        if self.admission_mode == 'off':
+            return True
+        heap = read_heap_mb(server_info.get('path', ''))
+        if not heap:
+            # Sin -Xmx conocido no hay nada que estimar
+            return True
+        queue = self.admission_mode == 'queue'
+        async with self._admission_lock:
+            ok, reason, _, _ = self._fits(server_name, heap)
+            if ok:
+                self._reserved_heaps[server_name] = heap
+                return True
+            if queue:
+                waiter = (server_name, heap)
+                self._memory_waiters.append(waiter)
+        if not queue:
+            await ctx.send(f'❌ No hay memoria para iniciar `{server_name}` ({format_mb(heap)} de heap): {reason}. '
+                           'Detén otro servidor o reduce su heap con `!memoria`.')
+            return False
+
+        admitted = False
+        try:
+            await ctx.send(f'⏳ `{server_name}` espera memoria libre: {reason}. '
+                           f'Se iniciará en cuanto haya hueco (máximo {self.admission_timeout}s).')
+            deadline = time.monotonic() + self.admission_timeout
+            async with self._memory_changed:
+                while not admitted and time.monotonic() < deadline:
+                    try:
+                        # Sin aviso (caída, heap cambiado con !memoria) se vuelve a mirar cada 10 s
+                        await asyncio.wait_for(self._memory_changed.wait(),
+                                               timeout=min(10, max(0.1, deadline - time.monotonic())))
+                    except asyncio.TimeoutError:
+                        pass
+                    ok, reason, _, _ = self._fits(server_name, heap)
+                    if ok:
+                        self._reserved_heaps[server_name] = heap
+                        admitted = True
+        finally:
+            self._memory_waiters.remove(waiter)
+            if not admitted:
+                # Quien iba detrás ya no tiene que contar con este heap
+                await self._memory_released()
+        if admitted:
+            await ctx.send(f'✅ Ya hay memoria para `{server_name}`; iniciando.')
+            return True
+        await ctx.send(f'❌ `{server_name}` no se inició: sigue sin haber memoria ({reason}).')
+        return False
+
+    async def _ensure_ports(self, ctx, server_name, server_info):
+        """
+        Verifica que los puertos del servidor estén libres. Los ocupados por
+        otro proceso se reasignan (server.properties y servers.json) o, si la
+        reasignación está desactivada, se cancela el arranque.
+        """
+        busy = await asyncio.to_thread(self.ports.busy, server_info)
+        if not busy:
+            return True
+        ports = server_ports(server_info)
+        listed = ', '.join(f'{PORT_LABELS[kind]} {port}' for kind, port in busy)
+        checked = [k for k in ports if not (k == 'query' and ports['query'] == ports['game'])]
+        if len(busy) == len(checked):
+            # Todos ocupados: casi seguro que este mismo servidor ya corre fuera del bot
+            await ctx.send(f'❌ Todos los puertos de `{server_name}` están en uso ({listed}). '
+                           '¿Está ya en marcha fuera del bot? No se iniciará.')
+            return False
+        if not self.reassign_ports or not server_info.get('path'):
+            await ctx.send(f'❌ Puertos ocupados para `{server_name}`: {listed}. Libéralos o cambia `server.properties`.')
+            return False
+
+        server_path = server_info['path']
+        kinds = [kind for kind, _ in busy]
+        keep = {k: p for k, p in ports.items() if k not in kinds}
+        try:
+            new = await asyncio.to_thread(self.ports.allocate, server_path, kinds, None, keep)
+        except RuntimeError as e:
+            await ctx.send(f'❌ Puertos ocupados para `{server_name}` ({listed}) y sin alternativa: {e}')
+            return False
+        finally:
+            self.ports.release(server_path)
+
+        updates = {PORT_KINDS[kind][1]: port for kind, port in new.items()}
+        if 'game' in new and 'query' not in new and ports['query'] == ports['game']:
+            # query.port seguía al de juego: que lo siga haciendo
+            updates['query.port'] = new['game']
+            new['query'] = new['game']
+        try:
+            rewrite_properties(os.path.join(server_path, 'server.properties'), updates)
+        except OSError as e:
+            log_exception(e, context=f'Could not rewrite ports for {server_name}')
+            await ctx.send(f'❌ Puertos ocupados para `{server_name}` ({listed}) y no se pudo actualizar `server.properties`.')
+            return False
+        for kind, port in new.items():
+            server_info[PORT_KINDS[kind][0]] = port
+        if self.config:
+            self.config.save_servers()
+
+        changes = ', '.join(f'{PORT_LABELS[kind]} {ports[kind]} → {port}' for kind, port in new.items())
+        msg = f'⚠️ Puertos ocupados en el host; `{server_name}` usará otros: {changes}.'
+        if 'game' in new:
+            msg += ' Si usas un túnel (Playit), apúntalo al nuevo puerto de juego.'
+        await ctx.send(msg)
+        return True
+
     async def _internal_start_server(self, ctx, server_name: str):
         """Lógica interna para iniciar un servidor."""
+        lock = self._start_locks.setdefault(server_name, asyncio.Lock())
+        if lock.locked():
+            # Otro arranque (comando, supervisor o despertar) ya está en curso
+            await ctx.send(f'⏳ El servidor `{server_name}` ya se está iniciando.')
+            return False
+        async with lock:
+            return await self._start_locked(ctx, server_name)
+
+    async def _start_locked(self, ctx, server_name):
         if server_name in self.running_servers and self.running_servers[server_name].poll() is None:
             await ctx.send(f'⚠️ ¡El servidor `{server_name}` ya está en funcionamiento!')
             return False
@@ -76,116 +410,222 @@ class ServerManagement(commands.Cog):
             await ctx.send(f'❌ No se encontró ningún servidor con el nombre `{server_name}`.')
             return False
 
-        # --- LÓGICA DE PLAYIT.GG RESTAURADA ---
-        try:
-            if self.playit_process is None or self.playit_process.poll() is not None:
-                if not os.path.exists(PLAYIT_PATH):
-                    # Don't leak local paths in public messages; provide actionable hint
-                    await ctx.send('❌ Error: No se encontró el ejecutable de Playit.gg en la ruta configurada. Revisa la configuración del bot.')
-                    log_exception(FileNotFoundError(PLAYIT_PATH), context='Playit executable missing')
-                    return False
-                await ctx.send("Iniciando el túnel de Playit.gg...")
-                self.playit_process = subprocess.Popen(PLAYIT_PATH)
-                await asyncio.sleep(5) # Dar tiempo para que se conecte
-                await ctx.send("✅ Túnel de Playit.gg iniciado.")
-        except Exception as e:
-            log_exception(e, context='Error starting Playit process')
-            await ctx.send('❌ Error al iniciar Playit.gg. Revisa los logs del bot.')
+        # Si dormía, su respondedor tiene el puerto de juego: soltarlo (la referencia al túnel se mantiene)
+        await self.hibernator.release(server_name)
+
+        # Comprobar puertos antes de lanzar nada: un puerto ocupado hace que el servidor se caiga al arrancar
+        if not await self._ensure_ports(ctx, server_name, server_info):
             return False
-        # --- FIN DE LÓGICA PLAYIT ---
+        # Y que quepa en la RAM del host junto a los que ya están en marcha
+        if not await self._admit(ctx, server_name, server_info):
+            return False
+        try:
+            return await self._launch(ctx, server_name, server_info)
+        finally:
+            # Ya está en running_servers (o no arrancó): su heap deja de estar reservado aparte
+            if self._reserved_heaps.pop(server_name, None) is not None:
+                await self._memory_released()
 
-        # --- LÓGICA DEL SERVIDOR DE MINECRAFT ---
+    async def _launch(self, ctx, server_name, server_info):
+        """Túnel y proceso del servidor, ya comprobados sus puertos y admitido por memoria."""
         server_path = server_info.get('path')
         script_name = server_info.get('script', 'start.bat')
-        script_path = os.path.join(server_path, script_name)
+        script_path = self.backend.resolve_script(server_path, script_name)
 
         if not os.path.exists(script_path):
             await ctx.send(f'❌ El script de inicio `{script_path}` no existe.')
             return False
 
+        # --- TÚNEL DE PLAYIT.GG ---
+        # Se lanza si no estaba en marcha; el servidor arranca a la vez, sin esperar a que conecte
+        try:
+            tunnel = await self.tunnel.acquire(server_name)
+        except Exception as e:
+            log_exception(e, context='Error starting Playit process')
+            await self.tunnel.release(server_name)
+            await ctx.send('❌ Error al iniciar Playit.gg. Revisa los logs del bot.')
+            return False
+        if tunnel == 'missing':
+            # Don't leak local paths in public messages; provide actionable hint
+            await self.tunnel.release(server_name)
+            await ctx.send('❌ Error: No se encontró el ejecutable de Playit.gg en la ruta configurada '
+                           '(`PLAYIT_PATH`, o `off` para no usar túnel). Revisa la configuración del bot.')
+            return False
+        if tunnel == 'started':
+            await ctx.send('Iniciando el túnel de Playit.gg...')
+            asyncio.ensure_future(self._announce_tunnel(ctx))
+
+        # --- LÓGICA DEL SERVIDOR DE MINECRAFT ---
+
         try:
             await ctx.send(f'✅ Iniciando el servidor `{server_name}`...')
-            process = subprocess.Popen(
-                script_path,
-                cwd=server_path,
-                creationflags=subprocess.CREATE_NEW_CONSOLE
-            )
+            console = None
+            if self.console_capture:
+                console = self._console(server_name)
+                console.append(f'--- {time.strftime("%Y-%m-%d %H:%M:%S")} arranque de {server_name} ---')
+            process = await self.backend.start(script_path, server_path, name=server_name, console=console)
             self.running_servers[server_name] = process
+            self.registry.record(server_name, process, command=self.backend.command_for(script_path),
+                                 ports=server_ports(server_info), path=server_path)
+            self.supervisor.watch(server_name, process)
+            if getattr(ctx, 'channel', None) is not None:
+                self._start_channels[server_name] = ctx.channel
+            await self._auto_mirror(server_name)
             await ctx.send(f'El servidor `{server_name}` se ha iniciado. Dale unos minutos para que esté en línea.')
             return True
         except Exception as e:
             log_exception(e, context=f'Error starting server {server_name}')
+            if server_name not in self.running_servers:
+                await self.tunnel.release(server_name)
             await ctx.send(f'❌ Ocurrió un error al iniciar `{server_name}`. Revisa los logs del bot.')
             return False
 
-    async def _internal_stop_server(self, ctx, server_name: str, stop_playit: bool):
-        """Lógica interna para detener un servidor."""
+    async def _internal_stop_server(self, ctx, server_name: str, stop_playit: bool, deadline=None):
+        """
+        Lógica interna para detener un servidor.
+
+        Con RCON: `save-all flush` (responde cuando el mundo está en disco),
+        `stop` y espera a que el proceso salga; termina en cuanto sale, sin
+        esperas fijas. Si el log confirma que todo está guardado pero el
+        proceso no sale, o se agota el plazo (`deadline`, instante de
+        `time.monotonic()`; por defecto `CNP_STOP_TIMEOUT` s), se fuerza.
+        """
         if server_name not in self.running_servers or self.running_servers[server_name].poll() is not None:
+            health = self.supervisor.health.get(server_name)
+            if health and health.state in ('restarting', 'crashloop'):
+                self.supervisor.forget(server_name)
+                await self.tunnel.release(server_name, linger=0 if stop_playit else None)
+                await ctx.send(f'🛑 Reinicio automático de `{server_name}` cancelado.')
+                return True
             await ctx.send(f'⚠️ El servidor `{server_name}` no está en funcionamiento.')
             return False
 
         process = self.running_servers[server_name]
+        # Parada pedida: que el supervisor no la tome por una caída
+        self.supervisor.expect_exit(server_name)
         servers_data = self.load_server_data()
         server_info = servers_data.get(server_name, {})
         
         rcon_port = server_info.get('rcon_port', 25575)
         rcon_host = server_info.get('rcon_host', 'localhost')
+        log_path = os.path.join(server_info.get('path', ''), 'logs', 'latest.log')
+        if deadline is None:
+            deadline = time.monotonic() + self.stop_timeout
 
         stopped_safely = False
+        stop_sent = False
+        saved_in = None
         if self.rcon_password:
-            await ctx.send(f'⛔ Intentando un cierre seguro de `{server_name}` vía RCON...')
+            await ctx.send(f'⛔ Guardando y cerrando `{server_name}` vía RCON...')
             try:
-                # Comprobar que el puerto está accesible antes de usar MCRcon
-                try:
-                    with socket.create_connection((rcon_host, int(rcon_port)), timeout=3):
-                        pass
-                except Exception as sock_e:
-                        await ctx.send('⚠️ No se pudo conectar al RCON (socket). Se forzará cierre.')
-                        log_exception(sock_e, context=f'RCON socket error for {server_name} at {rcon_host}:{rcon_port}')
-                        raise
+                # Sesión RCON del pool: si ya estaba abierta no hay conexión ni autenticación nueva
+                save_started = time.monotonic()
+                await self.rcon.command(rcon_host, rcon_port, 'save-all flush',
+                                        timeout=max(1.0, min(self.save_timeout, deadline - time.monotonic())))
+                saved_in = time.monotonic() - save_started
+                offset = log_offset(log_path)
+                stop_sent = True
+                await self.rcon.command(rcon_host, rcon_port, 'stop', timeout=5)
+            except asyncio.TimeoutError:
+                await ctx.send('⚠️ Timeout esperando respuesta de RCON.')
+            except RconError as rcon_e:
+                if not stop_sent:
+                    log_exception(rcon_e, context=f'RCON error for {server_name} at {rcon_host}:{rcon_port}')
+                    await ctx.send('⚠️ No se pudo usar RCON.')
+                # Tras `stop` el servidor puede cortar la conexión sin contestar: se espera igualmente
+            finally:
+                # El servidor ya no está: no dejar la sesión en el pool
+                await self.rcon.discard(rcon_host, rcon_port)
 
-                def do_rcon_stop():
-                    with MCRcon(rcon_host, self.rcon_password, port=rcon_port) as mcr:
-                        mcr.command("stop")
+        if not stop_sent:
+            # Sin RCON (caído o sin contraseña): `stop` por la consola del proceso, que también guarda al salir
+            offset = log_offset(log_path)
+            if await process.write_line('stop'):
+                stop_sent = True
+                await ctx.send(f'⛔ Cerrando `{server_name}` por su consola (sin RCON)...')
+
+        if stop_sent:
+            result = await wait_for_exit(process, log_path, offset, deadline, saved_grace=self.saved_grace)
+            if result.outcome == 'exited':
+                stopped_safely = True
+                timing = f'apagado {result.elapsed:.1f}s'
+                if saved_in is not None:
+                    timing = f'guardado {saved_in:.1f}s, ' + timing
+                await ctx.send(f'✅ El servidor `{server_name}` se ha detenido de forma segura ({timing}).')
+            elif result.outcome == 'saved':
+                await ctx.send('⚠️ El mundo está guardado pero el proceso no termina. Forzando cierre.')
+            else:
+                await ctx.send('⚠️ El servidor no terminó a tiempo. Forzando cierre.')
 
-                try:
-                    await asyncio.wait_for(asyncio.to_thread(do_rcon_stop), timeout=5)
-                    await ctx.send('Comando "stop" enviado. Esperando 30 segundos...')
-                    await asyncio.to_thread(process.wait, timeout=30)
-                    stopped_safely = True
-                    await ctx.send(f'✅ El servidor `{server_name}` se ha detenido de forma segura.')
-                except asyncio.TimeoutError:
-                    await ctx.send('⚠️ Timeout al enviar comando RCON. Forzando cierre.')
-                except Exception as rcon_e:
-                    log_exception(rcon_e, context=f'RCON command error for {server_name}')
-                    await ctx.send('⚠️ Error al usar RCON. Forzando cierre.')
-            except Exception:
-                # Si cualquier comprobación falla, continuamos con el forzado
-                pass
-        
         if not stopped_safely:
             await ctx.send(f'Forzando el cierre del proceso PID: `{process.pid}`...')
             try:
-                os.system(f"taskkill /F /T /PID {process.pid}")
-                await ctx.send(f'✅ El servidor `{server_name}` ha sido forzado a detenerse.')
+                # SIGTERM/taskkill a todo el árbol; si no responde en `force_grace` s, kill
+                clean = await self.backend.terminate(process, grace=self.force_grace)
+                if clean:
+                    await ctx.send(f'✅ El servidor `{server_name}` se ha detenido.')
+                else:
+                    await ctx.send(f'✅ El servidor `{server_name}` ha sido forzado a detenerse.')
             except Exception as e:
                     log_exception(e, context=f'Error forcing kill for {server_name}')
                     await ctx.send('❌ Error al forzar el cierre del servidor. Revisa los logs del bot.')
                     return False
 
         del self.running_servers[server_name]
+        self.registry.remove(server_name)
+        self.supervisor.forget(server_name)
+        await self._memory_released()
+        self.stop_outcomes[server_name] = 'safe' if stopped_safely else 'forced'
 
-        # --- LÓGICA DE PLAYIT.GG RESTAURADA ---
-        # Si se indica que se detenga, o si ya no quedan servidores corriendo.
-        if stop_playit or len(self.running_servers) == 0:
-            if self.playit_process and self.playit_process.poll() is None:
-                await ctx.send("Cerrando el túnel de Playit.gg...")
-                self.playit_process.kill()
-                self.playit_process = None
-                await ctx.send("Túnel de Playit.gg cerrado.")
+        # --- TÚNEL DE PLAYIT.GG ---
+        # Solo se cierra si ningún otro servidor lo usa; sin `stop_playit` (reinicio) espera
+        # CNP_PLAYIT_LINGER s por si el servidor vuelve a arrancar
+        released = await self.tunnel.release(server_name, linger=0 if stop_playit else None)
+        if released == 'stopped':
+            await ctx.send('Túnel de Playit.gg cerrado.')
+        elif released == 'kept' and stop_playit:
+            users = ', '.join(f'`{n}`' for n in sorted(self.tunnel.refs))
+            await ctx.send(f'ℹ️ El túnel de Playit.gg sigue activo: lo usan {users}.')
         
         return True
 
+    def _rcon_targets(self, target):
+        """
+        Servidores a los que va un `!rcon`: `todos` (los que están en marcha),
+        `tipo:<tipo>` (los en marcha de ese tipo) o nombres separados por comas.
+        Devuelve ({nombre: info}, [nombres desconocidos]).
+        """
+        servers = self.load_server_data()
+        running = [n for n, proc in self.running_servers.items() if proc.poll() is None and n in servers]
+        lowered = target.lower()
+        if lowered in ('todos', 'all', '*'):
+            return {n: servers[n] for n in running}, []
+        if lowered.startswith('tipo:'):
+            wanted = lowered.split(':', 1)[1]
+            return {n: servers[n] for n in running if (servers[n].get('type') or '').lower() == wanted}, []
+        names = [n.strip() for n in target.split(',') if n.strip()]
+        return {n: servers[n] for n in names if n in servers}, [n for n in names if n not in servers]
+
+    @staticmethod
+    def _rcon_report(results, commands):
+        """(tabla resumen, informe completo) de un !rcon."""
+        width = min(24, max(len('Servidor'), *(len(n) for n in results)))
+        lines = [f"{'Servidor'.ljust(width)} | Estado  | OK/Total | Tiempo", '-' * (width + 34)]
+        details = []
+        for name, res in results.items():
+            done = len(res.outputs) - res.failed
+            state = 'OK' if res.ok else ('ERROR' if res.error else 'PARCIAL')
+            lines.append(f'{name[:width].ljust(width)} | {state:<7} | {done:>3}/{len(commands):<4} | {res.elapsed:5.2f}s')
+            details.append(f'== {name} ==')
+            if res.error:
+                details.append(f'! {res.error}')
+            for cmd, ok, text in res.outputs:
+                details.append(f'{">" if ok else "!"} {cmd}')
+                if text:
+                    details.extend(f'  {line}' for line in text.splitlines())
+            details.append('')
+        return '\n'.join(lines), '\n'.join(details)
+
     # --- COMANDOS PÚBLICOS DEL BOT ---
 
     @commands.command(name='iniciar', aliases=['start'])
@@ -196,7 +636,15 @@ class ServerManagement(commands.Cog):
         `server_name` es obligatorio para `!iniciar`.
         Al iniciarse correctamente, se guarda como `default_server`.
         """
-        started = await self._internal_start_server(ctx, server_name)
+        current = self.running_servers.get(server_name)
+        if current is None or current.poll() is not None:
+            # Arranque manual: anula un reinicio automático pendiente o un bucle de caídas
+            self.supervisor.forget(server_name)
+        if server_name in self.hibernator.sleeping:
+            # Si no puede arrancar, sigue dormido en lugar de quedarse sin respondedor
+            started = await self.hibernator.wake(server_name, reason='!iniciar', ctx=ctx)
+        else:
+            started = await self._internal_start_server(ctx, server_name)
         if started and self.config and getattr(self.config, 'set_default_server', None):
             try:
                 self.config.set_default_server(server_name)
@@ -212,11 +660,65 @@ class ServerManagement(commands.Cog):
         `server_name` es opcional: si no se indica se usa el `default_server` o
         el único servidor registrado.
         """
+        if server_name and server_name.lower() in ('todos', 'all'):
+            await self._stop_all(ctx)
+            return
         resolved = await self._resolve_server_name(ctx, server_name)
         if not resolved:
             return
+        if await self._cancel_sleep(resolved):
+            await ctx.send(f'🛑 `{resolved}` estaba dormido: ya no despertará al entrar alguien.')
+            return
         await self._internal_stop_server(ctx, resolved, stop_playit=True)
 
+    async def _cancel_sleep(self, server_name):
+        """Deja de escuchar por un servidor dormido y suelta su referencia al túnel. True si dormía."""
+        if not await self.hibernator.release(server_name):
+            return False
+        await self.tunnel.release(server_name, linger=0)
+        return True
+
+    async def _stop_all(self, ctx):
+        """`!detener todos`: apaga en paralelo todos los servidores en marcha con un plazo global."""
+        names = [n for n, proc in self.running_servers.items() if proc.poll() is None]
+        sleeping = [n for n in list(self.hibernator.sleeping) if await self._cancel_sleep(n)]
+        if sleeping:
+            await ctx.send(f'🛑 Ya no despertarán al entrar alguien: {", ".join(f"`{n}`" for n in sleeping)}.')
+        if not names:
+            if not sleeping:
+                await ctx.send('⚠️ No hay ningún servidor en funcionamiento.')
+            return
+        await ctx.send(f'⛔ Deteniendo {len(names)} servidor(es) en paralelo '
+                       f'(plazo total {self.stop_all_deadline:.0f}s)...')
+        deadline = time.monotonic() + self.stop_all_deadline
+
+        async def stop_one(name):
+            log = _MessageLog()
+            started = time.monotonic()
+            try:
+                ok = await self._internal_stop_server(log, name, stop_playit=False, deadline=deadline)
+            except Exception as e:
+                log_exception(e, context=f'Error stopping {name} (stop all)')
+                ok = False
+            return name, ok, time.monotonic() - started, log
+
+        results = await asyncio.gather(*(stop_one(n) for n in names))
+        width = min(24, max(len('Servidor'), *(len(n) for n in names)))
+        lines = [f"{'Servidor'.ljust(width)} | Resultado | Tiempo", '-' * (width + 22)]
+        for name, ok, elapsed, log in results:
+            if not ok:
+                state = 'ERROR'
+            elif self.stop_outcomes.get(name) == 'forced':
+                state = 'FORZADO'
+            else:
+                state = 'OK'
+            lines.append(f'{name[:width].ljust(width)} | {state:<9} | {elapsed:5.1f}s')
+        await ctx.send('```\n' + '\n'.join(lines) + '\n```')
+
+        # Con todo parado, el túnel ya no hace falta
+        if not self.tunnel.refs and self.tunnel.running and await self.tunnel.stop():
+            await ctx.send('Túnel de Playit.gg cerrado.')
+
     @commands.command(name='reiniciar', aliases=['restart'])
     @commands.has_role(ADMIN_ROLE)
     async def reiniciar_command(self, ctx, server_name: str = None):
@@ -232,9 +734,345 @@ class ServerManagement(commands.Cog):
         await ctx.send(f'🔄 Reiniciando el servidor `{resolved}`...')
         # Llama a la lógica interna, PERO no detiene Playit
         if await self._internal_stop_server(ctx, resolved, stop_playit=False):
-            await asyncio.sleep(5)  # Esperar un momento
+            # Arrancar en cuanto el sistema libere los puertos del proceso anterior
+            waited = await wait_ports_free(self.load_server_data().get(resolved, {}), timeout=30)
+            if waited is None:
+                await ctx.send('⚠️ Los puertos del servidor siguen ocupados tras 30s; se intentará iniciar igualmente.')
             await self._internal_start_server(ctx, resolved)
 
+    @commands.command(name='memoria', aliases=['memory'])
+    @commands.has_role(ADMIN_ROLE)
+    async def memoria_command(self, ctx, server_name: str = None, profile: str = None, heap: str = None):
+        """Presupuesto de RAM del host; con servidor y perfil regenera su `user_jvm_args.txt`.
+
+        Uso: `!memoria` | `!memoria <servidor>` | `!memoria <servidor> <g1|zgc|basico> [heap, p. ej. 6G]`
+        """
+        servers = self.load_server_data()
+        if server_name is None:
+            total, available = host_memory()
+            budget = self.memory.budget_mb()
+            running = self._running_heaps()
+            used = sum(self.memory.footprint_mb(h) for h in running.values())
+            lines = [
+                f'Host: {format_mb(total)} de RAM ({format_mb(available)} libres), {host_cpus()} CPUs',
+                f'Presupuesto para servidores: {format_mb(budget)} — en uso {format_mb(used)} '
+                f'(admisión: {self.admission_mode})',
+                '',
+            ]
+            for name, info in servers.items():
+                h = read_heap_mb(info.get('path', ''))
+                state = '▶' if name in running else ' '
+                lines.append(f'{state} {name[:24]:<24} heap {format_mb(h):>8}')
+            await ctx.send('```\n' + '\n'.join(lines) + '\n```')
+            return
+
+        info = servers.get(server_name)
+        if not info:
+            await ctx.send(f'❌ No se encontró ningún servidor con el nombre `{server_name}`.')
+            return
+        if profile is None:
+            await ctx.send(f'ℹ️ `{server_name}`: heap {format_mb(read_heap_mb(info.get("path", "")))}. '
+                           f'Perfiles: {", ".join(f"`{k}` ({v[0]})" for k, v in PROFILES.items())}.')
+            return
+        if server_name in self._running_heaps():
+            await ctx.send(f'⚠️ `{server_name}` está en marcha; detenlo antes de cambiar su memoria.')
+            return
+        heap_mb = parse_size_mb(heap) if heap else read_heap_mb(info.get('path', ''))
+        if heap and not heap_mb:
+            await ctx.send(f'❌ Tamaño de heap no válido: `{heap}` (ejemplos: `4G`, `6144M`).')
+            return
+        try:
+            plan = self.memory.plan(info.get('type'), heap_mb=heap_mb, profile=profile)
+            await asyncio.to_thread(self.memory.write, info['path'], plan)
+        except ValueError as e:
+            await ctx.send(f'❌ {e}')
+            return
+        except (OSError, KeyError) as e:
+            log_exception(e, context=f'Could not write JVM args for {server_name}')
+            await ctx.send('❌ No se pudo escribir `user_jvm_args.txt`. Revisa los logs del bot.')
+            return
+        budget = self.memory.budget_mb()
+        warn = ''
+        if budget and self.memory.footprint_mb(plan.heap_mb) > budget:
+            warn = f' ⚠️ Supera el presupuesto del host ({format_mb(budget)}): no podrá arrancar con la admisión activa.'
+        await ctx.send(f'✅ `{server_name}`: heap {format_mb(plan.heap_mb)}, perfil `{plan.profile}`.{warn}')
+
+    @commands.command(name='supervisor', aliases=['salud'])
+    @commands.has_role(ADMIN_ROLE)
+    async def supervisor_command(self, ctx):
+        """Estado del supervisor: salud de cada servidor, caídas recientes y reinicios pendientes."""
+        sup = self.supervisor
+        if not sup.health:
+            await ctx.send('ℹ️ El supervisor no vigila ningún servidor todavía (se vigilan los iniciados con `!iniciar`).')
+            return
+        labels = {'running': 'en marcha', 'starting': 'arrancando', 'restarting': 'reiniciando',
+                  'crashloop': 'BUCLE', 'stopped': 'detenido'}
+        lines = [f"{'Servidor':<20} {'Estado':<11} {'Ping':>7} {'RCON':>7} {'Caídas':>6}  Reinicio", '-' * 66]
+        for name in sorted(sup.health):
+            h = sup.describe(name)
+            probe = h.last_probe or {}
+            ping = f"{probe['ping']:.0f}ms" if probe.get('ping') is not None else '-'
+            rc = f"{probe['rcon']:.0f}ms" if probe.get('rcon') is not None else '-'
+            restart = f'en {max(0, h.next_restart - time.time()):.0f}s' if h.next_restart else ''
+            if h.state == 'running' and h.failed_probes:
+                restart = f'{h.failed_probes}/{sup.hung_probes} sondeos sin respuesta'
+            lines.append(f'{name[:20]:<20} {labels.get(h.state, h.state):<11} {ping:>7} {rc:>7} {len(h.crashes):>6}  {restart}')
+        footer = (f'Sondeo cada {sup.interval:.0f}s; bucle de caídas: {sup.crashloop_count} en '
+                  f'{sup.crashloop_window / 60:.0f} min.' if sup.enabled else 'Sondeos desactivados (CNP_SUPERVISOR=0).')
+        await ctx.send('```\n' + '\n'.join(lines) + '\n```' + footer)
+
+    @commands.command(name='hibernar', aliases=['dormir', 'hibernate'])
+    @commands.has_role(ADMIN_ROLE)
+    async def hibernar_command(self, ctx, server_name: str = None, action: str = None):
+        """Hibernación de servidores vacíos: se detienen y despiertan cuando alguien intenta entrar.
+
+        Uso: `!hibernar` (estado), `!hibernar <servidor> <minutos|off>` (sin jugadores durante ese
+        tiempo, se duerme), `!hibernar <servidor> ahora` o `!hibernar <servidor> despertar`.
+        """
+        hib = self.hibernator
+        servers = self.load_server_data()
+        if server_name is None:
+            lines = []
+            for name, info in servers.items():
+                minutes = hib.minutes(info)
+                if name in hib.sleeping:
+                    state = hib.sleeping[name]
+                    detail = f'💤 dormido desde {time.strftime("%d/%m %H:%M", time.localtime(state.since))}'
+                    if state.responder is not None and state.responder.pings:
+                        detail += f', {state.responder.pings} consulta(s) de la lista'
+                elif name in self.running_servers and self.running_servers[name].poll() is None:
+                    idle = hib.idle_since.get(name)
+                    detail = f'vacío hace {(time.monotonic() - idle) / 60:.0f} min' if idle is not None else 'en marcha'
+                else:
+                    detail = 'detenido'
+                limit = f'{minutes:g} min' if minutes else 'off'
+                lines.append(f'{name[:20]:<20} {limit:>8}  {detail}')
+            if not lines:
+                await ctx.send('❌ No hay servidores registrados.')
+                return
+            await ctx.send('```\n' + '\n'.join(lines) + '\n```'
+                           f'Comprobación cada {hib.interval:g}s; por defecto '
+                           f'{f"{hib.default_minutes:g} min" if hib.default_minutes else "off"} (`CNP_HIBERNATE_MINUTES`).')
+            return
+
+        info = servers.get(server_name)
+        if info is None:
+            await ctx.send(f'❌ No se encontró ningún servidor con el nombre `{server_name}`.')
+            return
+        action = (action or '').lower()
+        if action in ('ahora', 'now'):
+            current = self.running_servers.get(server_name)
+            if current is None or current.poll() is not None:
+                await ctx.send(f'⚠️ El servidor `{server_name}` no está en funcionamiento.')
+                return
+            await ctx.send(f'💤 Durmiendo `{server_name}`...')
+            await hib.hibernate(server_name, reason='!hibernar', ctx=ctx)
+            return
+        if action in ('despertar', 'wake'):
+            if server_name not in hib.sleeping:
+                await ctx.send(f'⚠️ `{server_name}` no está dormido.')
+                return
+            await hib.wake(server_name, reason='!hibernar despertar', ctx=ctx)
+            return
+        if action in ('off', 'no', '0'):
+            minutes = 0
+        else:
+            try:
+                minutes = float(action)
+            except ValueError:
+                await ctx.send('❌ Uso: `!hibernar <servidor> <minutos|off|ahora|despertar>`.')
+                return
+            if minutes < 0:
+                await ctx.send('❌ Los minutos no pueden ser negativos.')
+                return
+        info['hibernate_minutes'] = minutes
+        if self.config:
+            self.config.save_servers()
+        hib.idle_since.pop(server_name, None)
+        if minutes:
+            await ctx.send(f'✅ `{server_name}` dormirá tras {minutes:g} min sin jugadores.')
+        else:
+            await ctx.send(f'✅ `{server_name}` ya no se dormirá solo.')
+
+    @commands.command(name='tunel', aliases=['túnel', 'tunnel', 'playit'])
+    @commands.has_role(ADMIN_ROLE)
+    async def tunel_command(self, ctx, action: str = None):
+        """Estado del túnel de Playit.gg (`!tunel reiniciar` lo relanza)."""
+        tunnel = self.tunnel
+        if not tunnel.enabled:
+            await ctx.send('ℹ️ El túnel de Playit.gg está desactivado (`PLAYIT_PATH=off`).')
+            return
+        if action and action.lower() in ('reiniciar', 'restart'):
+            if not tunnel.refs:
+                await ctx.send('⚠️ Ningún servidor usa el túnel ahora mismo.')
+                return
+            if await tunnel.restart() == 'missing':
+                await ctx.send('❌ No se encontró el ejecutable de Playit.gg.')
+                return
+            await ctx.send('🔄 Relanzando el túnel de Playit.gg...')
+            asyncio.ensure_future(self._announce_tunnel(ctx))
+            return
+        labels = {'stopped': 'parado', 'starting': 'conectando', 'ready': 'conectado', 'unconfirmed': 'sin confirmar',
+                  'restarting': 'relanzando', 'missing': 'ejecutable no encontrado'}
+        lines = [f'Estado:    {labels.get(tunnel.state, tunnel.state)}']
+        if tunnel.running:
+            lines.append(f'PID:       {tunnel.process.pid}')
+            lines.append(f'En marcha: {time.monotonic() - tunnel.started_at:.0f}s'
+                         + (f' (conectó en {tunnel.ready_after:.1f}s)' if tunnel.ready_after is not None else ''))
+        lines.append(f"Servidores: {', '.join(sorted(tunnel.refs)) or 'ninguno'}")
+        if tunnel.failures:
+            lines.append(f'Caídas:    {tunnel.failures}')
+        if tunnel.needs_claim:
+            lines.append('⚠️ Pendiente de vincular a una cuenta (enlace en la consola del bot)')
+        output = tunnel.console.tail(10)
+        message = '```\n' + '\n'.join(lines) + '\n```'
+        if output:
+            message += '\n' + code_block(output, 'Últimas líneas del agente:')
+        await ctx.send(message[:2000])
+
+    @commands.command(name='consola', aliases=['console'])
+    @commands.has_role(ADMIN_ROLE)
+    async def consola_command(self, ctx, server_name: str = None, *, args: str = ''):
+        """Consola de un servidor: últimas líneas, espejo en vivo o envío de un comando.
+
+        Uso: `!consola <servidor> [n]`, `!consola <servidor> espejo [off]` o
+        `!consola <servidor> enviar <comando>` (por RCON y, si no responde, por la consola del proceso).
+        """
+        if server_name and server_name not in self.load_server_data() and \
+                (server_name.isdigit() or server_name.lower() in ('espejo', 'mirror', 'enviar', 'send')):
+            # `!consola 50` / `!consola espejo`: servidor por defecto
+            server_name, args = None, f'{server_name} {args}'.strip()
+        resolved = await self._resolve_server_name(ctx, server_name)
+        if not resolved:
+            return
+        server_info = self.load_server_data().get(resolved)
+        if server_info is None:
+            await ctx.send(f'❌ No se encontró ningún servidor con el nombre `{resolved}`.')
+            return
+        action, _, rest = args.strip().partition(' ')
+        action = action.lower()
+        process = self.running_servers.get(resolved)
+        running = process is not None and process.poll() is None
+
+        if action in ('espejo', 'mirror'):
+            if rest.strip().lower() in ('off', 'no', 'parar', 'stop'):
+                mirror = self.mirrors.pop(resolved, None)
+                if mirror is None:
+                    await ctx.send(f'ℹ️ No hay espejo de la consola de `{resolved}`.')
+                    return
+                await mirror.stop()
+                await ctx.send(f'✅ Espejo de la consola de `{resolved}` desactivado.')
+                return
+            await self._start_mirror(resolved, ctx.channel)
+            note = '' if running and process.console is not None else \
+                ' (el servidor no está en marcha o su salida no se captura: se verá desde el próximo `!iniciar`)'
+            await ctx.send(f'🖥️ La consola de `{resolved}` se publicará aquí cada {self.mirror_interval:.0f}s '
+                           f'mientras haya salida{note}. `!consola {resolved} espejo off` para pararlo.')
+            return
+
+        if action in ('enviar', 'send'):
+            command = rest.strip()
+            if not command:
+                await ctx.send(f'❌ Uso: `!consola {resolved} enviar <comando>`.')
+                return
+            if not running:
+                await ctx.send(f'⚠️ El servidor `{resolved}` no está en funcionamiento.')
+                return
+            if self.rcon_password:
+                try:
+                    output = await self.rcon.command_for(server_info, command, timeout=self.rcon_command_timeout)
+                    await ctx.send(code_block((output or '(sin salida)').splitlines(), f'📡 `{command}` (RCON)'))
+                    return
+                except (RconError, OSError, asyncio.TimeoutError) as e:
+                    log_exception(e, context=f'!consola: RCON unavailable for {resolved}, using stdin')
+            if await process.write_line(command):
+                await ctx.send(f'⌨️ `{command}` enviado por la consola de `{resolved}` (RCON no disponible); '
+                               f'la respuesta aparecerá en `!consola {resolved}`.')
+            else:
+                await ctx.send(f'❌ No se pudo enviar: RCON no responde y la consola de `{resolved}` no está capturada.')
+            return
+
+        if action and not action.isdigit():
+            await ctx.send('❌ Uso: `!consola <servidor> [n]`, `!consola <servidor> espejo [off]` '
+                           'o `!consola <servidor> enviar <comando>`.')
+            return
+        count = max(1, min(int(action) if action else 20, self.console_lines))
+        buffer = self.consoles.get(resolved)
+        if buffer is not None and buffer.lines:
+            await ctx.send(code_block(buffer.tail(count), f'🖥️ `{resolved}` (últimas {count} líneas)'))
+            return
+        # Sin consola capturada (p. ej. reenganchado tras reiniciar el bot): el log del servidor
+        lines = read_log_tail(os.path.join(server_info.get('path', ''), 'logs', 'latest.log'), count,
+                              self.console_line_max)
+        if not lines:
+            await ctx.send(f'ℹ️ No hay salida de consola de `{resolved}` todavía.')
+            return
+        await ctx.send(code_block(lines, f'📄 `{resolved}` (últimas {count} líneas de logs/latest.log)'))
+
+    @commands.command(name='rcon')
+    @commands.has_role(ADMIN_ROLE)
+    async def rcon_command(self, ctx, target: str = None, *, script: str = None):
+        """Ejecuta un guion RCON (un comando por línea) en uno o varios servidores a la vez.
+
+        Uso: `!rcon <servidor|srv1,srv2|todos|tipo:fabric> [--timeout N] [--parar] <comandos>`
+        Los comandos pueden ir en varias líneas o en un bloque de código.
+        """
+        if not target or not script:
+            await ctx.send('❌ Uso: `!rcon <servidor|srv1,srv2|todos|tipo:fabric> <comandos>` '
+                           '(un comando por línea, p. ej. `save-all` y `say Reinicio en 5 minutos`).')
+            return
+        if not self.rcon_password:
+            await ctx.send('❌ No hay `RCON_PASSWORD` en las variables de entorno.')
+            return
+
+        # Opciones al principio del guion: --timeout N y --parar (detenerse en el primer error)
+        timeout, stop_on_error = self.rcon_command_timeout, False
+        while script.startswith('--'):
+            match = re.match(r'--timeout[= ](\S+)\s*|--parar(?:\s+|$)', script)
+            if not match:
+                await ctx.send(f'❌ Opción desconocida: `{script.split()[0]}` (disponibles: `--timeout N`, `--parar`).')
+                return
+            if match.group(1) is None:
+                stop_on_error = True
+            else:
+                try:
+                    timeout = float(match.group(1))
+                except ValueError:
+                    await ctx.send(f'❌ Timeout no válido: `{match.group(1)}`.')
+                    return
+            script = script[match.end():]
+
+        commands_list = parse_script(script)
+        if not commands_list:
+            await ctx.send('❌ El guion no tiene comandos.')
+            return
+        if len(commands_list) > self.rcon_script_max:
+            await ctx.send(f'❌ Como mucho {self.rcon_script_max} comandos por guion.')
+            return
+
+        targets, unknown = self._rcon_targets(target)
+        if unknown:
+            await ctx.send(f'⚠️ Servidores desconocidos (se omiten): {", ".join(f"`{n}`" for n in unknown)}')
+        if not targets:
+            await ctx.send('❌ Ningún servidor coincide (con `todos`/`tipo:` solo cuentan los que están en marcha).')
+            return
+
+        await ctx.send(f'📡 Ejecutando {len(commands_list)} comando(s) en {len(targets)} servidor(es)...')
+        results = await broadcast(self.rcon, targets, commands_list, timeout=timeout,
+                                  server_timeout=self.rcon_script_timeout, stop_on_error=stop_on_error)
+        for name, res in results.items():
+            if res.error:
+                log_exception(RconError(res.error), context=f'!rcon failed on {name}')
+
+        table, details = self._rcon_report(results, commands_list)
+        message = '```\n' + table + '\n```'
+        if len(message) + len(details) + 9 <= 1900:
+            await ctx.send(message + '\n```\n' + (details or '(sin salida)') + '\n```')
+        else:
+            # Demasiado para un mensaje: la salida completa va como adjunto
+            report = discord.File(io.BytesIO(details.encode('utf-8')), filename='rcon_resultado.txt')
+            await ctx.send(message, file=report)
+
     @commands.command(name='list')
     async def list_command(self, ctx):
         """Lista los servidores registrados (nombre, versión y tipo). No muestra rutas completas."""
@@ -299,5 +1137,16 @@ class ServerManagement(commands.Cog):
             log_exception(error, context=f'Unhandled error in server_management command: {ctx.command.name if hasattr(ctx, "command") else "?"}')
             await ctx.send('❌ Ocurrió un error inesperado. Se ha registrado en el log del bot.')
 
+class _MessageLog:
+    """Sustituto de `ctx` que guarda los mensajes en lugar de enviarlos (para `!detener todos`)."""
+
+    def __init__(self):
+        self.lines = []
+
+    async def send(self, content=None, **kwargs):
+        if content:
+            self.lines.append(content)
+
+
 async def setup(bot):
     await bot.add_cog(ServerManagement(bot))
\ No newline at end of file
@@ -3,11 +3,12 @@ import json
 import asyncio
 import discord
 from discord.ext import commands
-from mcstatus import JavaServer
-from mcrcon import MCRcon
-import socket
-import os
+import time
 from utils.errors import log_exception
+from utils.rcon import RconPool, RconError
+from utils.resources import sparkline
+from utils.memory import format_mb
+from utils.status_cache import StatusService
 
 # Role requerido para comandos administrativos
 ADMIN_ROLE = "Admin"
@@ -21,6 +22,23 @@ class ServerStatus(commands.Cog):
         self.rcon_password = os.getenv('RCON_PASSWORD')
         # usar config central
         self.config = getattr(bot, "config_manager", None)
+        # Sesiones RCON persistentes (una por servidor) compartidas con la gestión de servidores
+        self.rcon = getattr(bot, "rcon_pool", None) or RconPool(self.rcon_password)
+        # Estado sondeado en segundo plano: !estado contesta desde la caché
+        self.status = getattr(bot, "status_service", None) or StatusService(self.config, self.rcon)
+
+    async def cog_load(self):
+        self.status.start(self._running)
+
+    async def cog_unload(self):
+        await self.status.stop()
+
+    def _running(self):
+        """Servidores en marcha según la gestión de servidores (None si no está cargada)."""
+        manager = self.bot.get_cog('ServerManagement')
+        if manager is None:
+            return None
+        return {name for name, proc in manager.running_servers.items() if proc.poll() is None}
 
     def load_server_data(self):
         """Carga la base de datos de servidores desde servers.json."""
@@ -32,6 +50,26 @@ class ServerStatus(commands.Cog):
         except (FileNotFoundError, json.JSONDecodeError):
             return {}
 
+    def _add_resources(self, embed, server_name):
+        """CPU, RAM e hilos del árbol de procesos del servidor, con su evolución reciente."""
+        sampler = getattr(self.bot, 'resource_sampler', None)
+        stats = sampler.get(server_name) if sampler is not None else None
+        current = stats.current() if stats is not None else None
+        if current is None:
+            return
+        embed.add_field(name="CPU", value=f"{current['cpu']:.0f} %", inline=True)
+        ram = format_mb(int(current['rss']))
+        if stats.swap:
+            ram += f' (+{format_mb(stats.swap // 1024 // 1024)} swap)'
+        embed.add_field(name="RAM", value=ram, inline=True)
+        embed.add_field(name="Hilos", value=f"{current['threads']:.0f}", inline=True)
+        minutes = len(stats.times) * sampler.interval / 60
+        embed.add_field(
+            name=f"Últimos {minutes:.0f} min" if minutes >= 1 else "Evolución",
+            value=f"```\nCPU {sparkline(stats.series['cpu'].values())}\n"
+                  f"RAM {sparkline(stats.series['rss'].values())}\n```",
+            inline=False)
+
     @commands.command(name='estado', aliases=['status'])
     async def status_command(self, ctx, server_name: str = None):
         """Consulta el estado de un servidor de Minecraft específico.
@@ -55,8 +93,6 @@ class ServerStatus(commands.Cog):
                     await ctx.send('❌ Debes especificar el nombre del servidor.')
                     return
 
-        await ctx.send(f"🔍 Consultando el estado del servidor `{server_name}`...")
-
         servers_data = self.load_server_data()
         server_info = servers_data.get(server_name)
 
@@ -64,70 +100,44 @@ class ServerStatus(commands.Cog):
             await ctx.send(f'❌ No se encontró ningún servidor con el nombre `{server_name}` en `servers.json`.')
             return
 
-        # Usar valores por defecto si no están en el JSON
-        address = server_info.get('address', 'localhost:25565')
-        rcon_port = server_info.get('rcon_port', 25575)
-        rcon_host = server_info.get('rcon_host', 'localhost')
+        if server_name not in self.status.entries:
+            await ctx.send(f"🔍 Consultando el estado del servidor `{server_name}`...")
+        entry, updating = await self.status.get(server_name)
+        if entry is None:
+            await ctx.send(f'❌ No se encontró ningún servidor con el nombre `{server_name}` en `servers.json`.')
+            return
 
-        try:
-            server = await JavaServer.async_lookup(address)
-            status = await server.async_status()
-            
+        if entry.online:
             embed = discord.Embed(
                 title=f"✅ Servidor `{server_name}` En Línea",
                 description=f"El servidor está funcionando correctamente.",
                 color=discord.Color.green()
             )
-            embed.add_field(name="Versión", value=status.version.name, inline=True)
-            embed.add_field(name="Jugadores", value=f"{status.players.online}/{status.players.max}", inline=True)
-            embed.add_field(name="Latencia", value=f"{status.latency:.2f} ms", inline=True)
-            
-            if status.players.online > 0 and self.rcon_password:
-                try:
-                    def get_player_list():
-                        # Comprobar socket primero para detectar fallos de conexión rápidos
-                        try:
-                            with socket.create_connection((rcon_host, int(rcon_port)), timeout=3):
-                                pass
-                        except Exception as sock_e:
-                            raise RuntimeError(f"Socket error: {sock_e}")
-
-                        with MCRcon(rcon_host, self.rcon_password, port=rcon_port) as mcr:
-                            resp = mcr.command("/list")
-                            # Lógica mejorada para parsear la respuesta de /list
-                            if ":" in resp:
-                                parts = resp.split(':', 1)
-                                if len(parts) > 1 and parts[1].strip():
-                                    player_names = [name.strip() for name in parts[1].split(',')]
-                                    return "\n".join(player_names)
-                            return None
-
-                    try:
-                        player_list = await asyncio.wait_for(asyncio.to_thread(get_player_list), timeout=5)
-                    except Exception as rcon_e:
-                        raise rcon_e
-
-                    if player_list:
-                        embed.add_field(name=f"Jugadores Conectados ({status.players.online})", value=f"```{player_list}```", inline=False)
-                    else:
-                        embed.add_field(name=f"Jugadores Conectados ({status.players.online})", value="Hay jugadores en el servidor (no se pudo obtener la lista detallada).", inline=False)
-
-                except Exception as rcon_e:
-                    embed.add_field(name="Jugadores Conectados", value="No se pudo obtener la lista (error de RCON).", inline=False)
-                    # Log full traceback, don't expose internal errors to channel
-                    log_exception(rcon_e, context=f'RCON error while fetching players for {server_name}')
-
-            await ctx.send(embed=embed)
-
-        except Exception as e:
-            # Log details and show a concise message
-            log_exception(e, context=f'Error checking status for {server_name}')
+            embed.add_field(name="Versión", value=entry.version, inline=True)
+            embed.add_field(name="Jugadores", value=f"{entry.players_online}/{entry.players_max}", inline=True)
+            embed.add_field(name="Latencia", value=f"{entry.latency:.2f} ms", inline=True)
+            self._add_resources(embed, server_name)
+
+            if entry.players_online > 0:
+                if entry.players:
+                    player_list = "\n".join(entry.players)
+                    embed.add_field(name=f"Jugadores Conectados ({entry.players_online})", value=f"```{player_list}```", inline=False)
+                else:
+                    embed.add_field(name=f"Jugadores Conectados ({entry.players_online})", value="Hay jugadores en el servidor (no se pudo obtener la lista detallada).", inline=False)
+        else:
             embed = discord.Embed(
                 title=f"❌ Servidor `{server_name}` Fuera de Línea",
                 description="No se pudo conectar con el servidor. Puede que esté apagado o iniciándose. Revisa los logs del bot para más información.",
                 color=discord.Color.red()
             )
-            await ctx.send(embed=embed)
+            # Si el proceso sigue vivo (arrancando o colgado), su consumo ayuda a saber qué pasa
+            self._add_resources(embed, server_name)
+
+        footer = f"Comprobado hace {entry.age:.0f}s"
+        if updating:
+            footer += " · actualizando en segundo plano"
+        embed.set_footer(text=footer)
+        await ctx.send(embed=embed)
 
     @status_command.error
     async def status_error(self, ctx, error):
@@ -208,26 +218,27 @@ class ServerStatus(commands.Cog):
             else:
                 await ctx.send('⚠️ No se pudo localizar la carpeta del servidor para leer `server.properties`.')
 
+        # Comprobar autenticación RCON
+        rcon_pass = os.getenv('RCON_PASSWORD')
         try:
-            def sock_check():
-                s = socket.create_connection((rcon_host, int(rcon_port)), timeout=3)
-                s.close()
-            await asyncio.wait_for(asyncio.to_thread(sock_check), timeout=4)
-
-            # Comprobar autenticación RCON
-            rcon_pass = os.getenv('RCON_PASSWORD')
             if not rcon_pass:
+                # Sin contraseña solo se puede comprobar que el puerto responde
+                _, writer = await asyncio.wait_for(asyncio.open_connection(rcon_host, int(rcon_port)), timeout=4)
+                writer.close()
                 await ctx.send('⚠️ No hay `RCON_PASSWORD` en las variables de entorno; no se puede probar autenticación.')
                 return
 
-            def do_auth():
-                with MCRcon(rcon_host, rcon_pass, port=rcon_port) as mcr:
-                    return mcr.command('list')
-
-            resp = await asyncio.wait_for(asyncio.to_thread(do_auth), timeout=6)
-            await ctx.send('✅ RCON accesible y contraseña válida. Respuesta recibida.')
-        except Exception as e:
-            await report_props_and_hint(e)
+            # Sesión nueva a propósito: se prueban conexión y contraseña de verdad, no la sesión ya abierta
+            await self.rcon.discard(rcon_host, rcon_port)
+            started = time.monotonic()
+            await self.rcon.command(rcon_host, rcon_port, 'list', password=rcon_pass, timeout=6)
+            elapsed = (time.monotonic() - started) * 1000
+            session = await self.rcon.session(rcon_host, rcon_port)
+            rtt = await session.ping() * 1000
+            await ctx.send(f'✅ RCON accesible y contraseña válida. Respuesta recibida '
+                           f'(conexión + autenticación + comando: {elapsed:.0f} ms; ida y vuelta con la sesión abierta: {rtt:.0f} ms).')
+        except (RconError, OSError, asyncio.TimeoutError) as e:
+            await report_props_and_hint(str(e) or 'timeout')
 
 async def setup(bot):
     """Función para cargar el Cog en el bot."""
@@ -4,6 +4,12 @@ import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 from utils.config import Config
+from utils.ports import PortAllocator
+from utils.memory import MemoryPlanner
+from utils.rcon import RconPool
+from utils.log_index import LogIndexes
+from utils.resources import ResourceSampler
+from utils.status_cache import StatusService
 
 class CraftNPlayBot(commands.Bot):
     def __init__(self):
@@ -15,6 +21,18 @@ class CraftNPlayBot(commands.Bot):
         super().__init__(command_prefix='!', intents=intents)
 
         self.config_manager = Config()
+        # Puertos de juego/RCON/query compartidos por el instalador y la gestión de servidores
+        self.port_allocator = PortAllocator(self.config_manager)
+        # Presupuesto de RAM del host y perfiles de la JVM
+        self.memory_planner = MemoryPlanner(self.config_manager)
+        # Sesiones RCON persistentes, una por servidor
+        self.rcon_pool = RconPool(os.getenv('RCON_PASSWORD'))
+        # Índice de eventos de los logs de cada servidor (conexiones, lag, caídas)
+        self.log_indexes = LogIndexes(self.config_manager)
+        # CPU/RAM/hilos/disco de cada servidor en marcha, leídos de /proc en segundo plano
+        self.resource_sampler = ResourceSampler()
+        # Estado (ping) de cada servidor, sondeado en segundo plano y servido desde caché
+        self.status_service = StatusService(self.config_manager, self.rcon_pool)
         self.failed_cogs = [] # Lista de módulos caídos
 
     async def setup_hook(self):
@@ -37,6 +55,10 @@ class CraftNPlayBot(commands.Bot):
                     print(f'  ❌ ERROR EN {filename}: {error_msg}')
                     self.failed_cogs.append((filename, error_msg))
 
+    async def close(self):
+        await self.rcon_pool.close_all()
+        await super().close()
+
     async def on_ready(self):
         """Reporte de estado al iniciar."""
         print('\n' + '='*40)
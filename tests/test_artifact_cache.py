@@ -0,0 +1,60 @@
+import os
+import hashlib
+import tempfile
+import unittest
+
+from utils.artifact_cache import ArtifactCache
+
+DATA = b'server jar contents'
+SHA1 = hashlib.sha1(DATA).hexdigest()
+
+
+class _Result:
+    def __init__(self, size, digest):
+        self.size = size
+        self.digest = digest
+
+
+class FakeDownloader:
+    def __init__(self):
+        self.calls = 0
+
+    async def download(self, url, dest_path, progress=None, progress_interval=1.0, hash_algo=None):
+        self.calls += 1
+        with open(dest_path, 'wb') as f:
+            f.write(DATA)
+        return _Result(len(DATA), hashlib.sha1(DATA).hexdigest())
+
+
+class ArtifactCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = ArtifactCache(os.path.join(self.tmp.name, 'cache'))
+        self.downloader = FakeDownloader()
+
+    async def test_miss_then_hit(self):
+        first = os.path.join(self.tmp.name, 'a.jar')
+        second = os.path.join(self.tmp.name, 'b.jar')
+        _, hit = await self.cache.fetch(self.downloader, 'http://x/a.jar', SHA1, first, size=len(DATA))
+        self.assertFalse(hit)
+        _, hit = await self.cache.fetch(self.downloader, 'http://x/a.jar', SHA1, second, size=len(DATA))
+        self.assertTrue(hit)
+        self.assertEqual(self.downloader.calls, 1)
+        with open(second, 'rb') as f:
+            self.assertEqual(f.read(), DATA)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        # El índice guardado sobrevive a un reinicio
+        self.assertEqual(ArtifactCache(self.cache.root).stats()['entries'], 1)
+
+    async def test_failed_provision_is_not_a_hit(self):
+        await self.cache.fetch(self.downloader, 'http://x/a.jar', SHA1, os.path.join(self.tmp.name, 'a.jar'))
+        missing_dir = os.path.join(self.tmp.name, 'no-such-dir', 'b.jar')
+        with self.assertRaises(OSError):
+            await self.cache.fetch(self.downloader, 'http://x/a.jar', SHA1, missing_dir)
+        self.assertEqual(self.cache.hits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
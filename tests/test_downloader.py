@@ -0,0 +1,139 @@
+import os
+import time
+import socket
+import asyncio
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.downloader import Downloader, DownloadError
+
+BODY = os.urandom(256 * 1024)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Servidor de prueba: /file admite Range y puede cortar cada respuesta; /slow tarda en responder."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get('Range')))
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            if self.path.startswith('/slow'):
+                time.sleep(0.2)
+                self._send(200, b'x' * 1024)
+            elif self.path == '/file':
+                self._send_file()
+            else:
+                self._send(404, b'')
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self):
+        start = 0
+        rng = self.headers.get('Range')
+        if rng:
+            start = int(rng.split('=', 1)[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(BODY) - 1}/{len(BODY)}')
+        else:
+            self.send_response(200)
+        body = BODY[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        cut = self.server.cut_after
+        if cut and len(body) > cut:
+            # Cabecera con el tamaño completo pero la conexión se cierra a medias
+            self.wfile.write(body[:cut])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class DownloaderTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.active = 0
+        self.server.peak = 0
+        self.server.cut_after = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def _downloader(self, **kwargs):
+        downloader = Downloader(timeout=5, **kwargs)
+        self.addCleanup(downloader.close)
+        return downloader
+
+    async def test_resumes_with_range_from_partial_file(self):
+        dest = os.path.join(self.tmp.name, 'server.jar')
+        with open(dest + '.part', 'wb') as f:
+            f.write(BODY[:1000])
+
+        result = await self._downloader().download(self.base + '/file', dest, hash_algo='sha1')
+
+        self.assertEqual(self.server.requests, [('/file', 'bytes=1000-')])
+        self.assertEqual(result.status, 206)
+        self.assertEqual(result.digest, hashlib.sha1(BODY).hexdigest())
+        with open(dest, 'rb') as f:
+            self.assertEqual(f.read(), BODY)
+        self.assertFalse(os.path.exists(dest + '.part'))
+
+    async def test_retries_while_each_attempt_makes_progress(self):
+        # Cada respuesta se corta a los 64 KB: hacen falta 4 peticiones, más que max_retries
+        self.server.cut_after = 64 * 1024
+        dest = os.path.join(self.tmp.name, 'server.jar')
+
+        result = await self._downloader(max_retries=1, chunk_size=16 * 1024).download(self.base + '/file', dest)
+
+        ranges = [rng for _, rng in self.server.requests]
+        self.assertEqual(ranges, [None, 'bytes=65536-', 'bytes=131072-', 'bytes=196608-'])
+        self.assertEqual(result.resumed, 3)
+        with open(dest, 'rb') as f:
+            self.assertEqual(f.read(), BODY)
+
+    async def test_gives_up_after_retries_without_progress(self):
+        dest = os.path.join(self.tmp.name, 'server.jar')
+        # Nadie escucha en este puerto: cada intento falla sin avanzar
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        with self.assertRaises(DownloadError):
+            await self._downloader(max_retries=1).download(f'http://127.0.0.1:{port}/file', dest)
+
+    async def test_concurrent_downloads_are_capped(self):
+        downloader = self._downloader(max_concurrent=2)
+        await asyncio.gather(*[
+            downloader.download(f'{self.base}/slow/{i}', os.path.join(self.tmp.name, f'{i}.bin'))
+            for i in range(5)
+        ])
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(self.server.peak, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
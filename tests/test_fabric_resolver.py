@@ -0,0 +1,78 @@
+import os
+import asyncio
+import tempfile
+import unittest
+
+from utils.fabric_resolver import FabricResolver
+
+
+class FakeDownloader:
+    """Fabric meta falso: todas las combinaciones sirven el jar; `delays` retrasa algunas sondas."""
+
+    def __init__(self, loaders, installers, delays=None, missing=()):
+        self.loaders = loaders
+        self.installers = installers
+        self.delays = delays or {}
+        self.missing = set(missing)
+        self.probed = []
+        self.cancelled = []
+
+    async def fetch_json(self, url, timeout=None):
+        return self.installers if url.endswith('/installer') else self.loaders
+
+    async def probe(self, url, timeout=None):
+        key = tuple(url.split('/')[-4:-2])
+        self.probed.append(key)
+        try:
+            await asyncio.sleep(self.delays.get(key, 0.01))
+        except asyncio.CancelledError:
+            self.cancelled.append(key)
+            raise
+        return (404 if key in self.missing else 200), 1024
+
+
+class ResolveOrderTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.matrix = os.path.join(self.tmp.name, 'matrix.json')
+
+    def resolver(self, downloader):
+        return FabricResolver(downloader, self.matrix, concurrency=6, meta_url='http://meta', maven_url='http://maven')
+
+    async def test_slow_preferred_candidate_still_wins(self):
+        loaders = [{'loader': {'version': '0.16.5', 'stable': True}}]
+        installers = [{'version': '1.0.1', 'stable': True}, {'version': '1.0.0', 'stable': True}]
+        downloader = FakeDownloader(loaders, installers, delays={('0.16.5', '1.0.1'): 0.2})
+        combo = await self.resolver(downloader).resolve('1.21.1')
+        self.assertEqual((combo.loader, combo.installer), ('0.16.5', '1.0.1'))
+
+    async def test_stable_loader_preferred_over_faster_unstable(self):
+        loaders = [{'loader': {'version': '0.17.0-beta', 'stable': False}},
+                   {'loader': {'version': '0.16.5', 'stable': True}}]
+        installers = [{'version': '1.0.1', 'stable': True}]
+        downloader = FakeDownloader(loaders, installers, delays={('0.16.5', '1.0.1'): 0.2})
+        combo = await self.resolver(downloader).resolve('1.21.1')
+        self.assertEqual(combo.loader, '0.16.5')
+
+    async def test_worse_probes_cancelled_after_best_found(self):
+        loaders = [{'loader': {'version': v, 'stable': True}} for v in ('0.16.5', '0.16.4', '0.16.3')]
+        installers = [{'version': '1.0.1', 'stable': True}]
+        downloader = FakeDownloader(loaders, installers, delays={('0.16.4', '1.0.1'): 5, ('0.16.3', '1.0.1'): 5})
+        started = asyncio.get_running_loop().time()
+        combo = await self.resolver(downloader).resolve('1.21.1')
+        self.assertEqual(combo.loader, '0.16.5')
+        self.assertLess(asyncio.get_running_loop().time() - started, 1)
+        self.assertEqual(sorted(downloader.cancelled), [('0.16.3', '1.0.1'), ('0.16.4', '1.0.1')])
+
+    async def test_falls_back_to_next_candidate(self):
+        loaders = [{'loader': {'version': v, 'stable': True}} for v in ('0.16.5', '0.16.4')]
+        installers = [{'version': '1.0.1', 'stable': True}]
+        downloader = FakeDownloader(loaders, installers, missing={('0.16.5', '1.0.1')})
+        combo = await self.resolver(downloader).resolve('1.21.1')
+        self.assertEqual(combo.loader, '0.16.4')
+
+
+if __name__ == '__main__':
+    unittest.main()
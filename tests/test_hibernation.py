@@ -0,0 +1,89 @@
+import json
+import struct
+import asyncio
+import unittest
+
+from utils.hibernation import (SleepResponder, pack_packet, pack_string, pack_varint, read_packet,
+                               STATE_STATUS, STATE_LOGIN)
+
+PROTOCOL = 767
+STATUS = {'description': {'text': '💤 Dormido'}, 'players': {'max': 20, 'online': 0}, 'version': {'name': '1.21.1'}}
+
+
+def handshake(port, next_state, protocol=PROTOCOL):
+    return pack_packet(0x00, pack_varint(protocol) + pack_string('localhost') + struct.pack('>H', port)
+                       + pack_varint(next_state))
+
+
+class SleepResponderTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.logins = []
+
+        async def on_login(player):
+            self.logins.append(player)
+
+        self.responder = await SleepResponder(STATUS, on_login, 'Despertando, vuelve en un minuto',
+                                              timeout=2).start('127.0.0.1', 0)
+        self.addAsyncCleanup(self.responder.close)
+        self.port = self.responder._server.sockets[0].getsockname()[1]
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.addCleanup(writer.close)
+        return reader, writer
+
+    async def test_status_and_pong(self):
+        reader, writer = await self._connect()
+        writer.write(handshake(self.port, STATE_STATUS) + pack_packet(0x00))
+        await writer.drain()
+
+        packet_id, payload = await asyncio.wait_for(read_packet(reader), 2)
+        self.assertEqual(packet_id, 0x00)
+        status = json.loads(payload.string())
+        self.assertEqual(status['description'], STATUS['description'])
+        # Sin protocolo guardado se devuelve el del cliente
+        self.assertEqual(status['version'], {'name': '1.21.1', 'protocol': PROTOCOL})
+
+        token = struct.pack('>q', 123456789)
+        writer.write(pack_packet(0x01, token))
+        await writer.drain()
+        packet_id, payload = await asyncio.wait_for(read_packet(reader), 2)
+        self.assertEqual(packet_id, 0x01)
+        self.assertEqual(payload.data[payload.pos:], token)
+        self.assertEqual(self.responder.pings, 1)
+        self.assertEqual(self.logins, [])
+
+    async def test_login_is_kicked_and_wakes(self):
+        reader, writer = await self._connect()
+        writer.write(handshake(self.port, STATE_LOGIN) + pack_packet(0x00, pack_string('Steve') + bytes(16)))
+        await writer.drain()
+
+        packet_id, payload = await asyncio.wait_for(read_packet(reader), 2)
+        self.assertEqual(packet_id, 0x00)
+        self.assertEqual(json.loads(payload.string()), {'text': 'Despertando, vuelve en un minuto'})
+        # Tras la desconexión el respondedor cierra la conexión
+        self.assertEqual(await asyncio.wait_for(reader.read(), 2), b'')
+        self.assertEqual(self.logins, ['Steve'])
+
+    async def _assert_rejected(self, data):
+        reader, writer = await self._connect()
+        writer.write(data)
+        await writer.drain()
+        self.assertEqual(await asyncio.wait_for(reader.read(), 2), b'')
+        self.assertEqual(self.logins, [])
+        self.assertEqual(self.responder.pings, 0)
+
+    async def test_rejects_overlong_varint(self):
+        await self._assert_rejected(b'\xff' * 6)
+
+    async def test_rejects_invalid_length(self):
+        await self._assert_rejected(pack_varint(0))
+        await self._assert_rejected(pack_varint(1 << 20) + b'\x00' * 16)
+
+    async def test_rejects_legacy_ping(self):
+        await self._assert_rejected(b'\xfe\x01')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+
+from utils.jobs import JobQueue, QUEUED, CANCELLED, INTERRUPTED, DONE
+
+
+class JobQueueTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'jobs.json')
+
+    async def test_queued_jobs_survive_restart(self):
+        first = JobQueue(self.path, workers=1)
+        first.register('install', None)
+        a = first.submit('install', {'n': 1})
+        b = first.submit('install', {'n': 2})
+        # `a` estaba en marcha cuando se cayó el bot
+        a.status = 'running'
+        first.save()
+
+        ran = []
+
+        async def runner(job):
+            ran.append(job.id)
+
+        second = JobQueue(self.path, workers=1)
+        second.register('install', runner)
+        self.assertEqual(second.get(a.id).status, INTERRUPTED)
+        self.assertEqual([j.id for j in second.restored], [b.id])
+        second.start()
+        for _ in range(50):
+            if second.get(b.id).status == DONE:
+                break
+            await asyncio.sleep(0.01)
+        await second.stop()
+        self.assertEqual(ran, [b.id])
+        with open(self.path, encoding='utf-8') as f:
+            saved = {j['id']: j['status'] for j in json.load(f)['jobs']}
+        self.assertEqual(saved[b.id], DONE)
+
+    async def test_cancel_queued_job_runs_hook(self):
+        cancelled = []
+
+        async def on_cancel(job):
+            cancelled.append(job.id)
+
+        queue = JobQueue(self.path, workers=1)
+        queue.register('install', None, on_cancel=on_cancel)
+        job = queue.submit('install', {})
+        self.assertEqual(job.status, QUEUED)
+        self.assertTrue(queue.cancel(job.id))
+        await asyncio.sleep(0)
+        self.assertEqual(job.status, CANCELLED)
+        self.assertEqual(cancelled, [job.id])
+
+
+if __name__ == '__main__':
+    unittest.main()
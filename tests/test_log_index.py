@@ -0,0 +1,100 @@
+import os
+import json
+import tempfile
+import unittest
+
+from utils.log_index import LogIndex
+
+
+class LogIndexJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.server = self.tmp.name
+        os.makedirs(os.path.join(self.server, 'logs'))
+        self.latest = os.path.join(self.server, 'logs', 'latest.log')
+        self.write('[10:00:00] [Server thread/INFO]: Done (3.2s)! For help, type "help"\n')
+        self.clock = 0
+
+    def write(self, text):
+        with open(self.latest, 'a', encoding='utf-8') as f:
+            f.write(text)
+
+    def join(self, player):
+        self.clock += 1
+        self.write(f'[10:{self.clock // 60:02d}:{self.clock % 60:02d}] [Server thread/INFO]: {player} joined the game\n')
+
+    def index(self, compact_events=5000):
+        return LogIndex(self.server, retention_days=365, compact_events=compact_events)
+
+    def reload(self):
+        """Índice nuevo (como tras reiniciar el bot), cargado desde disco."""
+        index = self.index()
+        index.update()
+        return index
+
+    def test_updates_append_to_journal(self):
+        index = self.index()
+        index.update()
+        snapshot = os.path.getmtime(index.path), os.path.getsize(index.path)
+
+        self.join('Alex')
+        self.assertEqual(len(index.update()), 1)
+        self.join('Steve')
+        self.assertEqual(len(index.update()), 1)
+        # Sin eventos nuevos no se escribe nada
+        self.assertEqual(index.update(), [])
+
+        self.assertEqual((os.path.getmtime(index.path), os.path.getsize(index.path)), snapshot)
+        with open(index.journal_path, encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)['seq'] for line in f], [1, 2])
+
+        reloaded = self.reload()
+        self.assertEqual([e[1] for e in reloaded.events()], ['start', 'join', 'join'])
+        self.assertEqual(set(reloaded.online), {'Alex', 'Steve'})
+
+    def test_compacts_after_threshold(self):
+        index = self.index(compact_events=3)
+        index.update()
+        for player in ('a', 'b', 'c'):
+            self.join(player)
+            index.update()
+        self.assertFalse(os.path.exists(index.journal_path))
+        with open(index.path, encoding='utf-8') as f:
+            self.assertEqual(len(json.load(f)['events']), 4)
+
+        self.join('d')
+        index.update()
+        self.assertEqual(len(self.reload().events()), 5)
+
+    def test_journal_lines_already_in_snapshot_are_skipped(self):
+        index = self.index()
+        index.update()
+        self.join('Alex')
+        index.update()
+        with open(index.journal_path, encoding='utf-8') as f:
+            line = f.read()
+        # Caída entre escribir el JSON y vaciar el diario
+        index.save()
+        with open(index.journal_path, 'w', encoding='utf-8') as f:
+            f.write(line)
+        self.assertEqual(len(self.reload().events()), 2)
+
+    def test_torn_journal_line_forces_compaction(self):
+        index = self.index()
+        index.update()
+        self.join('Alex')
+        index.update()
+        with open(index.journal_path, 'a', encoding='utf-8') as f:
+            f.write('{"seq":2,"offs')
+
+        reloaded = self.index()
+        self.join('Steve')
+        reloaded.update()
+        self.assertFalse(os.path.exists(reloaded.journal_path))
+        self.assertEqual([e[2] for e in self.reload().events(kinds=['join'])], ['Alex', 'Steve'])
+
+
+if __name__ == '__main__':
+    unittest.main()
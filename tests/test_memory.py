@@ -0,0 +1,25 @@
+import unittest
+
+from utils.memory import MemoryPlanner, MIN_HEAP_MB
+
+
+class MemoryPlanTest(unittest.TestCase):
+
+    def test_heap_is_reduced_to_fit_budget(self):
+        planner = MemoryPlanner(budget_mb=3000)
+        plan = planner.plan('fabric')
+        self.assertEqual(plan.heap_mb, 2048)
+        self.assertLessEqual(planner.footprint_mb(plan.heap_mb), 3000)
+        self.assertIn('Heap reducido', plan.notes[0])
+
+    def test_budget_below_minimum_heap_is_reported(self):
+        planner = MemoryPlanner(budget_mb=1200)
+        plan = planner.plan('fabric')
+        self.assertEqual(plan.heap_mb, MIN_HEAP_MB)
+        self.assertGreater(planner.footprint_mb(plan.heap_mb), 1200)
+        self.assertNotIn('Heap reducido', plan.notes[0])
+        self.assertIn('no alcanza ni para el heap mínimo', plan.notes[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import unittest
+
+from utils.resources import ResourceSampler, TUNNEL_TARGET, proc_available
+
+
+@unittest.skipUnless(proc_available(), 'necesita /proc')
+class ResourceSamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sampler = ResourceSampler(interval=5, points=10, rescan=12)
+
+    def test_stopped_servers_are_removed(self):
+        self.sampler.sample({'a': os.getpid()})
+        self.sampler.sample({'a': os.getpid()})
+        self.assertIsNotNone(self.sampler.get('a'))
+        self.assertIn('{kind="server",server="a"}', self.sampler.prometheus())
+
+        self.sampler.sample({})
+        self.assertEqual(self.sampler.stats, {})
+        self.assertIsNone(self.sampler.get('a'))
+        self.assertNotIn('server="a"', self.sampler.prometheus())
+
+    def test_tunnel_does_not_collide_with_a_server_named_playit(self):
+        for _ in range(2):
+            self.sampler.sample({'playit': os.getpid(), TUNNEL_TARGET: os.getppid()})
+        self.assertEqual(self.sampler.get('playit').root, os.getpid())
+        self.assertEqual(self.sampler.get(TUNNEL_TARGET).root, os.getppid())
+        text = self.sampler.prometheus()
+        self.assertIn('cnp_process_count{kind="server",server="playit"}', text)
+        self.assertIn('cnp_process_count{kind="tunnel",server="playit"}', text)
+
+    def test_get_returns_a_detached_copy(self):
+        for _ in range(3):
+            self.sampler.sample({'a': os.getpid()})
+        snapshot = self.sampler.get('a')
+        points = len(snapshot.times)
+        self.sampler.sample({'a': os.getpid()})
+        self.assertEqual(len(snapshot.times), points)
+        self.assertEqual(len(self.sampler.get('a').times), points + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from utils.log_index import LogIndex
+from utils.templates import clone_tree
+
+
+class CloneTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.src = os.path.join(self.tmp.name, 'plantilla')
+        os.makedirs(os.path.join(self.src, 'logs'))
+        os.makedirs(os.path.join(self.src, 'world'))
+        with open(os.path.join(self.src, 'server.properties'), 'w') as f:
+            f.write('motd=Plantilla\n')
+        with open(os.path.join(self.src, 'world', 'level.dat'), 'wb') as f:
+            f.write(b'nivel')
+        with open(os.path.join(self.src, 'logs', 'latest.log'), 'w') as f:
+            f.write('[10:00:00] [Server thread/INFO]: Done (3.2s)! For help, type "help"\n'
+                    '[10:00:05] [Server thread/INFO]: Steve joined the game\n'
+                    '[10:00:09] [Server thread/INFO]: <Steve> hola\n')
+        index = LogIndex(self.src)
+        index.update()
+        # Un evento más en el diario, además del JSON completo
+        with open(os.path.join(self.src, 'logs', 'latest.log'), 'a') as f:
+            f.write('[10:00:12] [Server thread/INFO]: Alex joined the game\n')
+        index.update()
+        self.assertTrue(os.path.exists(index.path))
+        self.assertTrue(os.path.exists(index.journal_path))
+
+    def test_clone_copies_world_but_not_activity_history(self):
+        dst = os.path.join(self.tmp.name, 'clon')
+        clone_tree(self.src, dst)
+
+        self.assertTrue(os.path.exists(os.path.join(dst, 'server.properties')))
+        self.assertTrue(os.path.exists(os.path.join(dst, 'world', 'level.dat')))
+        self.assertEqual(sorted(os.listdir(dst)), ['server.properties', 'world'])
+
+        clone = LogIndex(dst)
+        clone.update()
+        self.assertEqual(clone.events(), [])
+        self.assertEqual(clone.online, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
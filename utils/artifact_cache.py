@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import stat
+import threading
+
+from utils.errors import log_exception
+
+# ioctl FICLONE de Linux (copia reflink en btrfs/XFS)
+FICLONE = 0x40049409
+
+
+class ArtifactError(Exception):
+    pass
+
+
+def _reflink(src, dst):
+    """Intenta una copia copy-on-write (reflink). Devuelve True si funcionó."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+
+def link_or_copy(src, dst):
+    """
+    Materializa `src` en `dst` de la forma más barata posible:
+    hard link, luego reflink (copy-on-write) y, en último caso, copia real.
+    Devuelve el método usado: 'hardlink', 'reflink' o 'copy'.
+    """
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+    if _reflink(src, dst):
+        return 'reflink'
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+class ArtifactCache:
+    """
+    Almacén local de artefactos direccionado por contenido (SHA-1).
+
+    Los ficheros viven en `<root>/objects/<ab>/<sha1>` en modo solo lectura y
+    se aprovisionan en las carpetas de servidor por hard link (o reflink/copia
+    si el sistema de ficheros no lo permite). El índice `index.json` guarda
+    tamaño y último uso de cada objeto para desalojar por LRU cuando se supera
+    el presupuesto de disco.
+    """
+
+    def __init__(self, root, max_bytes=5 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.objects_dir = os.path.join(root, 'objects')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.index_path = os.path.join(root, 'index.json')
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._locks = {}
+        # `entries` se modifica desde hilos (provision/add en to_thread): índice y guardado bajo este lock
+        self._index_lock = threading.RLock()
+        self.load()
+
+    # --- Persistencia del índice ---
+
+    def load(self):
+        try:
+            os.makedirs(self.objects_dir, exist_ok=True)
+            os.makedirs(self.tmp_dir, exist_ok=True)
+        except OSError:
+            pass
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        self.entries = data.get('entries', {}) or {}
+        self.hits = int(data.get('hits', 0))
+        self.misses = int(data.get('misses', 0))
+        # Descartar entradas cuyo objeto ya no existe en disco
+        for sha1 in [k for k in self.entries if not os.path.exists(self.object_path(k))]:
+            del self.entries[sha1]
+
+    def save(self):
+        tmp_path = self.index_path + '.tmp'
+        with self._index_lock:
+            data = {'entries': self.entries, 'hits': self.hits, 'misses': self.misses}
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.index_path)
+            except (OSError, TypeError, ValueError) as e:
+                log_exception(e, context=f'Could not save artifact index {self.index_path}')
+
+    # --- Consultas ---
+
+    def object_path(self, sha1):
+        sha1 = sha1.lower()
+        return os.path.join(self.objects_dir, sha1[:2], sha1)
+
+    def contains(self, sha1):
+        entry = self.entries.get(sha1.lower())
+        if not entry:
+            return False
+        path = self.object_path(sha1)
+        try:
+            return os.path.getsize(path) == entry.get('size')
+        except OSError:
+            return False
+
+    def total_bytes(self):
+        with self._index_lock:
+            return sum(e.get('size', 0) for e in self.entries.values())
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes(),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0,
+        }
+
+    # --- Operaciones ---
+
+    def _touch(self, sha1):
+        with self._index_lock:
+            entry = self.entries.get(sha1)
+            if entry is not None:
+                entry['last_used'] = time.time()
+                entry['uses'] = entry.get('uses', 0) + 1
+
+    def provision(self, sha1, dest_path):
+        """Coloca el objeto `sha1` en `dest_path`. Devuelve el método usado."""
+        sha1 = sha1.lower()
+        if not self.contains(sha1):
+            raise ArtifactError(f'El artefacto {sha1} no está en la caché')
+        method = link_or_copy(self.object_path(sha1), dest_path)
+        if method != 'hardlink':
+            # Las copias independientes pueden ser escribibles
+            os.chmod(dest_path, stat.S_IREAD | stat.S_IWRITE)
+        self._touch(sha1)
+        self.save()
+        return method
+
+    def add(self, src_path, sha1, name=None):
+        """Mueve `src_path` (ya verificado) dentro del almacén."""
+        sha1 = sha1.lower()
+        obj_path = self.object_path(sha1)
+        os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+        os.replace(src_path, obj_path)
+        # Solo lectura: un hard link compartido no debe modificarse desde un servidor
+        os.chmod(obj_path, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+        with self._index_lock:
+            self.entries[sha1] = {
+                'size': os.path.getsize(obj_path),
+                'name': name,
+                'added': time.time(),
+                'last_used': time.time(),
+                'uses': 0,
+            }
+            self.evict(keep=sha1)
+        self.save()
+
+    def evict(self, keep=None):
+        """Desaloja objetos menos usados recientemente hasta entrar en el presupuesto."""
+        removed = []
+        with self._index_lock:
+            by_age = sorted(self.entries.items(), key=lambda kv: kv[1].get('last_used', 0))
+            total = self.total_bytes()
+        for sha1, entry in by_age:
+            if total <= self.max_bytes:
+                break
+            if sha1 == keep:
+                continue
+            path = self.object_path(sha1)
+            try:
+                os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+                os.remove(path)
+            except OSError:
+                pass
+            total -= entry.get('size', 0)
+            with self._index_lock:
+                self.entries.pop(sha1, None)
+            removed.append(sha1)
+        return removed
+
+    async def fetch(self, downloader, url, sha1, dest_path, size=None, name=None,
+                    progress=None, progress_interval=1.0):
+        """
+        Aprovisiona `dest_path` con el artefacto `sha1`, descargándolo solo si
+        no está en la caché. El SHA-1 se calcula durante la descarga y se
+        compara con el del manifest. Devuelve (método, hit).
+        """
+        sha1 = sha1.lower()
+        lock = self._locks.setdefault(sha1, asyncio.Lock())
+        async with lock:
+            if self.contains(sha1):
+                method = await asyncio.to_thread(self.provision, sha1, dest_path)
+                # Solo cuenta como acierto si de verdad se aprovisionó desde la caché
+                self.hits += 1
+                return method, True
+
+            self.misses += 1
+            tmp_path = os.path.join(self.tmp_dir, sha1)
+            result = await downloader.download(url, tmp_path, progress=progress,
+                                               progress_interval=progress_interval, hash_algo='sha1')
+            if result.digest != sha1 or (size is not None and result.size != int(size)):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise ArtifactError(f'Verificación fallida para {name or url}: '
+                                    f'sha1={result.digest} tamaño={result.size} '
+                                    f'(esperado sha1={sha1} tamaño={size})')
+            # Mover, chmod, desalojar y guardar el índice tocan disco: fuera del loop
+            await asyncio.to_thread(self.add, tmp_path, sha1, name)
+            method = await asyncio.to_thread(self.provision, sha1, dest_path)
+            return method, False
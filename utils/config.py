@@ -2,6 +2,7 @@
 
 import os
 import json
+import shutil
 
 class Config:
     def __init__(self):
@@ -9,8 +10,17 @@ class Config:
         self.rcon_password = os.getenv('RCON_PASSWORD')
         self.servers_file = 'servers.json'
         self.default_server = None
+        # Agente de Playit.gg: ruta (PLAYIT_PATH, `off` para no usar túnel) y argumentos extra
+        self.playit_path = os.getenv('PLAYIT_PATH') or self.default_playit_path()
+        self.playit_args = os.getenv('CNP_PLAYIT_ARGS', '').split()
         self.load_servers()
 
+    @staticmethod
+    def default_playit_path():
+        if os.name == 'nt':
+            return 'C:/Program Files/playit_gg/bin/playit.exe'
+        return shutil.which('playit') or '/usr/local/bin/playit'
+
     def load_servers(self):
         # Ensure file exists with a sane default
         if not os.path.exists(self.servers_file):
@@ -85,12 +95,14 @@ class Config:
     def get_default_server(self):
         return self.default_server
 
-    def add_server(self, name, path, script, rcon_port):
+    def add_server(self, name, path, script, rcon_port, **extra):
         self.servers[name] = {
             'path': path,
             'script': script,
             'rcon_port': rcon_port
         }
+        # Datos opcionales (p. ej. 'version', 'type') que usan `!list` y otros comandos
+        self.servers[name].update({k: v for k, v in extra.items() if v is not None})
         self.save_servers()
 
     def set_default_server(self, name: str):
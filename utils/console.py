@@ -0,0 +1,171 @@
+import os
+import re
+import time
+import asyncio
+from collections import deque
+
+import discord
+
+from utils.errors import log_exception
+
+# Límite de un mensaje de Discord (2000) menos el bloque de código y la cabecera
+MAX_MESSAGE = 1900
+# Colores/estilos ANSI que algunos servidores (Paper, Forge) escriben en la consola
+ANSI_RE = re.compile(r'\x1b\[[0-9;?]*[ -/]*[@-~]')
+
+
+def clean_line(raw, max_len):
+    line = ANSI_RE.sub('', raw.decode('utf-8', errors='replace')).rstrip('\r\n')
+    if len(line) > max_len:
+        line = line[:max_len] + '…'
+    return line
+
+
+class ConsoleBuffer:
+    """
+    Últimas líneas de la consola (stdout + stderr) de un servidor.
+
+    Memoria fija: como mucho `max_lines` líneas de `max_len` caracteres; las
+    antiguas se descartan solas (deque con maxlen). Cada línea lleva un
+    número de secuencia creciente para que quien la siga (el espejo de
+    Discord) sepa qué le falta y cuántas se perdió si se quedó atrás.
+    """
+
+    def __init__(self, max_lines=1000, max_len=1024):
+        self.max_len = max_len
+        self.lines = deque(maxlen=max_lines)
+        # Número de secuencia de la siguiente línea
+        self.seq = 0
+        self.updated = asyncio.Event()
+        # Funciones llamadas con cada línea nueva (p. ej. para detectar mensajes concretos)
+        self.listeners = []
+
+    def append(self, line):
+        self.lines.append((self.seq, time.time(), line))
+        self.seq += 1
+        self.updated.set()
+        for listener in self.listeners:
+            try:
+                listener(line)
+            except Exception as e:
+                log_exception(e, context='Console listener failed')
+
+    def tail(self, n):
+        n = max(0, min(n, len(self.lines)))
+        return [line for _, _, line in list(self.lines)[len(self.lines) - n:]]
+
+    def since(self, seq):
+        """(líneas desde `seq`, líneas perdidas porque ya salieron del buffer, siguiente seq)."""
+        first = self.lines[0][0] if self.lines else self.seq
+        lost = max(0, first - seq)
+        new = [line for s, _, line in self.lines if s >= seq]
+        return new, lost, self.seq
+
+    async def pump(self, stream, name=None):
+        """Lee `stream` línea a línea hasta EOF. Nunca deja de leer: una tubería llena bloquearía al servidor."""
+        while True:
+            try:
+                raw = await stream.readline()
+            except ValueError:
+                # Línea más larga que el límite del StreamReader: se lee el trozo y se sigue
+                raw = await stream.read(64 * 1024)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                log_exception(e, context=f'Console stream of {name or "server"} failed')
+                return
+            if not raw:
+                return
+            self.append(clean_line(raw, self.max_len))
+
+
+def read_log_tail(path, n, max_len=1024, block=64 * 1024):
+    """Últimas `n` líneas de un fichero de log sin leerlo entero (para servidores sin consola capturada)."""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            data = b''
+            while end > 0 and data.count(b'\n') <= n:
+                start = max(0, end - block)
+                f.seek(start)
+                data = f.read(end - start) + data
+                end = start
+    except OSError:
+        return None
+    return [clean_line(raw, max_len) for raw in data.splitlines()[-n:]] if n > 0 else []
+
+
+def code_block(lines, header=''):
+    """Bloque de código con las últimas líneas que caben en un mensaje."""
+    body, used, kept = [], len(header) + 10, 0
+    for line in reversed(lines):
+        # Que una línea con ``` no cierre el bloque antes de tiempo
+        line = line.replace('```', '`\u200b``')
+        if used + len(line) + 1 > MAX_MESSAGE:
+            break
+        body.append(line)
+        used += len(line) + 1
+        kept += 1
+    body.reverse()
+    if kept < len(lines):
+        header = (header + ' ' if header else '') + f'(+{len(lines) - kept} líneas anteriores omitidas)'
+    return (header + '\n' if header else '') + '```\n' + ('\n'.join(body) or ' ') + '\n```'
+
+
+class ConsoleMirror:
+    """
+    Espejo en vivo de un `ConsoleBuffer` en un canal de Discord.
+
+    Como `ProgressReporter`: la tarea se despierta cuando hay líneas nuevas,
+    espera `interval` segundos para juntar las que lleguen y las envía en un
+    único mensaje, así que un servidor que escribe cientos de líneas por
+    segundo genera como mucho un mensaje cada `interval`. Si Discord falla o
+    limita, se duplica el intervalo (hasta `max_interval`) y lo que no quepa
+    se resume como líneas omitidas en lugar de acumularse.
+    """
+
+    def __init__(self, name, buffer, channel, interval=3.0, max_interval=60.0):
+        self.name = name
+        self.buffer = buffer
+        self.channel = channel
+        self.interval = max(2.0, interval)
+        self.max_interval = max_interval
+        self._delay = self.interval
+        self._seq = buffer.seq
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._seq = self.buffer.seq
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            if self.buffer.seq == self._seq:
+                self.buffer.updated.clear()
+                await self.buffer.updated.wait()
+            await asyncio.sleep(self._delay)
+            await self.flush()
+
+    async def flush(self):
+        lines, lost, self._seq = self.buffer.since(self._seq)
+        if not lines and not lost:
+            return
+        header = f'🖥️ `{self.name}`'
+        if lost:
+            header += f' (⚠️ {lost} líneas perdidas)'
+        try:
+            await self.channel.send(code_block(lines, header))
+            self._delay = self.interval
+        except discord.HTTPException as e:
+            self._delay = min(self.max_interval, self._delay * 2)
+            log_exception(e, context=f'Console mirror for {self.name} failed; next in {self._delay:.0f}s')
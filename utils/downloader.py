@@ -0,0 +1,316 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+USER_AGENT = 'CraftNPlay/Installer'
+CHUNK_SIZE = 256 * 1024
+
+
+class DownloadError(Exception):
+    """Error de descarga. `status` guarda el código HTTP si lo hubo."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class DownloadProgress:
+    """Instantánea del progreso de una descarga (bytes, velocidad y ETA)."""
+
+    def __init__(self, url, downloaded, total, started, done=False):
+        self.url = url
+        self.downloaded = downloaded
+        self.total = total
+        self.elapsed = max(time.monotonic() - started, 1e-6)
+        self.done = done
+
+    @property
+    def rate(self):
+        """Bytes por segundo desde el inicio de la descarga."""
+        return self.downloaded / self.elapsed
+
+    @property
+    def eta(self):
+        """Segundos restantes estimados, o None si no se conoce el tamaño."""
+        if not self.total or self.rate <= 0:
+            return None
+        return max(self.total - self.downloaded, 0) / self.rate
+
+    @property
+    def percent(self):
+        if not self.total:
+            return None
+        return min(100.0, self.downloaded * 100.0 / self.total)
+
+
+class DownloadResult:
+    def __init__(self, url, path, size, status, elapsed, resumed=0, digest=None, hash_seconds=0.0):
+        self.url = url
+        self.path = path
+        self.size = size
+        self.status = status
+        self.elapsed = elapsed
+        # Número de veces que se reanudó con Range tras un corte
+        self.resumed = resumed
+        # Hash hexadecimal calculado mientras se descargaba (si se pidió)
+        self.digest = digest
+        # Tiempo de CPU dedicado al hash dentro del streaming
+        self.hash_seconds = hash_seconds
+
+
+def format_bytes(n):
+    """Formatea un tamaño en bytes de forma legible (KB, MB, GB)."""
+    n = float(n or 0)
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f'{n:.0f} {unit}' if unit == 'B' else f'{n:.1f} {unit}'
+        n /= 1024
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return '?'
+    seconds = int(seconds)
+    if seconds >= 60:
+        return f'{seconds // 60}m {seconds % 60:02d}s'
+    return f'{seconds}s'
+
+
+def describe_progress(p):
+    """Línea corta de progreso para mostrar en Discord."""
+    if p.total:
+        return (f'{format_bytes(p.downloaded)}/{format_bytes(p.total)} ({p.percent:.0f}%) '
+                f'a {format_bytes(p.rate)}/s, ETA {format_eta(p.eta)}')
+    return f'{format_bytes(p.downloaded)} a {format_bytes(p.rate)}/s'
+
+
+class Downloader:
+    """
+    Motor de descargas que nunca bloquea el event loop.
+
+    Las peticiones HTTP se hacen con `requests` en un pool de hilos propio
+    (no el executor por defecto), con una `Session` por hilo y host para
+    reutilizar conexiones (una `Session` no es segura entre hilos). Las
+    descargas se escriben en `<destino>.part` por bloques y, si la conexión
+    se corta, se reanudan con una cabecera `Range`.
+    """
+
+    def __init__(self, max_concurrent=3, chunk_size=CHUNK_SIZE, timeout=15, max_retries=3):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        # Hilos extra para peticiones cortas (JSON) mientras hay descargas en curso
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent + 4,
+                                            thread_name_prefix='cnp-download')
+        # Sesiones del hilo actual por (esquema, host); `_sessions` las guarda todas para cerrarlas
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # Contadores para diagnóstico y benchmarks
+        self.request_count = 0
+        self.bytes_downloaded = 0
+        self.hash_seconds = 0.0
+
+    def _session(self, url):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        sessions = getattr(self._local, 'sessions', None)
+        if sessions is None:
+            sessions = self._local.sessions = {}
+        session = sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            session.headers['User-Agent'] = USER_AGENT
+            sessions[key] = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def _count_request(self):
+        with self._stats_lock:
+            self.request_count += 1
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    # --- Peticiones cortas ---
+
+    def _get_sync(self, url, headers, timeout):
+        self._count_request()
+        try:
+            resp = self._session(url).get(url, headers=headers or {}, timeout=timeout or self.timeout)
+        except requests.RequestException as e:
+            raise DownloadError(f'Error de red al acceder a {url}: {e}') from e
+        return resp
+
+    async def get(self, url, headers=None, timeout=None):
+        """GET simple; devuelve el `requests.Response` completo (sin streaming)."""
+        return await self._run(self._get_sync, url, headers, timeout)
+
+    async def fetch_json(self, url, headers=None, timeout=None):
+        """Descarga y parsea un JSON. Lanza `DownloadError` si el HTTP no es 200."""
+        resp = await self.get(url, headers=headers, timeout=timeout)
+        if resp.status_code != 200:
+            raise DownloadError(f'HTTP {resp.status_code} para {url}', status=resp.status_code)
+        try:
+            return resp.json()
+        except ValueError as e:
+            raise DownloadError(f'JSON inválido en {url}: {e}', status=resp.status_code) from e
+
+    def _probe_sync(self, url, timeout):
+        self._count_request()
+        try:
+            # GET en streaming cerrado tras las cabeceras: no todos los endpoints aceptan HEAD
+            with self._session(url).get(url, stream=True, timeout=timeout or self.timeout) as resp:
+                length = resp.headers.get('Content-Length')
+                return resp.status_code, int(length) if length and length.isdigit() else None
+        except requests.RequestException as e:
+            raise DownloadError(f'Error de red al acceder a {url}: {e}') from e
+
+    async def probe(self, url, timeout=None):
+        """Comprueba si `url` está disponible sin descargar el cuerpo. Devuelve (status, tamaño)."""
+        return await self._run(self._probe_sync, url, timeout)
+
+    # --- Descargas de ficheros ---
+
+    def _download_sync(self, url, dest_path, emit, cancel, progress_interval, hash_algo):
+        part_path = dest_path + '.part'
+        started = time.monotonic()
+        resumed = 0
+        attempts = 0
+        total = None
+        status = None
+        last_emit = 0.0
+        hasher = hashlib.new(hash_algo) if hash_algo else None
+        hash_time = 0.0
+
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if hasher and offset:
+            # Un .part de un intento anterior: hay que incluir sus bytes en el hash
+            with open(part_path, 'rb') as prev:
+                for block in iter(lambda: prev.read(self.chunk_size), b''):
+                    hasher.update(block)
+
+        while True:
+            headers = {}
+            attempt_offset = offset
+            if offset:
+                headers['Range'] = f'bytes={offset}-'
+            self._count_request()
+            try:
+                with self._session(url).get(url, headers=headers, stream=True, timeout=self.timeout) as resp:
+                    status = resp.status_code
+                    if status == 416 and offset:
+                        # El .part no encaja con el recurso remoto: empezar de cero
+                        os.remove(part_path)
+                        offset = 0
+                        hasher = hashlib.new(hash_algo) if hash_algo else None
+                        continue
+                    if status not in (200, 206):
+                        raise DownloadError(f'HTTP {status} para {url}', status=status)
+                    if status == 200 and offset:
+                        # El servidor ignoró el Range; se reescribe entero
+                        offset = 0
+                        hasher = hashlib.new(hash_algo) if hash_algo else None
+                    length = resp.headers.get('Content-Length')
+                    total = offset + int(length) if length and length.isdigit() else None
+
+                    mode = 'ab' if offset else 'wb'
+                    with open(part_path, mode) as out_f:
+                        for chunk in resp.iter_content(chunk_size=self.chunk_size):
+                            if cancel.is_set():
+                                raise DownloadError(f'Descarga cancelada: {url}')
+                            if not chunk:
+                                continue
+                            out_f.write(chunk)
+                            if hasher:
+                                t0 = time.perf_counter()
+                                hasher.update(chunk)
+                                hash_time += time.perf_counter() - t0
+                            offset += len(chunk)
+                            with self._stats_lock:
+                                self.bytes_downloaded += len(chunk)
+                            now = time.monotonic()
+                            if emit and now - last_emit >= progress_interval:
+                                last_emit = now
+                                emit(DownloadProgress(url, offset, total, started))
+
+                if total is not None and offset < total:
+                    raise requests.ConnectionError(f'Conexión cerrada en {offset}/{total} bytes')
+                break
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                if offset > attempt_offset:
+                    # El tramo avanzó: solo cuentan los cortes seguidos sin progreso
+                    attempts = 0
+                attempts += 1
+                if attempts > self.max_retries:
+                    raise DownloadError(f'Descarga interrumpida tras {attempts} intentos: {e}', status=status) from e
+                resumed += 1
+                time.sleep(min(2 ** attempts * 0.25, 4))
+                continue
+            except DownloadError:
+                if status is not None and status not in (200, 206) and os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+
+        os.replace(part_path, dest_path)
+        with self._stats_lock:
+            self.hash_seconds += hash_time
+        if emit:
+            emit(DownloadProgress(url, offset, total or offset, started, done=True))
+        return DownloadResult(url, dest_path, offset, status, time.monotonic() - started, resumed,
+                              digest=hasher.hexdigest() if hasher else None, hash_seconds=hash_time)
+
+    async def download(self, url, dest_path, progress=None, progress_interval=1.0, hash_algo=None):
+        """
+        Descarga `url` en `dest_path` sin bloquear el loop.
+
+        `progress` (opcional) se llama en el loop con un `DownloadProgress`
+        como mucho cada `progress_interval` segundos; puede ser una corrutina.
+        El número de descargas simultáneas está limitado por `max_concurrent`.
+        Con `hash_algo` (p. ej. 'sha1') el hash se calcula durante el streaming
+        y queda en `DownloadResult.digest`, sin una segunda lectura del fichero.
+        """
+        loop = asyncio.get_running_loop()
+        cancel = threading.Event()
+
+        def deliver(snapshot):
+            try:
+                res = progress(snapshot)
+                if asyncio.iscoroutine(res):
+                    asyncio.ensure_future(res)
+            except Exception:
+                pass
+
+        emit = None
+        if progress is not None:
+            def emit(snapshot):
+                loop.call_soon_threadsafe(deliver, snapshot)
+
+        async with self._semaphore:
+            future = loop.run_in_executor(self._executor, self._download_sync,
+                                          url, dest_path, emit, cancel, progress_interval, hash_algo)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Avisar al hilo para que suelte el fichero y la conexión
+                cancel.set()
+                raise
+
+    def close(self):
+        with self._sessions_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import asyncio
+
+from utils.downloader import DownloadError
+
+FABRIC_META_URL = 'https://meta.fabricmc.net'
+FABRIC_MAVEN_URL = 'https://maven.fabricmc.net'
+
+
+def normalize_loader_version(v):
+    """Extrae la versión de loader de las distintas formas que devuelve Fabric meta."""
+    if isinstance(v, str):
+        return v
+    if isinstance(v, dict):
+        # Prefer nested 'loader' object -> 'version'
+        loader_obj = v.get('loader')
+        if isinstance(loader_obj, dict):
+            ver = loader_obj.get('version')
+            if isinstance(ver, str):
+                return ver
+            maven = loader_obj.get('maven')
+            if isinstance(maven, str):
+                parts = maven.split(':')
+                if parts:
+                    return parts[-1]
+
+        # Older/alternate shapes: top-level 'version' or 'maven' keys
+        if 'version' in v and isinstance(v['version'], str):
+            return v['version']
+        if 'maven' in v and isinstance(v['maven'], str):
+            parts = v['maven'].split(':')
+            if parts:
+                return parts[-1]
+        if 'id' in v and isinstance(v['id'], str):
+            return v['id']
+        # As a last resort, try 'name'
+        if 'name' in v and isinstance(v['name'], str):
+            return v['name']
+        # If still unknown, return a compact string to avoid embedding full JSON
+        try:
+            return json.dumps(v, separators=(',', ':'), ensure_ascii=False)
+        except Exception:
+            return str(v)
+    return str(v)
+
+
+def _is_stable(v):
+    if isinstance(v, dict):
+        loader_obj = v.get('loader') if isinstance(v.get('loader'), dict) else v
+        return bool(loader_obj.get('stable', True))
+    return True
+
+
+class FabricCombo:
+    """Una combinación (mc, loader, installer) que sirve un `server.jar`."""
+
+    def __init__(self, mc_version, loader, installer, cached=False, probes=0):
+        self.mc_version = mc_version
+        self.loader = loader
+        self.installer = installer
+        self.cached = cached
+        # Peticiones de sondeo realizadas hasta encontrarla
+        self.probes = probes
+
+    def __repr__(self):
+        return f'FabricCombo({self.mc_version}, loader={self.loader}, installer={self.installer})'
+
+
+class FabricResolver:
+    """
+    Resuelve qué combinación loader/installer de Fabric funciona para una versión.
+
+    La lista de loaders y la de instaladores se piden en paralelo (2 peticiones)
+    y los candidatos se sondean con concurrencia limitada, en orden de
+    preferencia (estables y más nuevos primero), deteniéndose en cuanto uno
+    responde 200. El resultado se guarda en una matriz de compatibilidad en
+    disco con TTL, así que las siguientes instalaciones de la misma versión
+    no hacen ningún sondeo.
+    """
+
+    def __init__(self, downloader, matrix_path, ttl=7 * 86400, concurrency=6,
+                 max_loaders=8, max_installers=3, meta_url=FABRIC_META_URL, maven_url=FABRIC_MAVEN_URL):
+        self.downloader = downloader
+        self.matrix_path = matrix_path
+        self.ttl = ttl
+        self.concurrency = max(1, int(concurrency))
+        self.max_loaders = max_loaders
+        self.max_installers = max_installers
+        self.meta_url = meta_url.rstrip('/')
+        self.maven_url = maven_url.rstrip('/')
+        self.matrix = {}
+        self._locks = {}
+        self._load()
+
+    # --- Persistencia de la matriz ---
+
+    def _load(self):
+        try:
+            with open(self.matrix_path, 'r', encoding='utf-8') as f:
+                self.matrix = json.load(f) or {}
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            self.matrix = {}
+
+    def _save(self):
+        tmp_path = self.matrix_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.matrix_path) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.matrix, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.matrix_path)
+        except Exception:
+            pass
+
+    def cached(self, mc_version):
+        """Combo guardado para `mc_version` si no ha caducado."""
+        entry = self.matrix.get(mc_version)
+        if not entry or time.time() - entry.get('verified_at', 0) > self.ttl:
+            return None
+        return FabricCombo(mc_version, entry['loader'], entry['installer'], cached=True)
+
+    def remember(self, combo):
+        self.matrix[combo.mc_version] = {
+            'loader': combo.loader,
+            'installer': combo.installer,
+            'verified_at': time.time(),
+        }
+        self._save()
+
+    def invalidate(self, mc_version):
+        """Olvida el combo de una versión (p. ej. si la descarga falló)."""
+        if self.matrix.pop(mc_version, None) is not None:
+            self._save()
+
+    # --- URLs ---
+
+    def loaders_url(self, mc_version):
+        return f'{self.meta_url}/v2/versions/loader/{mc_version}'
+
+    def installers_url(self):
+        return f'{self.meta_url}/v2/versions/installer'
+
+    def server_jar_url(self, mc_version, loader, installer):
+        return f'{self.meta_url}/v2/versions/loader/{mc_version}/{loader}/{installer}/server/jar'
+
+    def installer_jar_url(self, installer):
+        return f'{self.maven_url}/net/fabricmc/fabric-installer/{installer}/fabric-installer-{installer}.jar'
+
+    # --- Resolución ---
+
+    async def fetch_metadata(self, mc_version):
+        """Loaders para `mc_version` e instaladores disponibles, pedidos en paralelo."""
+        loaders, installers = await asyncio.gather(
+            self.downloader.fetch_json(self.loaders_url(mc_version), timeout=10),
+            self.downloader.fetch_json(self.installers_url(), timeout=10),
+        )
+        loaders = loaders if isinstance(loaders, list) else [loaders]
+        installers = installers if isinstance(installers, list) else [installers]
+        # Estables primero; el orden de meta ya es de más nuevo a más antiguo
+        loaders = sorted(loaders, key=lambda v: not _is_stable(v))
+        installers = sorted(installers, key=lambda v: not _is_stable(v))
+        return ([normalize_loader_version(v) for v in loaders if v],
+                [normalize_loader_version(v) for v in installers if v])
+
+    async def resolve(self, mc_version, log=None, use_cache=True):
+        """
+        Devuelve un `FabricCombo` funcional para `mc_version`, o None si no hay.
+
+        `log` (opcional) es una función síncrona que recibe líneas de traza.
+        """
+        log = log or (lambda msg: None)
+        lock = self._locks.setdefault(mc_version, asyncio.Lock())
+        async with lock:
+            if use_cache:
+                combo = self.cached(mc_version)
+                if combo:
+                    log(f'Fabric combo from matrix: {combo}')
+                    return combo
+
+            try:
+                loaders, installers = await self.fetch_metadata(mc_version)
+            except DownloadError as e:
+                log(f'Could not fetch Fabric metadata for {mc_version}: {e}')
+                return None
+            if not loaders or not installers:
+                log(f'No Fabric loaders/installers for {mc_version}')
+                return None
+
+            candidates = [(lv, iv) for lv in loaders[:self.max_loaders]
+                          for iv in installers[:self.max_installers]]
+            log(f'Probing {len(candidates)} Fabric candidates for {mc_version} '
+                f'(concurrency={self.concurrency})')
+
+            probes = [0]
+
+            async def probe(lv, iv):
+                url = self.server_jar_url(mc_version, lv, iv)
+                probes[0] += 1
+                try:
+                    status, length = await self.downloader.probe(url, timeout=10)
+                except DownloadError as e:
+                    log(f'Probe error for {url}: {e}')
+                    return False
+                log(f'Probe HTTP {status} for {url}; Content-Length={length}')
+                return status == 200
+
+            # Gana el candidato preferido (el de menor índice) que responda 200, no el más rápido:
+            # tras un acierto solo siguen las sondas de candidatos anteriores a él
+            best = None
+            pending = {}
+            dropped = []
+            next_index = 0
+            try:
+                while True:
+                    while (len(pending) < self.concurrency and next_index < len(candidates)
+                           and (best is None or next_index < best)):
+                        task = asyncio.ensure_future(probe(*candidates[next_index]))
+                        pending[task] = next_index
+                        next_index += 1
+                    if not pending:
+                        break
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        index = pending.pop(task)
+                        if task.result() and (best is None or index < best):
+                            best = index
+                    if best is not None:
+                        for task, index in list(pending.items()):
+                            if index > best:
+                                task.cancel()
+                                dropped.append(task)
+                                del pending[task]
+            finally:
+                dropped.extend(pending)
+                for task in dropped:
+                    task.cancel()
+                if dropped:
+                    await asyncio.gather(*dropped, return_exceptions=True)
+
+            if best is None:
+                return None
+            found = [candidates[best]]
+            combo = FabricCombo(mc_version, found[0][0], found[0][1], probes=probes[0])
+            self.remember(combo)
+            log(f'Resolved {combo} after {probes[0]} probes')
+            return combo
+
+    async def installer_versions(self, limit=3):
+        """Versiones del instalador de Fabric (estables primero), para el fallback con java."""
+        try:
+            installers = await self.downloader.fetch_json(self.installers_url(), timeout=10)
+        except DownloadError:
+            return []
+        installers = installers if isinstance(installers, list) else [installers]
+        installers = sorted(installers, key=lambda v: not _is_stable(v))
+        return [normalize_loader_version(v) for v in installers[:limit]]
@@ -0,0 +1,481 @@
+import os
+import json
+import time
+import struct
+import asyncio
+
+from mcstatus import JavaServer
+
+from utils.errors import log_exception
+from utils.ports import server_ports
+from utils.templates import read_properties
+from utils.shutdown import wait_ports_free
+
+HIBERNATION_FILE = 'hibernation.json'
+
+# Estados del protocolo de Minecraft (campo "next state" del handshake)
+STATE_STATUS = 1
+STATE_LOGIN = 2
+STATE_TRANSFER = 3
+MAX_PACKET = 32767
+
+
+# --- Protocolo: VarInt, cadenas y paquetes ---
+
+def pack_varint(value):
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def pack_string(text):
+    data = text.encode('utf-8')
+    return pack_varint(len(data)) + data
+
+
+def pack_packet(packet_id, payload=b''):
+    body = pack_varint(packet_id) + payload
+    return pack_varint(len(body)) + body
+
+
+async def read_varint(reader, first=None):
+    value = 0
+    for i in range(5):
+        if i == 0 and first is not None:
+            byte = first
+        else:
+            byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value
+    raise ValueError('VarInt demasiado largo')
+
+
+class _Payload:
+    """Lectura secuencial del cuerpo de un paquete."""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def varint(self):
+        value = 0
+        for i in range(5):
+            byte = self.data[self.pos]
+            self.pos += 1
+            value |= (byte & 0x7F) << (7 * i)
+            if not byte & 0x80:
+                return value
+        raise ValueError('VarInt demasiado largo')
+
+    def string(self):
+        length = self.varint()
+        text = self.data[self.pos:self.pos + length].decode('utf-8', errors='replace')
+        self.pos += length
+        return text
+
+    def ushort(self):
+        (value,) = struct.unpack('>H', self.data[self.pos:self.pos + 2])
+        self.pos += 2
+        return value
+
+
+async def read_packet(reader, first=None):
+    """(id, _Payload) del siguiente paquete (`first`: primer byte, si ya se leyó)."""
+    length = await read_varint(reader, first)
+    if length <= 0 or length > MAX_PACKET:
+        raise ValueError(f'Paquete de tamaño inválido ({length})')
+    payload = _Payload(await reader.readexactly(length))
+    return payload.varint(), payload
+
+
+# --- Respondedor para servidores dormidos ---
+
+class SleepResponder:
+    """
+    Escucha en el puerto de juego de un servidor dormido y habla lo justo del
+    protocolo de Minecraft:
+
+    - Server List Ping (handshake con estado 1): devuelve `status` (el último
+      estado real guardado, marcado como dormido) y contesta al ping.
+    - Inicio de sesión (estado 2 o 3): desconecta al jugador con un mensaje
+      ("despertando, vuelve a entrar en unos segundos") y llama a
+      `on_login(nombre)` para arrancar el servidor real.
+
+    Cualquier otra cosa (pings antiguos 0xFE, basura) cierra la conexión.
+    """
+
+    def __init__(self, status, on_login, kick_message, timeout=10.0):
+        self.status = status
+        self.on_login = on_login
+        self.kick_message = kick_message
+        self.timeout = timeout
+        self.pings = 0
+        self._server = None
+
+    async def start(self, host, port):
+        self._server = await asyncio.start_server(self._client, host or None, port)
+        return self
+
+    @property
+    def listening(self):
+        return self._server is not None
+
+    async def close(self):
+        """Deja de escuchar y libera el puerto (espera a que se cierre el socket)."""
+        if self._server is not None:
+            server, self._server = self._server, None
+            server.close()
+            if hasattr(server, 'close_clients'):
+                # 3.13+: wait_closed() espera también a las conexiones abiertas (pings a medias)
+                server.close_clients()
+            await server.wait_closed()
+
+    def _status_json(self, client_protocol):
+        status = dict(self.status)
+        version = dict(status.get('version') or {})
+        # Sin protocolo conocido se devuelve el del cliente: la lista no lo marca como incompatible
+        version.setdefault('protocol', client_protocol)
+        status['version'] = version
+        return json.dumps(status, ensure_ascii=False)
+
+    async def _client(self, reader, writer):
+        try:
+            first = (await asyncio.wait_for(reader.readexactly(1), timeout=self.timeout))[0]
+            if first == 0xFE:
+                # Ping anterior a 1.7: sin soporte
+                return
+            # El primer byte ya es parte de la longitud del handshake
+            packet_id, payload = await asyncio.wait_for(read_packet(reader, first), timeout=self.timeout)
+            if packet_id != 0x00:
+                return
+            protocol = payload.varint()
+            payload.string()  # dirección con la que conectó el cliente
+            payload.ushort()
+            next_state = payload.varint()
+            if next_state == STATE_STATUS:
+                await self._status(reader, writer, protocol)
+            elif next_state in (STATE_LOGIN, STATE_TRANSFER):
+                await self._login(reader, writer)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError, IndexError,
+                struct.error):
+            pass
+        except Exception as e:
+            log_exception(e, context='Sleep responder connection failed')
+        finally:
+            writer.close()
+
+    async def _status(self, reader, writer, protocol):
+        packet_id, _ = await asyncio.wait_for(read_packet(reader), timeout=self.timeout)
+        if packet_id != 0x00:
+            return
+        self.pings += 1
+        writer.write(pack_packet(0x00, pack_string(self._status_json(protocol))))
+        await writer.drain()
+        # Ping opcional: se devuelve el mismo payload (8 bytes)
+        try:
+            packet_id, payload = await asyncio.wait_for(read_packet(reader), timeout=self.timeout)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return
+        if packet_id == 0x01:
+            writer.write(pack_packet(0x01, payload.data[payload.pos:payload.pos + 8]))
+            await writer.drain()
+
+    async def _login(self, reader, writer):
+        packet_id, payload = await asyncio.wait_for(read_packet(reader), timeout=self.timeout)
+        player = payload.string() if packet_id == 0x00 else None
+        # Desconexión en estado login: componente de texto en JSON
+        writer.write(pack_packet(0x00, pack_string(json.dumps({'text': self.kick_message}, ensure_ascii=False))))
+        await writer.drain()
+        await self.on_login(player)
+
+
+# --- Gestión de la hibernación ---
+
+class SleepState:
+    """Un servidor dormido: su respondedor y el estado que anuncia."""
+
+    def __init__(self, name, status, since=None):
+        self.name = name
+        self.status = status
+        self.since = since or time.time()
+        self.responder = None
+        self.waking = False
+
+
+class Hibernator:
+    """
+    Duerme los servidores vacíos y los despierta cuando alguien entra.
+
+    Cada `CNP_HIBERNATE_CHECK` segundos cuenta los jugadores de cada servidor
+    en marcha con hibernación activa (`hibernate_minutes` en servers.json o
+    `CNP_HIBERNATE_MINUTES` para todos; 0 = nunca): por Server List Ping o, si
+    no responde, por el índice de logs. Tras esos minutos sin nadie se
+    detiene (con el apagado seguro normal) y un `SleepResponder` ocupa su
+    puerto de juego hasta que alguien intenta entrar; entonces se suelta el
+    puerto y se arranca con `_internal_start_server`. El túnel de Playit se
+    mantiene mientras duerme: los jugadores de fuera también lo despiertan.
+
+    Los servidores dormidos se guardan en `hibernation.json` para volver a
+    escuchar por ellos tras reiniciar el bot.
+    """
+
+    def __init__(self, manager, notify, path=HIBERNATION_FILE):
+        self.manager = manager
+        self.notify = notify
+        self.path = path
+        self.default_minutes = float(os.getenv('CNP_HIBERNATE_MINUTES', 0))
+        self.interval = float(os.getenv('CNP_HIBERNATE_CHECK', 60))
+        self.probe_timeout = float(os.getenv('CNP_HIBERNATE_PROBE_TIMEOUT', 5))
+        self.bind_host = os.getenv('CNP_HIBERNATE_BIND', '')
+        self.sleeping = {}
+        # Desde cuándo (time.monotonic) está vacío cada servidor en marcha
+        self.idle_since = {}
+        self._task = None
+
+    # --- Configuración y persistencia ---
+
+    def minutes(self, info):
+        value = info.get('hibernate_minutes')
+        return self.default_minutes if value is None else float(value)
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            log_exception(e, context=f'Could not read {self.path}')
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def save(self):
+        data = {name: {'status': s.status, 'since': s.since} for name, s in self.sleeping.items()}
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log_exception(e, context=f'Could not write {self.path}')
+
+    # --- Ciclo de vida ---
+
+    async def start(self):
+        """Vuelve a dormir los servidores que lo estaban antes de reiniciar el bot y arranca la vigilancia."""
+        servers = self.manager.load_server_data()
+        for name, entry in self.load().items():
+            if name in servers and name not in self.manager.running_servers:
+                await self._listen(name, servers[name], entry.get('status') or {}, since=entry.get('since'))
+        self.save()
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        """Al descargar: deja de escuchar (el puerto queda libre) pero recuerda quién dormía."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for state in self.sleeping.values():
+            if state.responder is not None:
+                await state.responder.close()
+
+    # --- Vigilancia ---
+
+    async def players(self, name, info):
+        """Jugadores conectados, o None si no se sabe (arrancando, sin respuesta)."""
+        try:
+            server = JavaServer('127.0.0.1', server_ports(info)['game'], timeout=self.probe_timeout)
+            status = await server.async_status(tries=1)
+            return status.players.online
+        except Exception:
+            pass
+        indexes = getattr(self.manager.bot, 'log_indexes', None)
+        index = indexes.get(name, info) if indexes is not None else None
+        if index is not None:
+            try:
+                await asyncio.to_thread(index.update)
+            except Exception as e:
+                log_exception(e, context=f'Log index update failed for {name}')
+                return None
+            if index.state.get('updated'):
+                return len(index.online)
+        return None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                log_exception(e, context='Hibernation check failed')
+
+    async def check(self):
+        servers = self.manager.load_server_data()
+        now = time.monotonic()
+        for name, process in list(self.manager.running_servers.items()):
+            info = servers.get(name)
+            minutes = self.minutes(info) if info else 0
+            if not minutes or process.poll() is not None:
+                self.idle_since.pop(name, None)
+                continue
+            count = await self.players(name, info)
+            if count is None:
+                continue
+            if count > 0:
+                self.idle_since.pop(name, None)
+                continue
+            since = self.idle_since.setdefault(name, now)
+            if now - since >= minutes * 60:
+                self.idle_since.pop(name, None)
+                await self.hibernate(name, reason=f'{minutes:g} min sin jugadores')
+
+    # --- Dormir y despertar ---
+
+    async def _snapshot(self, info):
+        """Estado SLP real para anunciarlo mientras duerme (o uno mínimo con el MOTD de server.properties)."""
+        try:
+            server = JavaServer('127.0.0.1', server_ports(info)['game'], timeout=self.probe_timeout)
+            status = dict((await server.async_status(tries=1)).raw)
+        except Exception:
+            props = read_properties(os.path.join(info.get('path', ''), 'server.properties'))
+            status = {'description': {'text': props.get('motd') or 'A Minecraft Server'},
+                      'players': {'max': int(props.get('max-players') or 20), 'online': 0}}
+            if info.get('version'):
+                status['version'] = {'name': info['version']}
+        return status
+
+    @staticmethod
+    def sleeping_status(status):
+        """El estado guardado, con 0 jugadores y marcado como dormido en la versión y el MOTD."""
+        status = dict(status)
+        players = dict(status.get('players') or {})
+        players.update(online=0, sample=[])
+        status['players'] = players
+        version = dict(status.get('version') or {})
+        version['name'] = '💤 ' + (version.get('name') or 'Dormido')
+        status['version'] = version
+        description = status.get('description')
+        note = {'text': '\n💤 Dormido: entra para despertarlo', 'color': 'gray'}
+        if isinstance(description, dict):
+            status['description'] = {'text': '', 'extra': [description, note]}
+        else:
+            status['description'] = {'text': str(description or ''), 'extra': [note]}
+        return status
+
+    async def hibernate(self, name, reason='a petición', ctx=None):
+        """
+        Detiene el servidor y escucha en su puerto hasta que alguien entre.
+        El resultado va a `ctx` (un `!hibernar`) o a las alertas. True si quedó dormido.
+        """
+        report = ctx.send if ctx is not None else (lambda text: self.notify(name, text))
+        info = self.manager.load_server_data().get(name)
+        if info is None or name in self.sleeping:
+            return False
+        status = await self._snapshot(info)
+        log = _QuietContext()
+        # Sin `stop_playit`: el túnel espera CNP_PLAYIT_LINGER s y `_listen` lo vuelve a reclamar
+        if not await self.manager._internal_stop_server(log, name, stop_playit=False):
+            await report(f'⚠️ No se pudo dormir `{name}`: {log.last()}')
+            return False
+        if await wait_ports_free(info, timeout=30) is None:
+            await report(f'⚠️ `{name}` se ha detenido pero su puerto sigue ocupado: no se puede dormir.')
+            return False
+        if not await self._listen(name, info, status):
+            return False
+        self.save()
+        forced = ' (cierre forzado)' if self.manager.stop_outcomes.get(name) == 'forced' else ''
+        await report(f'💤 `{name}` duerme ({reason}){forced}. Se despertará cuando alguien intente entrar.')
+        return True
+
+    async def _listen(self, name, info, status, since=None):
+        state = SleepState(name, status, since)
+        port = server_ports(info)['game']
+        state.responder = SleepResponder(
+            self.sleeping_status(status), lambda player: self._woken(name, player),
+            kick_message=f'⏳ {name} se está despertando. Vuelve a entrar en unos segundos.')
+        try:
+            await state.responder.start(self.bind_host, port)
+        except OSError as e:
+            log_exception(e, context=f'Could not listen on port {port} for sleeping server {name}')
+            await self.notify(name, f'⚠️ No se pudo escuchar en el puerto {port} por `{name}`; no despertará solo.')
+            return False
+        self.sleeping[name] = state
+        tunnel = getattr(self.manager, 'tunnel', None)
+        if tunnel is not None:
+            # Los jugadores de fuera llegan por el túnel: mientras duerme lo sigue usando
+            await tunnel.acquire(name)
+        return True
+
+    async def _woken(self, name, player):
+        state = self.sleeping.get(name)
+        if state is None or state.waking:
+            return
+        state.waking = True
+        asyncio.ensure_future(self.wake(name, reason=f'{player or "alguien"} intentó entrar'))
+
+    async def release(self, name):
+        """
+        Deja de escuchar por `name` y libera el puerto (para arrancarlo o
+        detenerlo a mano). La referencia al túnel queda a cargo de quien llama.
+        True si estaba dormido.
+        """
+        state = self.sleeping.pop(name, None)
+        if state is None:
+            return False
+        if state.responder is not None:
+            await state.responder.close()
+        self.save()
+        return True
+
+    async def wake(self, name, reason='a petición', ctx=None):
+        """
+        Suelta el puerto y arranca el servidor real; si no arranca, vuelve a
+        dormir. Los mensajes del arranque van a `ctx` (un `!iniciar`) o, si no
+        hay, solo el resultado a las alertas.
+        """
+        state = self.sleeping.get(name)
+        # Solo un despertar se queda con el estado: otro simultáneo (dos logins a la vez) no hace nada
+        if state is None or not await self.release(name):
+            return False
+        if ctx is None:
+            await self.notify(name, f'⏰ Despertando `{name}` ({reason})...')
+        started = False
+        log = ctx or _QuietContext()
+        try:
+            started = await self.manager._internal_start_server(log, name)
+        except Exception as e:
+            log_exception(e, context=f'Could not wake {name}')
+        if started:
+            return True
+        info = self.manager.load_server_data().get(name)
+        if info is not None and await self._listen(name, info, state.status, since=state.since):
+            self.save()
+            if ctx is not None:
+                await ctx.send(f'💤 `{name}` no pudo arrancar y sigue dormido.')
+            else:
+                await self.notify(name, f'⚠️ `{name}` no pudo despertar y sigue dormido: {log.last()}')
+        return False
+
+
+class _QuietContext:
+    """Sustituto de `ctx` para paradas y arranques automáticos: guarda los mensajes en vez de enviarlos."""
+
+    def __init__(self):
+        self.lines = []
+
+    async def send(self, content=None, **kwargs):
+        if content:
+            self.lines.append(content)
+
+    def last(self):
+        return self.lines[-1] if self.lines else 'sin detalles'
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import hashlib
+
+# Fichero de checkpoint dentro de la carpeta del servidor
+CHECKPOINT_FILE = '.cnp_install.json'
+
+# Etapas de la instalación, en orden
+INSTALL_STAGES = ('layout', 'config', 'download', 'loader', 'first_boot', 'register')
+
+
+def file_sha1(path, chunk_size=1024 * 1024):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class InstallCheckpoint:
+    """
+    Estado persistido de una instalación (`.cnp_install.json` en la carpeta del servidor).
+
+    Tras cada etapa completada se guarda la marca de la etapa y los datos que
+    necesitan las siguientes (p. ej. qué instalador de Fabric se descargó),
+    junto con el SHA-1 de los artefactos descargados. Así `!install --resume`
+    puede saltarse lo ya hecho y comprobar que los jars siguen intactos.
+    """
+
+    def __init__(self, server_path):
+        self.server_path = server_path
+        self.path = os.path.join(server_path, CHECKPOINT_FILE)
+        self.params = {}
+        # etapa -> {'finished': ts, 'elapsed': s, 'data': {...}}
+        self.stages = {}
+        # ruta relativa -> {'sha1': ..., 'size': ..., 'stage': ...}
+        self.artifacts = {}
+        self.status = 'running'
+        self.error = None
+        self.created = time.time()
+        self.updated = None
+
+    @classmethod
+    def load(cls, server_path):
+        """Checkpoint guardado en `server_path`, o None si no hay (o está corrupto)."""
+        ckpt = cls(server_path)
+        try:
+            with open(ckpt.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            return None
+        ckpt.params = data.get('params') or {}
+        ckpt.stages = data.get('stages') or {}
+        ckpt.artifacts = data.get('artifacts') or {}
+        ckpt.status = data.get('status', 'running')
+        ckpt.error = data.get('error')
+        ckpt.created = data.get('created') or ckpt.created
+        ckpt.updated = data.get('updated')
+        return ckpt
+
+    def save(self):
+        if not os.path.isdir(self.server_path):
+            # Aún no existe la carpeta (antes de la etapa `layout`)
+            return
+        self.updated = time.time()
+        data = {
+            'params': self.params,
+            'status': self.status,
+            'error': self.error,
+            'created': self.created,
+            'updated': self.updated,
+            'stages': self.stages,
+            'artifacts': self.artifacts,
+        }
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            pass
+
+    # --- Etapas ---
+
+    def done(self, stage):
+        return stage in self.stages
+
+    def data(self, stage):
+        return (self.stages.get(stage) or {}).get('data') or {}
+
+    def mark(self, stage, elapsed=None, **data):
+        self.stages[stage] = {'finished': time.time(), 'elapsed': elapsed, 'data': data}
+        self.status = 'running'
+        self.error = None
+        self.save()
+
+    def reset(self, stage):
+        """Olvida una etapa (y sus artefactos) para que se repita."""
+        self.stages.pop(stage, None)
+        for rel in [r for r, a in self.artifacts.items() if a.get('stage') == stage]:
+            del self.artifacts[rel]
+        self.save()
+
+    def pending(self):
+        return [s for s in INSTALL_STAGES if s not in self.stages]
+
+    def fail(self, stage, error):
+        self.status = 'failed'
+        self.error = f'{stage}: {error}' if error else stage
+        self.save()
+
+    def complete(self):
+        self.status = 'complete'
+        self.error = None
+        self.save()
+
+    @property
+    def is_complete(self):
+        return self.status == 'complete'
+
+    # --- Artefactos ---
+
+    def record_artifact(self, rel_path, stage, sha1=None):
+        """Registra un fichero descargado; si no se da `sha1` se calcula (bloqueante)."""
+        full = os.path.join(self.server_path, rel_path)
+        self.artifacts[rel_path] = {
+            'sha1': sha1 or file_sha1(full),
+            'size': os.path.getsize(full),
+            'stage': stage,
+        }
+        self.save()
+
+    def forget_artifact(self, rel_path):
+        if self.artifacts.pop(rel_path, None) is not None:
+            self.save()
+
+    def artifact_ok(self, rel_path):
+        """True si el artefacto existe y su SHA-1 coincide con el registrado (bloqueante)."""
+        info = self.artifacts.get(rel_path)
+        full = os.path.join(self.server_path, rel_path)
+        if not info or not os.path.isfile(full):
+            return False
+        if info.get('size') is not None and os.path.getsize(full) != info['size']:
+            return False
+        return file_sha1(full) == info.get('sha1')
+
+    def verify_artifacts(self):
+        """
+        Comprueba todos los artefactos registrados. Las etapas que produjeron
+        uno ausente o alterado se olvidan para repetirse. Devuelve la lista de
+        artefactos inválidos (bloqueante: ejecutar en un hilo).
+        """
+        bad = [rel for rel in list(self.artifacts) if not self.artifact_ok(rel)]
+        for rel in bad:
+            stage = self.artifacts.get(rel, {}).get('stage')
+            if stage:
+                self.reset(stage)
+            else:
+                self.forget_artifact(rel)
+        return bad
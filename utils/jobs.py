@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import asyncio
+
+from utils.errors import log_exception
+
+# Estados de un trabajo
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+INTERRUPTED = 'interrupted'
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED, INTERRUPTED)
+
+
+class Job:
+    """Un trabajo en la cola (p. ej. una instalación) con sus etapas y tiempos."""
+
+    def __init__(self, job_id, kind, params, created=None):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.created = created or time.time()
+        self.status = QUEUED
+        self.stage = None
+        # nombre de etapa -> {'started': ts, 'finished': ts | None}
+        self.stages = {}
+        self.progress = ''
+        self.error = None
+        self.started = None
+        self.finished = None
+        # En memoria (no se persisten)
+        self.task = None
+        self.queue = None
+        self._held = None
+
+    # --- Etapas ---
+
+    async def enter_stage(self, name):
+        """
+        Pasa a la etapa `name`: cierra la anterior, libera su cupo y espera
+        al cupo de la nueva si la etapa tiene límite de concurrencia.
+        """
+        now = time.time()
+        if self.stage and self.stage in self.stages:
+            self.stages[self.stage]['finished'] = now
+        self._release()
+        self.stage = name
+        self.progress = ''
+        sem = self.queue.stage_limits.get(name) if self.queue else None
+        if sem is not None:
+            self.progress = 'esperando cupo'
+            self.queue.save()
+            await sem.acquire()
+            self._held = sem
+            self.progress = ''
+        self.stages[name] = {'started': time.time(), 'finished': None}
+        if self.queue:
+            self.queue.save()
+
+    def _release(self):
+        if self._held is not None:
+            self._held.release()
+            self._held = None
+
+    def _close(self, status, error=None):
+        now = time.time()
+        if self.stage and self.stage in self.stages and not self.stages[self.stage].get('finished'):
+            self.stages[self.stage]['finished'] = now
+        self._release()
+        self.status = status
+        self.error = error
+        self.finished = now
+
+    def set_progress(self, text):
+        self.progress = text
+
+    # --- Consultas ---
+
+    def stage_elapsed(self, name):
+        info = self.stages.get(name) or {}
+        if not info.get('started'):
+            return None
+        return (info.get('finished') or time.time()) - info['started']
+
+    def elapsed(self):
+        if not self.started:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def finished_state(self):
+        return self.status in FINISHED_STATES
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'created': self.created,
+            'status': self.status,
+            'stage': self.stage,
+            'stages': self.stages,
+            'progress': self.progress,
+            'error': self.error,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['id'], data.get('kind'), data.get('params') or {}, created=data.get('created'))
+        job.status = data.get('status', QUEUED)
+        job.stage = data.get('stage')
+        job.stages = data.get('stages') or {}
+        job.progress = data.get('progress', '')
+        job.error = data.get('error')
+        job.started = data.get('started')
+        job.finished = data.get('finished')
+        return job
+
+
+class JobQueue:
+    """
+    Cola persistente de trabajos servida por un pool de workers.
+
+    Además del número de workers, cada etapa puede tener su propio límite de
+    concurrencia (`stage_limits`), de modo que p. ej. varias instalaciones
+    pueden descargar a la vez pero solo una hace su primer arranque. El
+    estado se guarda en un JSON. Al cargar, los trabajos que estaban en curso
+    cuando se cayó el bot se marcan como `interrupted` (pueden haberse quedado
+    a medias) y los que seguían en cola vuelven a la cola en su orden.
+    """
+
+    def __init__(self, path, workers=2, stage_limits=None, history=50):
+        self.path = path
+        self.workers = max(1, int(workers))
+        self.stage_limits = {name: asyncio.Semaphore(max(1, int(n)))
+                             for name, n in (stage_limits or {}).items()}
+        self.history = history
+        self.jobs = {}
+        self.runners = {}
+        # tipo -> corrutina `on_cancel(job)` para trabajos cancelados antes de empezar
+        self.cancel_hooks = {}
+        # Trabajos en cola recuperados del JSON al cargar
+        self.restored = []
+        self._queue = asyncio.Queue()
+        self._worker_tasks = []
+        self._next_id = 1
+        self.load()
+
+    # --- Persistencia ---
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            data = {}
+        for raw in data.get('jobs', []):
+            try:
+                job = Job.from_dict(raw)
+            except (KeyError, TypeError):
+                continue
+            if job.status == QUEUED:
+                self.restored.append(job)
+            elif not job.finished_state:
+                job.status = INTERRUPTED
+                job.error = job.error or 'El bot se reinició durante el trabajo'
+            job.queue = self
+            self.jobs[job.id] = job
+        self._next_id = int(data.get('next_id', 1))
+        self.restored.sort(key=lambda j: j.created)
+        for job in self.restored:
+            self._queue.put_nowait(job)
+
+    def save(self):
+        finished = [j for j in self.jobs.values() if j.finished_state]
+        if len(finished) > self.history:
+            finished.sort(key=lambda j: j.finished or 0)
+            for old in finished[:len(finished) - self.history]:
+                del self.jobs[old.id]
+        data = {
+            'next_id': self._next_id,
+            'jobs': [j.to_dict() for j in sorted(self.jobs.values(), key=lambda j: j.created)],
+        }
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            log_exception(e, context=f'Could not write {self.path}')
+
+    # --- API ---
+
+    def register(self, kind, runner, on_cancel=None):
+        """
+        Asocia un tipo de trabajo con su corrutina `runner(job)` y, opcionalmente,
+        con `on_cancel(job)`, que se llama al cancelar un trabajo que aún no empezó.
+        """
+        self.runners[kind] = runner
+        if on_cancel is not None:
+            self.cancel_hooks[kind] = on_cancel
+
+    def submit(self, kind, params):
+        if kind not in self.runners:
+            raise ValueError(f'Tipo de trabajo desconocido: {kind}')
+        job = Job(f'J{self._next_id}', kind, params)
+        self._next_id += 1
+        job.queue = self
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self.save()
+        return job
+
+    def get(self, job_id):
+        if not job_id:
+            return None
+        job_id = job_id.upper()
+        if not job_id.startswith('J'):
+            job_id = 'J' + job_id
+        return self.jobs.get(job_id)
+
+    def position(self, job):
+        """Posición en la cola (1 = el siguiente), o 0 si ya no está en cola."""
+        if job.status != QUEUED:
+            return 0
+        queued = sorted((j for j in self.jobs.values() if j.status == QUEUED), key=lambda j: j.created)
+        return queued.index(job) + 1
+
+    def active(self):
+        return [j for j in self.jobs.values() if not j.finished_state]
+
+    def recent(self, limit=10):
+        return sorted(self.jobs.values(), key=lambda j: j.created, reverse=True)[:limit]
+
+    def cancel(self, job_id):
+        """Cancela un trabajo en cola o en curso. Devuelve True si se pudo."""
+        job = self.get(job_id)
+        if not job or job.finished_state:
+            return False
+        if job.status == QUEUED:
+            job._close(CANCELLED)
+            self.save()
+            hook = self.cancel_hooks.get(job.kind)
+            if hook is not None:
+                asyncio.ensure_future(self._run_hook(hook, job))
+            return True
+        if job.task and not job.task.done():
+            job.task.cancel()
+            return True
+        return False
+
+    @staticmethod
+    async def _run_hook(hook, job):
+        try:
+            await hook(job)
+        except Exception as e:
+            log_exception(e, context=f'Cancel hook failed for job {job.id}')
+
+    # --- Workers ---
+
+    def start(self):
+        if self._worker_tasks:
+            return
+        self._worker_tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for job in self.active():
+            if job.task and not job.task.done():
+                job.task.cancel()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job.status != QUEUED:
+                # Cancelado mientras esperaba
+                continue
+            runner = self.runners.get(job.kind)
+            if runner is None:
+                job._close(FAILED, error=f'Tipo de trabajo desconocido: {job.kind}')
+                self.save()
+                continue
+            job.status = RUNNING
+            job.started = time.time()
+            self.save()
+            job.task = asyncio.ensure_future(runner(job))
+            # asyncio.wait no propaga la cancelación del trabajo al worker
+            await asyncio.wait({job.task})
+            if job.task.cancelled():
+                job._close(CANCELLED)
+            elif job.task.exception() is not None:
+                exc = job.task.exception()
+                log_exception(exc, context=f'Job {job.id} ({job.kind}) failed')
+                job._close(FAILED, error=str(exc))
+            elif job.task.result() is False:
+                job._close(FAILED, error=job.error or 'El trabajo terminó con errores')
+            else:
+                job._close(DONE)
+            job.task = None
+            self.save()
@@ -0,0 +1,494 @@
+import os
+import re
+import gzip
+import json
+import mmap
+import time
+import glob
+import datetime
+import threading
+
+from utils.errors import log_exception
+
+INDEX_FILE = 'cnp_log_index.json'
+# Eventos añadidos desde la última compactación, una línea JSON por `update()`
+JOURNAL_FILE = 'cnp_log_index.journal'
+# A partir de este tamaño pendiente se recorre el log con mmap en lugar de leerlo a memoria
+MMAP_THRESHOLD = 256 * 1024
+# Cabecera del fichero que se guarda para detectar que latest.log es otro (rotado)
+HEAD_BYTES = 128
+
+# Prefijo de cada línea. Vanilla/Fabric: "[12:34:56] [Server thread/INFO]: ",
+# Paper: "[12:34:56 INFO]: ", Forge: "[16Oct2026 12:34:56.789] [Server thread/INFO] [logger/]: "
+_PREFIX = (rb'^\[(?:(?P<day>\d{1,2})(?P<mon>[A-Za-z]{3})(?P<year>\d{4}) )?'
+           rb'(?P<h>\d\d):(?P<m>\d\d):(?P<s>\d\d)[^\]\n]*\](?: \[[^\]\n]*\])*: ')
+_NAME = rb'[\w.]{1,32}'
+_DEATHS = (rb'was |fell |drowned|died|blew up|burned to death|went up in flames|hit the ground|suffocated|'
+           rb'starved to death|froze to death|withered away|experienced kinetic energy|tried to swim in lava|'
+           rb'walked into|discovered the floor was lava|didn\'t want to live|left the confines|went off with a bang')
+EVENT_RE = re.compile(
+    _PREFIX + rb'(?:'
+    rb'(?:\[Not Secure\] )?<(?P<chat_player>[^>\n]{1,32})> (?P<chat>[^\n]*)'
+    rb'|(?P<join>' + _NAME + rb')(?: \(formerly known as [^)\n]*\))? joined the game'
+    rb'|(?P<leave>' + _NAME + rb') left the game'
+    rb'|Can\'t keep up! Is the server overloaded\? Running (?P<lag_ms>\d+)ms or (?P<lag_ticks>\d+) ticks behind'
+    rb'|(?P<crash>Encountered an unexpected exception|Exception in server tick loop'
+    rb'|Considering it to be crashed|This crash report has been saved to: [^\n]*)'
+    rb'|(?P<start>Done \([\d.,]+s\)!)'
+    rb'|(?P<stop>Stopping server)'
+    rb'|(?P<death_player>' + _NAME + rb') (?P<death>(?:' + _DEATHS + rb')[^\n]*)'
+    rb')',
+    re.M,
+)
+LINE_TIME_RE = re.compile(_PREFIX)
+MONTHS = {m: i for i, m in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1)}
+# Nombre de los logs rotados por log4j: logs/2026-10-16-1.log.gz
+ROTATED_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})-(\d+)\.log\.gz$')
+
+KINDS = ('join', 'leave', 'chat', 'death', 'lag', 'crash', 'start', 'stop')
+
+
+def _secs(match):
+    return int(match.group('h')) * 3600 + int(match.group('m')) * 60 + int(match.group('s'))
+
+
+def _explicit_date(match):
+    """Fecha de la línea si el formato la incluye (Forge), o None."""
+    if not match.group('day'):
+        return None
+    month = MONTHS.get(match.group('mon').decode('ascii', 'replace').lower())
+    if not month:
+        return None
+    try:
+        return datetime.date(int(match.group('year')), month, int(match.group('day')))
+    except ValueError:
+        return None
+
+
+def _text(value, limit=200):
+    return value.decode('utf-8', errors='replace')[:limit]
+
+
+def parse_events(data, start, end, anchor):
+    """
+    Eventos de `data[start:end]` (bytes o mmap, líneas completas) como
+    [epoch, tipo, jugador, detalle].
+
+    El log solo trae la hora, así que las fechas se deducen hacia atrás desde
+    `anchor` (datetime de la última línea escrita, p. ej. el mtime del
+    fichero): cada vez que la hora "retrocede" entre dos líneas se cambia de
+    día. Los formatos con fecha (Forge) la usan tal cual.
+    """
+    raw = []
+    for match in EVENT_RE.finditer(data, start, end):
+        groups = match.groupdict()
+        if groups['chat_player'] is not None:
+            event = ('chat', _text(groups['chat_player'], 32), _text(groups['chat']))
+        elif groups['join'] is not None:
+            event = ('join', _text(groups['join'], 32), None)
+        elif groups['leave'] is not None:
+            event = ('leave', _text(groups['leave'], 32), None)
+        elif groups['lag_ms'] is not None:
+            event = ('lag', None, [int(groups['lag_ms']), int(groups['lag_ticks'])])
+        elif groups['crash'] is not None:
+            event = ('crash', None, _text(groups['crash']))
+        elif groups['start'] is not None:
+            event = ('start', None, None)
+        elif groups['stop'] is not None:
+            event = ('stop', None, None)
+        else:
+            event = ('death', _text(groups['death_player'], 32), _text(groups['death']))
+        raw.append((_secs(match), _explicit_date(match), event))
+    if not raw:
+        return []
+
+    # Hora de la última línea del trozo (interesante o no): es la que corresponde a `anchor`
+    last_line = data.rfind(b'\n[', start, end)
+    tail = LINE_TIME_RE.match(data, last_line + 1 if last_line >= 0 else start, end)
+    last_secs = _secs(tail) if tail else raw[-1][0]
+    anchor_secs = anchor.hour * 3600 + anchor.minute * 60 + anchor.second
+    day = anchor.date()
+    if last_secs > anchor_secs + 60:
+        # La última línea es de antes de medianoche y el fichero se tocó después
+        day -= datetime.timedelta(days=1)
+
+    events = []
+    later = last_secs
+    for secs, explicit, (kind, player, detail) in reversed(raw):
+        if secs > later:
+            day -= datetime.timedelta(days=1)
+        later = secs
+        when = explicit or day
+        moment = datetime.datetime.combine(when, datetime.time(secs // 3600, secs // 60 % 60, secs % 60))
+        events.append([int(time.mktime(moment.timetuple())), kind, player, detail])
+    events.reverse()
+    return events
+
+
+class LogIndex:
+    """
+    Índice de eventos de `logs/latest.log` de un servidor.
+
+    Sigue el log por desplazamiento de bytes: cada `update()` lee solo lo
+    nuevo (con mmap si hay mucho pendiente, p. ej. la primera vez) y pasa las
+    líneas por una única expresión regular sobre bytes, sin decodificar las
+    que no interesan. Si latest.log rota, el resto del fichero anterior se
+    lee de su `.log.gz`. El índice (eventos compactos, desplazamiento y
+    jugadores conectados) se guarda en `cnp_log_index.json` dentro del
+    servidor, así que las consultas no vuelven a recorrer los logs.
+
+    Cada `update()` con eventos nuevos solo añade una línea a
+    `cnp_log_index.journal`; el JSON completo se reescribe (y el diario se
+    vacía) cuando el diario acumula `compact_events` eventos, al cerrar las
+    sesiones de un servidor parado o si hay que corregir un evento ya
+    guardado. `seq` numera las líneas para no repetir las que ya estén en el
+    JSON si el bot cayó entre guardarlo y vaciar el diario.
+    """
+
+    def __init__(self, server_path, retention_days=14, max_events=50000, compact_events=5000):
+        self.server_path = server_path
+        self.log_dir = os.path.join(server_path, 'logs')
+        self.path = os.path.join(server_path, INDEX_FILE)
+        self.journal_path = os.path.join(server_path, JOURNAL_FILE)
+        self.retention = retention_days * 86400
+        self.max_events = max_events
+        self.compact_events = compact_events
+        self.lock = threading.Lock()
+        self.state = {'offset': 0, 'head': '', 'events': [], 'online': {}, 'updated': None, 'seq': 0}
+        self._loaded = False
+        # Eventos en el diario desde la última compactación, y si hace falta reescribir el JSON entero
+        self._journaled = 0
+        self._rewrite = False
+
+    # --- Persistencia ---
+
+    def load(self):
+        self._loaded = True
+        loaded = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict) and isinstance(data.get('events'), list):
+                self.state.update(data)
+                loaded = True
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            log_exception(e, context=f'Could not read {self.path}; rebuilding the log index')
+        return self._replay() or loaded
+
+    def _replay(self):
+        """Aplica las líneas del diario posteriores al JSON. True si había alguna."""
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            log_exception(e, context=f'Could not read {self.journal_path}')
+            self._rewrite = True
+            return False
+        replayed = False
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Línea a medio escribir (el bot cayó): lo que siga no es fiable; se compacta al actualizar
+                self._rewrite = True
+                break
+            if not isinstance(entry, dict) or entry.get('seq', 0) <= self.state.get('seq', 0):
+                continue
+            events = entry.pop('events', [])
+            self.state['events'].extend(events)
+            self.state.update(entry)
+            self._journaled += len(events)
+            replayed = True
+        return replayed
+
+    def _append(self, added):
+        """Guarda en el diario los eventos de un `update()` y el estado del seguimiento."""
+        self.state['seq'] = self.state.get('seq', 0) + 1
+        entry = {key: self.state.get(key) for key in ('seq', 'offset', 'head', 'online', 'updated')}
+        entry['events'] = added
+        try:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+        except OSError as e:
+            log_exception(e, context=f'Could not append to {self.journal_path}')
+            self._rewrite = True
+            return
+        self._journaled += len(added)
+
+    def save(self):
+        """Compacta: reescribe el JSON completo (recortado a la retención) y vacía el diario. True si se escribió."""
+        cutoff = time.time() - self.retention
+        events = self.state['events']
+        first = next((i for i, e in enumerate(events) if e[0] >= cutoff), len(events))
+        del events[:max(first, len(events) - self.max_events)]
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log_exception(e, context=f'Could not write {self.path}')
+            return False
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # Sus líneas ya están en el JSON (por `seq`): no se repetirán
+            log_exception(e, context=f'Could not remove {self.journal_path}')
+        self._journaled = 0
+        self._rewrite = False
+        return True
+
+    # --- Lectura del log ---
+
+    def update(self):
+        """Indexa lo nuevo de latest.log. Devuelve la lista de eventos añadidos."""
+        with self.lock:
+            if not self._loaded and not self.load():
+                self._import_rotated()
+            first = self.state['updated'] is None
+            added = self._read_latest()
+            if added or first:
+                self.state['updated'] = time.time()
+            compact = first or self._rewrite or self._journaled + len(added) >= self.compact_events
+            if not (compact and self.save()) and added:
+                # Sin compactar (o si el JSON no se pudo escribir): al diario
+                self._append(added)
+            return added
+
+    def _read_latest(self):
+        path = os.path.join(self.log_dir, 'latest.log')
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return []
+        added = []
+        with f:
+            st = os.fstat(f.fileno())
+            head = f.read(HEAD_BYTES).hex()
+            known = self.state['head']
+            rotated = st.st_size < self.state['offset'] or not (head.startswith(known) or known.startswith(head))
+            if rotated:
+                # Lo que quedase por leer del fichero anterior está ahora en el .log.gz más reciente
+                added += self._finish_rotated()
+                self.state['offset'] = 0
+            self.state['head'] = head
+            offset = self.state['offset']
+            if st.st_size <= offset:
+                return added
+            anchor = datetime.datetime.fromtimestamp(st.st_mtime)
+            if st.st_size - offset >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), st.st_size, access=mmap.ACCESS_READ) as data:
+                    end = data.rfind(b'\n', offset, st.st_size) + 1
+                    if end > offset:
+                        added += self._ingest(parse_events(data, offset, end, anchor))
+                        self.state['offset'] = end
+            else:
+                f.seek(offset)
+                data = f.read(st.st_size - offset)
+                # Solo líneas completas: la última puede estar a medio escribir
+                end = data.rfind(b'\n') + 1
+                if end > 0:
+                    added += self._ingest(parse_events(data, 0, end, anchor))
+                    self.state['offset'] = offset + end
+        return added
+
+    def _rotated_logs(self):
+        found = []
+        for path in glob.glob(os.path.join(self.log_dir, '*.log.gz')):
+            match = ROTATED_RE.search(os.path.basename(path))
+            if match:
+                y, m, d, n = (int(g) for g in match.groups())
+                found.append(((y, m, d, n), path))
+        return [path for _, path in sorted(found)]
+
+    @staticmethod
+    def _rotated_anchor(path):
+        """La fecha del nombre es la del día del contenido; la última línea se ancla al final de ese día."""
+        y, m, d, _ = (int(g) for g in ROTATED_RE.search(os.path.basename(path)).groups())
+        return datetime.datetime(y, m, d, 23, 59, 59)
+
+    def _read_gz(self, path, offset=0):
+        try:
+            with gzip.open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except (OSError, EOFError) as e:
+            log_exception(e, context=f'Could not read rotated log {path}')
+            return []
+        end = data.rfind(b'\n') + 1
+        return parse_events(data, 0, end, self._rotated_anchor(path)) if end else []
+
+    @staticmethod
+    def _gz_head(path):
+        try:
+            with gzip.open(path, 'rb') as f:
+                return f.read(HEAD_BYTES).hex()
+        except (OSError, EOFError):
+            return ''
+
+    def _finish_rotated(self):
+        """
+        Completa el latest.log anterior desde su `.log.gz` (el que empieza
+        igual) y añade enteros los que hayan rotado después, si el bot estuvo
+        parado durante varios reinicios del servidor.
+        """
+        known = self.state['head']
+        rotated = self._rotated_logs()
+        if not known:
+            return []
+        added = []
+        for i in range(len(rotated) - 1, max(-1, len(rotated) - 6), -1):
+            if self._gz_head(rotated[i]).startswith(known):
+                added += self._ingest(self._read_gz(rotated[i], self.state['offset']))
+                for later in rotated[i + 1:]:
+                    added += self._ingest(self._read_gz(later))
+                break
+        return added
+
+    def _import_rotated(self):
+        """Primera vez: indexar también los .log.gz dentro del periodo de retención."""
+        cutoff = datetime.date.today() - datetime.timedelta(seconds=self.retention)
+        for path in self._rotated_logs():
+            if self._rotated_anchor(path).date() >= cutoff:
+                self._ingest(self._read_gz(path))
+        # Sesiones del último log rotado que no cerraron: el servidor ya no sigue con ellas
+        self.state['online'] = {}
+
+    def _ingest(self, events):
+        """Añade eventos manteniendo los jugadores conectados (para sesiones y para filtrar muertes)."""
+        online = self.state['online']
+        kept = []
+        for event in events:
+            ts, kind, player = event[0], event[1], event[2]
+            if kind == 'join':
+                online[player] = ts
+            elif kind == 'leave':
+                online.pop(player, None)
+            elif kind in ('start', 'stop'):
+                online.clear()
+            elif kind == 'death' and player not in online:
+                # "X was ..." de alguien que no está conectado no es una muerte (mensajes de plugins, etc.)
+                continue
+            if kind == 'crash':
+                online.clear()
+                previous = kept[-1] if kept else (self.state['events'][-1] if self.state['events'] else None)
+                if previous and previous[1] == 'crash' and ts - previous[0] < 120:
+                    # Una caída escribe varias líneas: un solo evento, con la ruta del crash-report si la hay
+                    if 'crash report' in (event[3] or ''):
+                        previous[3] = event[3]
+                        if not kept:
+                            # El evento ya estaba guardado: el diario no lo corrige, hay que reescribir
+                            self._rewrite = True
+                    continue
+            kept.append(event)
+        self.state['events'].extend(kept)
+        return kept
+
+    def server_stopped(self):
+        """
+        El servidor ya no está en marcha pero el log no llegó a cerrar las
+        sesiones (proceso matado): se cierran en la hora de la última escritura del log.
+        """
+        with self.lock:
+            if not self.state['online']:
+                return
+            try:
+                ts = int(os.path.getmtime(os.path.join(self.log_dir, 'latest.log')))
+            except OSError:
+                ts = int(time.time())
+            ts = max(ts, max(self.state['online'].values()))
+            self.state['events'].append([ts, 'stop', None, None])
+            self.state['online'] = {}
+            self.save()
+
+    # --- Consultas ---
+
+    def events(self, kinds=None, since=None, until=None, player=None):
+        with self.lock:
+            return [e for e in self.state['events']
+                    if (kinds is None or e[1] in kinds)
+                    and (since is None or e[0] >= since) and (until is None or e[0] < until)
+                    and (player is None or (e[2] or '').lower() == player.lower())]
+
+    def sessions(self, since, until):
+        """{jugador: [(desde, hasta), ...]} de las conexiones que se solapan con [since, until)."""
+        with self.lock:
+            opened, result = {}, {}
+
+            def close(player, end):
+                start = opened.pop(player)
+                if start < until and end > since:
+                    result.setdefault(player, []).append((max(start, since), min(end, until)))
+
+            for ts, kind, player, _ in self.state['events']:
+                if kind == 'join':
+                    if player in opened:
+                        close(player, ts)
+                    opened[player] = ts
+                elif kind == 'leave' and player in opened:
+                    close(player, ts)
+                elif kind in ('start', 'stop', 'crash'):
+                    for name in list(opened):
+                        close(name, ts)
+            now = time.time()
+            for name in list(opened):
+                # Sigue conectado según el log: hasta ahora
+                close(name, now if name in self.state['online'] else opened[name])
+            return result
+
+    @property
+    def online(self):
+        return dict(self.state['online'])
+
+
+class LogIndexes:
+    """Un `LogIndex` por servidor, creado al primer uso (compartido por el bot como `log_indexes`)."""
+
+    def __init__(self, config=None):
+        self.config = config
+        self.retention_days = float(os.getenv('CNP_LOG_INDEX_DAYS', 14))
+        self.max_events = int(os.getenv('CNP_LOG_INDEX_MAX_EVENTS', 50000))
+        self.compact_events = int(os.getenv('CNP_LOG_INDEX_COMPACT_EVENTS', 5000))
+        self._indexes = {}
+
+    def get(self, server_name, server_info):
+        path = server_info.get('path')
+        if not path:
+            return None
+        index = self._indexes.get(server_name)
+        if index is None or index.server_path != path:
+            index = LogIndex(path, self.retention_days, self.max_events, self.compact_events)
+            self._indexes[server_name] = index
+        return index
+
+    def items(self):
+        return list(self._indexes.items())
+
+
+def parse_period(text, now=None):
+    """
+    (desde, hasta, descripción) para `1h`, `30m`, `2d`, `hoy`, `ayer` o
+    `anoche` (de 20:00 de ayer a 08:00 de hoy). None si no se entiende.
+    """
+    now = now or time.time()
+    today = datetime.datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    text = (text or '24h').strip().lower()
+    if text in ('hoy', 'today'):
+        return today.timestamp(), now, 'hoy'
+    if text in ('ayer', 'yesterday'):
+        return (today - datetime.timedelta(days=1)).timestamp(), today.timestamp(), 'ayer'
+    if text in ('anoche', 'lastnight'):
+        start = today - datetime.timedelta(hours=4)
+        return start.timestamp(), (today + datetime.timedelta(hours=8)).timestamp(), 'anoche (20:00–08:00)'
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([mhd])', text)
+    if not match:
+        return None
+    seconds = float(match.group(1)) * {'m': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+    return now - seconds, now, f'últimos {match.group(1)}{match.group(2)}'
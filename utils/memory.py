@@ -0,0 +1,274 @@
+import os
+import re
+
+MB = 1024 * 1024
+
+# Heap por defecto según tipo (los valores históricos del instalador)
+DEFAULT_HEAP_MB = {'vanilla': 4096}
+DEFAULT_MODDED_HEAP_MB = 6144
+MIN_HEAP_MB = 1024
+
+JVM_ARGS_FILE = 'user_jvm_args.txt'
+_XMX_RE = re.compile(r'-Xmx(\d+)([kKmMgG]?)')
+
+
+def parse_size_mb(text):
+    """'4G' / '4096M' / '4096' -> MB (int). None si no se entiende."""
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kKmMgG]?)[bB]?\s*', str(text or ''))
+    if not m:
+        return None
+    value, unit = float(m.group(1)), m.group(2).upper()
+    factor = {'K': 1 / 1024, 'M': 1, 'G': 1024, '': 1}[unit]
+    return int(value * factor)
+
+
+def format_mb(mb):
+    if mb is None:
+        return '?'
+    return f'{mb / 1024:.1f} GB' if mb >= 1024 else f'{mb} MB'
+
+
+def _jvm_size(mb):
+    return f'{mb // 1024}G' if mb % 1024 == 0 else f'{mb}M'
+
+
+def host_memory():
+    """
+    (total_mb, disponible_mb) del host, o (None, None) si no se puede saber.
+
+    En Linux se lee /proc/meminfo (MemAvailable ya descuenta caché
+    recuperable); en Windows se usa GlobalMemoryStatusEx.
+    """
+    try:
+        info = {}
+        with open('/proc/meminfo', 'r', encoding='ascii') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                info[key] = int(rest.split()[0])  # kB
+        total = info.get('MemTotal')
+        avail = info.get('MemAvailable', info.get('MemFree'))
+        return (total // 1024 if total else None, avail // 1024 if avail is not None else None)
+    except (OSError, ValueError, IndexError):
+        pass
+    if os.name == 'nt':
+        try:
+            import ctypes
+
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                            ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                            ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                            ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                            ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+
+            stat = MEMORYSTATUSEX()
+            stat.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat)):
+                return stat.ullTotalPhys // MB, stat.ullAvailPhys // MB
+        except Exception:
+            pass
+    return None, None
+
+
+def host_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def read_heap_mb(server_path):
+    """-Xmx configurado en user_jvm_args.txt del servidor (MB), o None."""
+    try:
+        with open(os.path.join(server_path, JVM_ARGS_FILE), 'r', encoding='utf-8') as f:
+            text = f.read()
+    except OSError:
+        return None
+    found = None
+    for line in text.splitlines():
+        if line.lstrip().startswith('#'):
+            continue
+        m = _XMX_RE.search(line)
+        if m:
+            found = parse_size_mb(m.group(1) + m.group(2))
+    return found
+
+
+# --- Perfiles de flags ---
+
+def _g1_flags(heap_mb, cpus):
+    # Flags de Aikar para G1: pausas cortas y generación joven grande (Minecraft crea mucha basura de vida corta)
+    large = heap_mb >= 12 * 1024
+    flags = [
+        '-XX:+UseG1GC',
+        '-XX:+ParallelRefProcEnabled',
+        '-XX:MaxGCPauseMillis=200',
+        '-XX:+UnlockExperimentalVMOptions',
+        '-XX:+DisableExplicitGC',
+        '-XX:+AlwaysPreTouch',
+        f'-XX:G1NewSizePercent={40 if large else 30}',
+        f'-XX:G1MaxNewSizePercent={50 if large else 40}',
+        f'-XX:G1HeapRegionSize={16 if large else 8}M',
+        f'-XX:G1ReservePercent={15 if large else 20}',
+        '-XX:G1HeapWastePercent=5',
+        '-XX:G1MixedGCCountTarget=4',
+        f'-XX:InitiatingHeapOccupancyPercent={20 if large else 15}',
+        '-XX:G1MixedGCLiveThresholdPercent=90',
+        '-XX:G1RSetUpdatingPauseTimePercent=5',
+        '-XX:SurvivorRatio=32',
+        '-XX:+PerfDisableSharedMem',
+        '-XX:MaxTenuringThreshold=1',
+    ]
+    if cpus <= 4:
+        # Con pocos núcleos compartidos entre varios servidores, limitar los hilos de GC
+        flags.append(f'-XX:ParallelGCThreads={max(1, cpus)}')
+        flags.append(f'-XX:ConcGCThreads={max(1, cpus // 2)}')
+    return flags
+
+
+def _zgc_flags(heap_mb, cpus):
+    # ZGC: pausas casi nulas con heaps grandes (requiere Java 17+, el mínimo de Minecraft 1.18+)
+    return [
+        '-XX:+UseZGC',
+        '-XX:+AlwaysPreTouch',
+        '-XX:+DisableExplicitGC',
+        '-XX:+PerfDisableSharedMem',
+        f'-XX:ConcGCThreads={max(1, cpus // 4)}',
+    ]
+
+
+def _basic_flags(heap_mb, cpus):
+    return []
+
+
+PROFILES = {
+    'g1': ('G1 ajustado (flags de Aikar)', _g1_flags),
+    'zgc': ('ZGC para heaps grandes', _zgc_flags),
+    'basico': ('Solo -Xms/-Xmx', _basic_flags),
+}
+
+
+class JvmPlan:
+    def __init__(self, heap_mb, profile, flags, notes=None, host=None):
+        self.heap_mb = heap_mb
+        self.profile = profile
+        self.flags = flags
+        # Avisos para el usuario (p. ej. heap recortado por el presupuesto)
+        self.notes = notes or []
+        self.host = host
+
+    @property
+    def heap(self):
+        return _jvm_size(self.heap_mb)
+
+    def args(self):
+        return [f'-Xms{self.heap}', f'-Xmx{self.heap}'] + list(self.flags)
+
+    def render(self):
+        lines = [
+            '# Configuración de JVM generada por CraftNPlay',
+            f'# Perfil: {self.profile} ({PROFILES[self.profile][0]})',
+            '# -Xms: RAM inicial asignada',
+            '# -Xmx: RAM máxima asignada',
+        ]
+        if self.host:
+            lines.append(f'# {self.host}')
+        lines += [f'# {n}' for n in self.notes]
+        return '\n'.join(lines + self.args()) + '\n'
+
+
+class MemoryPlanner:
+    """
+    Presupuesto de memoria del host para los servidores y generador de
+    `user_jvm_args.txt`.
+
+    El presupuesto es `CNP_MEMORY_BUDGET_MB` o, si no se define, la RAM total
+    menos una reserva para el sistema y el bot (`CNP_MEMORY_RESERVE_MB`, por
+    defecto el 15 % y al menos 1 GB). Cada JVM cuenta su heap más un margen
+    (`CNP_JVM_OVERHEAD`, 15 % y al menos 256 MB) por metaspace, hilos y
+    buffers nativos.
+    """
+
+    def __init__(self, config=None, budget_mb=None, reserve_mb=None, overhead=None, profile=None):
+        self.config = config
+        self._budget_mb = budget_mb or (int(os.environ['CNP_MEMORY_BUDGET_MB'])
+                                        if os.environ.get('CNP_MEMORY_BUDGET_MB') else None)
+        self._reserve_mb = reserve_mb or (int(os.environ['CNP_MEMORY_RESERVE_MB'])
+                                          if os.environ.get('CNP_MEMORY_RESERVE_MB') else None)
+        self.overhead = float(overhead if overhead is not None else os.environ.get('CNP_JVM_OVERHEAD', 0.15))
+        self.default_profile = (profile or os.environ.get('CNP_JVM_PROFILE', 'auto')).lower()
+
+    # --- Presupuesto ---
+
+    def budget_mb(self):
+        if self._budget_mb:
+            return self._budget_mb
+        total, _ = host_memory()
+        if not total:
+            return None
+        reserve = self._reserve_mb if self._reserve_mb is not None else max(1024, int(total * 0.15))
+        return max(0, total - reserve)
+
+    def footprint_mb(self, heap_mb):
+        """Memoria real aproximada de una JVM con ese heap."""
+        return heap_mb + max(256, int(heap_mb * self.overhead))
+
+    # --- Plan para un servidor nuevo ---
+
+    def choose_profile(self, heap_mb, cpus):
+        if self.default_profile in PROFILES:
+            return self.default_profile
+        # auto: ZGC solo compensa con heaps grandes y núcleos de sobra
+        return 'zgc' if heap_mb >= 16 * 1024 and cpus >= 8 else 'g1'
+
+    def plan(self, server_type, heap_mb=None, profile=None):
+        notes = []
+        cpus = host_cpus()
+        if heap_mb is None:
+            heap_mb = DEFAULT_HEAP_MB.get((server_type or '').lower(), DEFAULT_MODDED_HEAP_MB)
+            budget = self.budget_mb()
+            if budget:
+                # Un servidor solo nunca debe poder llevar el host a swap
+                fit = int((budget - 256) / (1 + self.overhead)) // 512 * 512
+                if fit < MIN_HEAP_MB:
+                    # Ni el mínimo cabe: se escribe el mínimo igualmente, pero sin fingir que entra en el presupuesto
+                    heap_mb = MIN_HEAP_MB
+                    notes.append(f'El presupuesto del host ({format_mb(budget)}) no alcanza ni para el heap mínimo '
+                                 f'de {format_mb(MIN_HEAP_MB)} ({format_mb(self.footprint_mb(MIN_HEAP_MB))} con '
+                                 'margen): con la admisión de memoria activa no podrá arrancar hasta que se amplíe '
+                                 'CNP_MEMORY_BUDGET_MB o se reduzca CNP_MEMORY_RESERVE_MB')
+                elif fit < heap_mb:
+                    heap_mb = fit
+                    notes.append(f'Heap reducido a {format_mb(heap_mb)} por el presupuesto del host ({format_mb(budget)})')
+        profile = (profile or '').lower() or self.choose_profile(heap_mb, cpus)
+        if profile not in PROFILES:
+            raise ValueError(f'Perfil desconocido: {profile} (disponibles: {", ".join(PROFILES)})')
+        host = f'Host: {cpus} CPUs, presupuesto {format_mb(self.budget_mb())}'
+        return JvmPlan(heap_mb, profile, PROFILES[profile][1](heap_mb, cpus), notes, host=host)
+
+    def write(self, server_path, plan):
+        path = os.path.join(server_path, JVM_ARGS_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(plan.render())
+        os.replace(tmp_path, path)
+        return path
+
+    # --- Control de admisión ---
+
+    def admission(self, running_heaps, new_heap_mb):
+        """
+        ¿Cabe un servidor más? `running_heaps` es {nombre: heap MB} de los que
+        ya están en marcha. Devuelve (ok, motivo, usado_mb, presupuesto_mb).
+        """
+        budget = self.budget_mb()
+        used = sum(self.footprint_mb(h) for h in running_heaps.values())
+        needed = self.footprint_mb(new_heap_mb)
+        if budget and used + needed > budget:
+            return (False, f'{format_mb(used)} en uso + {format_mb(needed)} superan el presupuesto de {format_mb(budget)}',
+                    used, budget)
+        _, available = host_memory()
+        if available is not None and needed > available:
+            # Otros procesos del host también consumen: no empujarlo a swap
+            return False, f'solo quedan {format_mb(available)} libres en el host y hacen falta {format_mb(needed)}', used, budget
+        return True, None, used, budget
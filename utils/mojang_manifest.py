@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import asyncio
+
+from utils.downloader import DownloadError
+from utils.errors import log_exception
+
+MANIFEST_URL = 'https://launchermeta.mojang.com/mc/game/version_manifest.json'
+
+# Alias aceptados en lugar de un id de versión concreto
+LATEST_ALIASES = {
+    'latest': 'release',
+    'latest-release': 'release',
+    'ultima': 'release',
+    'latest-snapshot': 'snapshot',
+}
+
+
+def _read_json(path, default=None):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, OSError):
+        return default
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        pass
+
+
+class VersionManifest:
+    """
+    Manifest de versiones de Mojang persistido en disco e indexado en memoria.
+
+    Solo se consulta la red cuando caduca el TTL, y entonces con una petición
+    condicional (ETag / If-Modified-Since) que normalmente responde 304. Los
+    JSON de cada versión también se guardan en disco, así que validar una
+    versión y resolver la URL de `server.jar` no requiere ningún round-trip.
+    """
+
+    def __init__(self, downloader, cache_dir, ttl=3600, url=MANIFEST_URL):
+        self.downloader = downloader
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.url = url
+        self.manifest_path = os.path.join(cache_dir, 'version_manifest.json')
+        self.meta_path = os.path.join(cache_dir, 'version_manifest.meta.json')
+        self.versions_dir = os.path.join(cache_dir, 'versions')
+        self.meta = {}
+        self.by_id = {}
+        self.by_type = {}
+        self.latest = {}
+        self._refresh_lock = asyncio.Lock()
+        self._background = None
+        try:
+            os.makedirs(self.versions_dir, exist_ok=True)
+        except OSError:
+            pass
+        self._load()
+
+    # --- Índice ---
+
+    def _load(self):
+        self.meta = _read_json(self.meta_path, {}) or {}
+        manifest = _read_json(self.manifest_path)
+        if manifest:
+            self._build_index(manifest)
+
+    def _build_index(self, manifest):
+        by_id = {}
+        by_type = {}
+        for v in manifest.get('versions', []):
+            vid = v.get('id')
+            if not vid:
+                continue
+            by_id[vid] = v
+            by_type.setdefault(v.get('type', 'unknown'), []).append(v)
+        for entries in by_type.values():
+            # ISO 8601 ordena bien como texto
+            entries.sort(key=lambda e: e.get('releaseTime', ''), reverse=True)
+        self.by_id = by_id
+        self.by_type = by_type
+        self.latest = dict(manifest.get('latest', {}) or {})
+
+    @property
+    def loaded(self):
+        return bool(self.by_id)
+
+    def is_stale(self):
+        return time.time() - self.meta.get('fetched_at', 0) > self.ttl
+
+    # --- Refresco condicional ---
+
+    async def refresh(self, force=False):
+        """Refresca el manifest si caducó el TTL (o si `force`). Devuelve True si cambió."""
+        async with self._refresh_lock:
+            if not force and self.loaded and not self.is_stale():
+                return False
+            headers = {}
+            if self.loaded:
+                if self.meta.get('etag'):
+                    headers['If-None-Match'] = self.meta['etag']
+                if self.meta.get('last_modified'):
+                    headers['If-Modified-Since'] = self.meta['last_modified']
+            resp = await self.downloader.get(self.url, headers=headers, timeout=10)
+            if resp.status_code == 304:
+                self.meta['fetched_at'] = time.time()
+                _write_json(self.meta_path, self.meta)
+                return False
+            if resp.status_code != 200:
+                raise DownloadError(f'HTTP {resp.status_code} para {self.url}', status=resp.status_code)
+            manifest = resp.json()
+            self._build_index(manifest)
+            _write_json(self.manifest_path, manifest)
+            self.meta = {
+                'etag': resp.headers.get('ETag'),
+                'last_modified': resp.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+            }
+            _write_json(self.meta_path, self.meta)
+            return True
+
+    def _refresh_in_background(self):
+        if self._background and not self._background.done():
+            return
+
+        async def runner():
+            try:
+                await self.refresh()
+            except Exception as e:
+                log_exception(e, context='Background refresh of Mojang version manifest')
+
+        self._background = asyncio.ensure_future(runner())
+
+    async def ensure_fresh(self):
+        """Garantiza un índice cargado; si está caducado se refresca en segundo plano."""
+        if not self.loaded:
+            await self.refresh(force=True)
+        elif self.is_stale():
+            self._refresh_in_background()
+
+    # --- Consultas ---
+
+    def resolve_alias(self, version_id):
+        """Traduce alias como `latest` o `latest-snapshot` al id real."""
+        vtype = LATEST_ALIASES.get((version_id or '').lower())
+        if vtype:
+            return self.latest.get(vtype, version_id)
+        return version_id
+
+    async def get(self, version_id):
+        """Entrada del manifest para `version_id` (o alias), o None si no existe."""
+        await self.ensure_fresh()
+        version_id = self.resolve_alias(version_id)
+        entry = self.by_id.get(version_id)
+        if entry is None and time.time() - self.meta.get('fetched_at', 0) > 60:
+            # Puede ser una versión recién publicada: un refresco forzado como mucho por minuto
+            await self.refresh(force=True)
+            entry = self.by_id.get(version_id)
+        return entry
+
+    def search(self, prefix='', vtype=None, limit=20):
+        """Versiones cuyo id empieza por `prefix`, de la más nueva a la más antigua."""
+        if vtype:
+            pool = self.by_type.get(vtype, [])
+        else:
+            pool = sorted(self.by_id.values(), key=lambda e: e.get('releaseTime', ''), reverse=True)
+        out = [e for e in pool if e.get('id', '').startswith(prefix or '')]
+        return out[:limit]
+
+    async def version_json(self, version_id):
+        """JSON de la versión, servido desde disco si la URL del manifest no cambió."""
+        entry = await self.get(version_id)
+        if not entry:
+            raise DownloadError(f'Versión {version_id} no encontrada en el manifest oficial de Mojang')
+        path = os.path.join(self.versions_dir, f'{entry["id"]}.json')
+        cached = _read_json(path)
+        if cached and cached.get('_source_url') == entry.get('url'):
+            return cached
+        vjson = await self.downloader.fetch_json(entry.get('url'), timeout=10)
+        vjson['_source_url'] = entry.get('url')
+        _write_json(path, vjson)
+        return vjson
+
+    async def server_download(self, version_id):
+        """Dict `downloads.server` (url, sha1, size) de la versión, o None si no tiene."""
+        vjson = await self.version_json(version_id)
+        server = vjson.get('downloads', {}).get('server')
+        return server or None
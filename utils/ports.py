@@ -0,0 +1,164 @@
+import os
+import socket
+import threading
+
+from utils.templates import read_properties
+
+# Tipo de puerto -> (clave en servers.json, clave en server.properties, protocolo)
+PORT_KINDS = {
+    'game': ('port', 'server-port', socket.SOCK_STREAM),
+    'rcon': ('rcon_port', 'rcon.port', socket.SOCK_STREAM),
+    'query': ('query_port', 'query.port', socket.SOCK_DGRAM),
+}
+
+PORT_LABELS = {'game': 'juego', 'rcon': 'RCON', 'query': 'query'}
+
+# Primer puerto que se prueba para cada tipo (los valores por defecto de Minecraft)
+DEFAULT_BASES = {'game': 25565, 'rcon': 25575, 'query': 25585}
+
+
+def port_in_use(port, kind='game', host=''):
+    """True si no se puede abrir `port` en este host (otro proceso lo tiene)."""
+    sock_type = PORT_KINDS[kind][2]
+    s = socket.socket(socket.AF_INET, sock_type)
+    try:
+        if os.name == 'nt' and hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):
+            # En Windows SO_REUSEADDR dejaría "robar" el puerto; pedir uso exclusivo
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        elif sock_type == socket.SOCK_STREAM:
+            # Como Java en Linux: las conexiones en TIME_WAIT de un servidor recién
+            # parado no impiden abrir el puerto, solo otro proceso escuchando en él
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((host, int(port)))
+        return False
+    except OSError:
+        return True
+    finally:
+        s.close()
+
+
+def server_ports(info):
+    """
+    Puertos de un servidor registrado: {'game': n, 'rcon': n, 'query': n}.
+
+    Se leen de servers.json y, si faltan (servidores antiguos), de su
+    server.properties. `query.port` es por defecto el mismo que el de juego.
+    """
+    ports = {}
+    props = None
+    for kind, (entry_key, prop_key, _) in PORT_KINDS.items():
+        value = info.get(entry_key)
+        if value is None and info.get('path'):
+            if props is None:
+                props = read_properties(os.path.join(info['path'], 'server.properties'))
+            value = props.get(prop_key)
+        try:
+            ports[kind] = int(value) if value not in (None, '') else None
+        except (TypeError, ValueError):
+            ports[kind] = None
+    ports['game'] = ports['game'] or 25565
+    ports['rcon'] = ports['rcon'] or 25575
+    ports['query'] = ports['query'] or ports['game']
+    return ports
+
+
+class PortAllocator:
+    """
+    Reparto de puertos (juego, RCON, query) entre los servidores del host.
+
+    Un puerto se considera ocupado si ya está asignado a otro servidor en
+    servers.json, si está reservado por una instalación en curso o si otro
+    proceso lo tiene abierto ahora mismo. Cada tipo busca a partir de su base
+    (`CNP_PORT_BASE_GAME`, `CNP_PORT_BASE_RCON`, `CNP_PORT_BASE_QUERY`)
+    dentro de `CNP_PORT_SPAN` puertos.
+    """
+
+    def __init__(self, config, bases=None, span=None, host=''):
+        self.config = config
+        self.bases = dict(DEFAULT_BASES)
+        for kind in self.bases:
+            env = os.environ.get(f'CNP_PORT_BASE_{kind.upper()}')
+            if env:
+                self.bases[kind] = int(env)
+        self.bases.update(bases or {})
+        self.span = int(span or os.environ.get('CNP_PORT_SPAN', 1000))
+        self.host = host
+        # owner (ruta del servidor) -> {kind: puerto}, para instalaciones aún no registradas
+        self._reserved = {}
+        self._lock = threading.Lock()
+
+    # --- Índice ---
+
+    def assigned(self, exclude=None):
+        """{puerto: (servidor, tipo)} de todo lo registrado y reservado, salvo `exclude`."""
+        index = {}
+        servers = getattr(self.config, 'servers', {}) or {}
+        for name, info in servers.items():
+            if name == exclude or info.get('path') == exclude:
+                continue
+            for kind, port in server_ports(info).items():
+                index.setdefault(port, (name, kind))
+        for owner, ports in self._reserved.items():
+            if owner == exclude:
+                continue
+            for kind, port in ports.items():
+                index.setdefault(port, (os.path.basename(owner), kind))
+        return index
+
+    def _pick(self, kind, taken):
+        base = self.bases[kind]
+        for port in range(base, min(base + self.span, 65536)):
+            if port in taken:
+                continue
+            if port_in_use(port, kind, self.host):
+                continue
+            return port
+        raise RuntimeError(f'No quedan puertos libres para {kind} en {base}-{base + self.span - 1}')
+
+    # --- Reparto ---
+
+    def allocate(self, owner, kinds=('game', 'rcon', 'query'), prefer=None, keep=None):
+        """
+        Reserva puertos para `owner` (ruta del servidor) y los devuelve.
+
+        `prefer` ({kind: puerto}) se respeta si el puerto sigue libre, para
+        conservar los de un servidor que se reanuda o se reconfigura. `keep`
+        son puertos propios que no se cambian y no deben repetirse.
+        """
+        with self._lock:
+            taken = set(self.assigned(exclude=owner)) | set((keep or {}).values())
+            prefer = {**self._reserved.get(owner, {}), **(prefer or {})}
+            ports = {}
+            for kind in kinds:
+                wanted = prefer.get(kind)
+                if wanted and wanted not in taken and wanted not in ports.values() \
+                        and not port_in_use(wanted, kind, self.host):
+                    ports[kind] = wanted
+                else:
+                    ports[kind] = self._pick(kind, taken | set(ports.values()))
+                taken.add(ports[kind])
+            self._reserved[owner] = ports
+            return dict(ports)
+
+    def release(self, owner):
+        """Libera la reserva de `owner` (p. ej. una vez registrado en servers.json)."""
+        with self._lock:
+            self._reserved.pop(owner, None)
+
+    def busy(self, info):
+        """
+        Puertos de un servidor que ahora mismo tiene abiertos otro proceso.
+
+        Devuelve una lista de (tipo, puerto). Compartir número con otro
+        servidor registrado no es un conflicto mientras no estén los dos en
+        marcha, así que aquí solo cuentan los sockets reales.
+        """
+        ports = server_ports(info)
+        problems = []
+        for kind, port in ports.items():
+            if kind == 'query' and port == ports['game']:
+                # Sin query.port propio: comparte el del juego, nada más que comprobar
+                continue
+            if port_in_use(port, kind, self.host):
+                problems.append((kind, port))
+        return problems
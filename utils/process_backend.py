@@ -0,0 +1,282 @@
+import os
+import abc
+import stat
+import signal
+import asyncio
+import subprocess
+
+from utils.errors import log_exception
+
+# Scripts de inicio que se generan en cada servidor
+RUN_BAT = 'run.bat'
+RUN_SH = 'run.sh'
+
+RUN_BAT_CONTENT = (
+    "@echo off\n"
+    "title CraftNPlay Server Console\n"
+    "java @user_jvm_args.txt -jar server.jar nogui\n"
+    # "pause\n"
+)
+
+RUN_SH_CONTENT = (
+    "#!/bin/sh\n"
+    "# Script de inicio generado por CraftNPlay\n"
+    'cd "$(dirname "$0")"\n'
+    # exec: java hereda el PID (y el grupo de procesos) del script
+    "exec java @user_jvm_args.txt -jar server.jar nogui\n"
+)
+
+
+def write_start_scripts(server_path):
+    """Crea `run.bat` y `run.sh` (ejecutable) para que la carpeta sirva en Windows y en Linux."""
+    written = []
+    for name, content in ((RUN_BAT, RUN_BAT_CONTENT), (RUN_SH, RUN_SH_CONTENT)):
+        path = os.path.join(server_path, name)
+        with open(path, 'w', encoding='utf-8', newline='\r\n' if name == RUN_BAT else '\n') as f:
+            f.write(content)
+        if name == RUN_SH:
+            os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        written.append(name)
+    return written
+
+
+class ServerProcess:
+    """
+    Servidor en marcha: envuelve un `asyncio.subprocess.Process`.
+
+    Mantiene `poll()` y `pid` como `subprocess.Popen` para el código que ya
+    los usaba; la espera es siempre asíncrona (`wait`). Con `console` (un
+    `ConsoleBuffer`) la salida del proceso se vuelca en él y `write_line`
+    escribe en su stdin.
+    """
+
+    def __init__(self, proc, name=None, console=None):
+        self.proc = proc
+        self.name = name
+        self.pid = proc.pid
+        self.console = console
+        # Una tarea espera al proceso desde el principio: recoge su código de
+        # salida en cuanto termina (sin zombis aunque nadie llame a wait()).
+        self._waiter = asyncio.ensure_future(proc.wait())
+        self._reader = None
+        if console is not None and proc.stdout is not None:
+            self._reader = asyncio.ensure_future(console.pump(proc.stdout, name))
+
+    @property
+    def returncode(self):
+        return self.proc.returncode
+
+    @property
+    def stdin(self):
+        return self.proc.stdin
+
+    def poll(self):
+        return self.proc.returncode
+
+    def kill(self):
+        self.proc.kill()
+
+    async def write_line(self, line):
+        """Escribe una línea en la consola del servidor. False si no hay stdin o ya se cerró."""
+        stdin = self.proc.stdin
+        if stdin is None or stdin.is_closing() or self.returncode is not None:
+            return False
+        try:
+            stdin.write(line.rstrip('\r\n').encode('utf-8') + b'\n')
+            await stdin.drain()
+            return True
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+
+    async def wait(self, timeout=None):
+        """Espera a que termine; con `timeout` lanza asyncio.TimeoutError."""
+        if timeout is None:
+            return await asyncio.shield(self._waiter)
+        return await asyncio.wait_for(asyncio.shield(self._waiter), timeout=timeout)
+
+
+class ProcessBackend(abc.ABC):
+    """Interfaz común: arranque en un grupo propio y terminación escalonada sin bloquear el loop."""
+
+    name = 'base'
+    script_name = RUN_SH
+
+    def spawn_kwargs(self):
+        """Argumentos para create_subprocess_exec que aíslan al hijo en su propio grupo."""
+        return {}
+
+    def resolve_script(self, server_path, script_name):
+        return os.path.join(server_path, script_name)
+
+    def command_for(self, script_path):
+        return [script_path]
+
+    @staticmethod
+    def _console_pipes(console, stdin, stdout, stderr):
+        """Con consola capturada: stdin por tubería y stdout+stderr juntos hacia el buffer."""
+        if console is None:
+            return stdin, stdout, stderr
+        pipe = asyncio.subprocess.PIPE
+        return pipe, pipe, asyncio.subprocess.STDOUT
+
+    async def start(self, script_path, cwd, name=None, stdin=None, stdout=None, stderr=None, console=None,
+                    args=()):
+        stdin, stdout, stderr = self._console_pipes(console, stdin, stdout, stderr)
+        proc = await asyncio.create_subprocess_exec(
+            *self.command_for(script_path), *args, cwd=cwd,
+            stdin=stdin, stdout=stdout, stderr=stderr,
+            **self.spawn_kwargs(),
+        )
+        return ServerProcess(proc, name=name, console=console)
+
+    @abc.abstractmethod
+    async def signal_tree(self, proc, force=False):
+        """Señal de parada (o de muerte con `force`) a todo el árbol de procesos de `proc`."""
+
+    async def terminate(self, proc, grace=10, kill_wait=10):
+        """
+        Pide al árbol de procesos que termine; si no lo hace en `grace`
+        segundos, lo mata. Devuelve True si terminó a las buenas.
+        """
+        if proc.returncode is not None:
+            return True
+        await self.signal_tree(proc, force=False)
+        try:
+            await asyncio.wait_for(asyncio.shield(self._waitable(proc)), timeout=grace)
+            return True
+        except asyncio.TimeoutError:
+            pass
+        await self.signal_tree(proc, force=True)
+        try:
+            await asyncio.wait_for(asyncio.shield(self._waitable(proc)), timeout=kill_wait)
+        except asyncio.TimeoutError as e:
+            log_exception(e, context=f'Process {proc.pid} still alive after kill')
+        return False
+
+    async def kill(self, proc, kill_wait=10):
+        if proc.returncode is not None:
+            return
+        await self.signal_tree(proc, force=True)
+        try:
+            await asyncio.wait_for(asyncio.shield(self._waitable(proc)), timeout=kill_wait)
+        except asyncio.TimeoutError as e:
+            log_exception(e, context=f'Process {proc.pid} still alive after kill')
+
+    @staticmethod
+    def _waitable(proc):
+        if isinstance(proc, ServerProcess):
+            return proc._waiter
+        return asyncio.ensure_future(proc.wait())
+
+
+class PosixBackend(ProcessBackend):
+    """
+    Linux/macOS: cada servidor es líder de su propia sesión (y grupo), de modo
+    que SIGTERM/SIGKILL llegan a todo el árbol con `killpg`.
+    """
+
+    name = 'posix'
+    script_name = RUN_SH
+
+    def spawn_kwargs(self):
+        return {'start_new_session': True}
+
+    def resolve_script(self, server_path, script_name):
+        # Los servidores registrados desde Windows apuntan a run.bat: usar (o generar) run.sh
+        if script_name.lower().endswith(('.bat', '.cmd')):
+            sh_path = os.path.join(server_path, RUN_SH)
+            if not os.path.exists(sh_path) and os.path.isdir(server_path):
+                write_start_scripts(server_path)
+            return sh_path
+        return os.path.join(server_path, script_name)
+
+    async def start(self, script_path, cwd, name=None, stdin=None, stdout=None, stderr=None, console=None,
+                    args=()):
+        # Sin consola propia como en Windows: lo que no se pida (ni se capture)
+        # va a /dev/null (el servidor ya escribe logs/latest.log) en vez de a la salida del bot
+        stdin, stdout, stderr = self._console_pipes(console, stdin, stdout, stderr)
+        devnull = asyncio.subprocess.DEVNULL
+        return await super().start(
+            script_path, cwd, name=name,
+            stdin=devnull if stdin is None else stdin,
+            stdout=devnull if stdout is None else stdout,
+            stderr=devnull if stderr is None else stderr,
+            console=console, args=args,
+        )
+
+    def command_for(self, script_path):
+        if script_path.endswith('.sh') and not os.access(script_path, os.X_OK):
+            return ['/bin/sh', script_path]
+        return [script_path]
+
+    async def signal_tree(self, proc, force=False):
+        sig = signal.SIGKILL if force else signal.SIGTERM
+        try:
+            # Con start_new_session el PID del líder es también el id del grupo
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            try:
+                os.kill(proc.pid, sig)
+            except ProcessLookupError:
+                pass
+
+
+class WindowsBackend(ProcessBackend):
+    """Windows: consola propia como hasta ahora y `taskkill /T` (primero sin /F) lanzado de forma asíncrona."""
+
+    name = 'windows'
+    script_name = RUN_BAT
+
+    def spawn_kwargs(self):
+        flags = getattr(subprocess, 'CREATE_NEW_PROCESS_GROUP', 0)
+        return {'creationflags': flags}
+
+    async def start(self, script_path, cwd, name=None, stdin=None, stdout=None, stderr=None, console=None,
+                    args=()):
+        stdin, stdout, stderr = self._console_pipes(console, stdin, stdout, stderr)
+        # Ventana de consola propia solo si nadie lee la salida; si se captura, sin ventana
+        if stdout is None:
+            flags = getattr(subprocess, 'CREATE_NEW_CONSOLE', 0)
+        else:
+            flags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        proc = await asyncio.create_subprocess_exec(
+            script_path, *args, cwd=cwd, stdin=stdin, stdout=stdout, stderr=stderr,
+            creationflags=flags | getattr(subprocess, 'CREATE_NEW_PROCESS_GROUP', 0),
+        )
+        return ServerProcess(proc, name=name, console=console)
+
+    async def signal_tree(self, proc, force=False):
+        cmd = ['taskkill', '/T', '/PID', str(proc.pid)]
+        if force:
+            cmd.insert(1, '/F')
+        try:
+            killer = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+            await asyncio.wait_for(killer.wait(), timeout=15)
+        except (OSError, asyncio.TimeoutError) as e:
+            log_exception(e, context=f'taskkill failed for PID {proc.pid}')
+            if force:
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass
+
+
+_backend = None
+
+
+def get_backend():
+    """Backend del sistema actual (`CNP_PROCESS_BACKEND=posix|windows` para forzarlo)."""
+    global _backend
+    if _backend is None:
+        wanted = os.environ.get('CNP_PROCESS_BACKEND', 'auto').lower()
+        if wanted == 'auto':
+            wanted = 'windows' if os.name == 'nt' else 'posix'
+        _backend = WindowsBackend() if wanted == 'windows' else PosixBackend()
+    return _backend
+
+
+def default_script():
+    return get_backend().script_name
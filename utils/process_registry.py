@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import signal
+import asyncio
+
+from utils.errors import log_exception
+
+REGISTRY_FILE = 'processes.json'
+
+
+# --- Identidad de un proceso: PID + instante de creación ---
+
+def _linux_stat(pid):
+    with open(f'/proc/{pid}/stat', 'r', encoding='ascii', errors='replace') as f:
+        data = f.read()
+    # El nombre (campo 2) va entre paréntesis y puede tener espacios: partir tras el último ')'
+    return data[data.rfind(')') + 2:].split()
+
+
+def _windows_process(pid):
+    """(creación, sigue_vivo) en Windows vía OpenProcess/GetProcessTimes, o (None, False)."""
+    import ctypes
+    from ctypes import wintypes
+
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(0x1000, False, int(pid))  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not handle:
+        return None, False
+    try:
+        created, exited, kernel, user = (wintypes.FILETIME() for _ in range(4))
+        if not kernel32.GetProcessTimes(handle, ctypes.byref(created), ctypes.byref(exited),
+                                        ctypes.byref(kernel), ctypes.byref(user)):
+            return None, False
+        code = wintypes.DWORD()
+        alive = bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        return (created.dwHighDateTime << 32) | created.dwLowDateTime, alive
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def process_start_time(pid):
+    """
+    Instante de creación del proceso tal y como lo da el sistema (ticks desde
+    el arranque en Linux, FILETIME en Windows), o None si no existe o no se
+    puede saber. Junto con el PID identifica al proceso aunque el PID se
+    reutilice.
+    """
+    if not pid:
+        return None
+    if os.name == 'nt':
+        try:
+            created, alive = _windows_process(pid)
+        except (OSError, AttributeError):
+            return None
+        return created if alive else None
+    try:
+        fields = _linux_stat(pid)
+    except OSError:
+        return None
+    if fields and fields[0] in ('Z', 'X'):
+        # Zombi: ya terminó
+        return None
+    return int(fields[19]) if len(fields) > 19 else None
+
+
+def pid_alive(pid):
+    if os.name == 'nt':
+        return process_start_time(pid) is not None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    if os.path.isdir('/proc'):
+        return process_start_time(pid) is not None
+    return True
+
+
+def process_cmdline(pid):
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            return [part.decode('utf-8', errors='replace') for part in f.read().split(b'\0') if part]
+    except OSError:
+        return None
+
+
+class AttachedProcess:
+    """
+    Proceso que no es hijo del bot actual (lo lanzó una ejecución anterior).
+
+    Ofrece lo mismo que `ServerProcess` (`pid`, `poll`, `returncode`, `wait`,
+    `kill`); el código de salida no se puede conocer, así que al terminar
+    `returncode` vale -1. En Linux la salida se detecta con un pidfd (sin
+    sondeo); en el resto, comprobando cada `poll_interval` segundos.
+    """
+
+    attached = True
+
+    def __init__(self, pid, start_time, name=None, poll_interval=2.0):
+        self.pid = int(pid)
+        self.start_time = start_time
+        self.name = name
+        self.stdin = None
+        # Su salida iba a la tubería del bot anterior: no hay consola capturada
+        self.console = None
+        self.poll_interval = poll_interval
+        self._returncode = None
+        self._waiter = asyncio.ensure_future(self._wait_exit())
+
+    def _alive(self):
+        current = process_start_time(self.pid)
+        if current is None:
+            return pid_alive(self.pid) if self.start_time is None else False
+        return self.start_time is None or current == self.start_time
+
+    async def _wait_exit(self):
+        fd = None
+        if hasattr(os, 'pidfd_open'):
+            try:
+                fd = os.pidfd_open(self.pid)
+            except OSError:
+                fd = None
+        if fd is not None:
+            loop = asyncio.get_running_loop()
+            exited = loop.create_future()
+            loop.add_reader(fd, lambda: exited.done() or exited.set_result(None))
+            try:
+                # Por si terminó entre la comprobación y el pidfd_open
+                if self._alive():
+                    await exited
+            finally:
+                loop.remove_reader(fd)
+                os.close(fd)
+        else:
+            while self._alive():
+                await asyncio.sleep(self.poll_interval)
+        self._returncode = -1
+        return self._returncode
+
+    @property
+    def returncode(self):
+        return self._returncode
+
+    def poll(self):
+        return self._returncode
+
+    def kill(self):
+        # En Windows os.kill con cualquier señal que no sea CTRL_* llama a TerminateProcess
+        os.kill(self.pid, signal.SIGTERM if os.name == 'nt' else signal.SIGKILL)
+
+    async def write_line(self, line):
+        return False
+
+    async def wait(self, timeout=None):
+        if timeout is None:
+            return await asyncio.shield(self._waiter)
+        return await asyncio.wait_for(asyncio.shield(self._waiter), timeout=timeout)
+
+
+class ProcessRegistry:
+    """
+    Registro persistente (`processes.json`) de los procesos que lanza el bot:
+    PID, instante de creación, línea de comandos y puertos de cada servidor,
+    más el túnel de Playit. Permite volver a "engancharse" a ellos tras
+    reiniciar el bot en lugar de perderlos o arrancar una segunda JVM sobre
+    el mismo mundo.
+    """
+
+    def __init__(self, path=REGISTRY_FILE):
+        self.path = path
+        self.data = {'servers': {}, 'playit': None}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self.data = {'servers': data.get('servers') or {}, 'playit': data.get('playit')}
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            log_exception(e, context=f'Could not read {self.path}; starting with an empty process registry')
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log_exception(e, context=f'Could not write {self.path}')
+
+    @staticmethod
+    def _entry(process, command=None, **extra):
+        entry = {
+            'pid': process.pid,
+            'start_time': process_start_time(process.pid),
+            'started_at': time.time(),
+            'command': command or process_cmdline(process.pid),
+        }
+        entry.update({k: v for k, v in extra.items() if v is not None})
+        return entry
+
+    def record(self, name, process, command=None, ports=None, path=None):
+        self.data['servers'][name] = self._entry(process, command, ports=ports, path=path)
+        self.save()
+
+    def remove(self, name):
+        if self.data['servers'].pop(name, None) is not None:
+            self.save()
+
+    def record_playit(self, process, command=None):
+        self.data['playit'] = self._entry(process, command)
+        self.save()
+
+    def remove_playit(self):
+        if self.data.get('playit') is not None:
+            self.data['playit'] = None
+            self.save()
+
+    @staticmethod
+    def _matches(entry):
+        pid = entry.get('pid')
+        if not pid:
+            return False
+        current = process_start_time(pid)
+        recorded = entry.get('start_time')
+        if current is None or recorded is None:
+            # Sin instante de creación (p. ej. macOS) solo se puede comprobar que el PID existe
+            return recorded is None and pid_alive(pid)
+        return current == recorded
+
+    def reattach(self):
+        """
+        Comprueba cada entrada: si el PID sigue vivo y es el mismo proceso
+        (mismo instante de creación) devuelve un AttachedProcess; si no, la
+        borra. Devuelve ({servidor: AttachedProcess}, AttachedProcess|None, [nombres obsoletos]).
+        """
+        live, stale = {}, []
+        for name, entry in list(self.data['servers'].items()):
+            if self._matches(entry):
+                live[name] = AttachedProcess(entry['pid'], entry.get('start_time'), name=name)
+            else:
+                stale.append(name)
+                del self.data['servers'][name]
+        playit = None
+        entry = self.data.get('playit')
+        if entry:
+            if self._matches(entry):
+                playit = AttachedProcess(entry['pid'], entry.get('start_time'), name='playit')
+            else:
+                self.data['playit'] = None
+        if stale or (entry and playit is None):
+            self.save()
+        return live, playit, stale
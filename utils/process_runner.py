@@ -0,0 +1,127 @@
+import time
+import asyncio
+from collections import deque
+
+from utils.process_backend import get_backend
+
+
+class ProcessResult:
+    def __init__(self, returncode, lines, elapsed, timed_out=False):
+        self.returncode = returncode
+        # Últimas líneas de salida (stdout y stderr intercalados)
+        self.lines = lines
+        self.elapsed = elapsed
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+    def tail(self, n=20, max_chars=1800):
+        """Últimas `n` líneas, recortadas para caber en un mensaje de Discord."""
+        text = '\n'.join(list(self.lines)[-n:])
+        if len(text) > max_chars:
+            text = '...' + text[-max_chars:]
+        return text
+
+
+async def _pump(stream, label, sink):
+    while True:
+        raw = await stream.readline()
+        if not raw:
+            return
+        sink(label, raw.decode('utf-8', errors='replace').rstrip('\r\n'))
+
+
+async def terminate(proc, grace=5):
+    """
+    Termina `proc` y sus hijos sin bloquear el loop: SIGTERM (o taskkill) al
+    grupo, espera y, si hace falta, kill. Ver `utils.process_backend`.
+    """
+    await get_backend().terminate(proc, grace=grace)
+
+
+async def run_streamed(cmd, cwd=None, timeout=None, log_path=None, on_line=None,
+                       buffer_lines=200, env=None):
+    """
+    Ejecuta `cmd` como subproceso asyncio y transmite su salida línea a línea.
+
+    Cada línea se añade a `log_path` (si se indica), a un buffer circular de
+    `buffer_lines` líneas y se pasa a `on_line(label, line)` (label es
+    'stdout' o 'stderr'). Si se supera `timeout` el proceso se termina y
+    `ProcessResult.timed_out` queda a True; si la tarea se cancela, el
+    proceso también se termina antes de propagar la cancelación.
+    """
+    started = time.monotonic()
+    lines = deque(maxlen=buffer_lines)
+    log_f = None
+    if log_path:
+        try:
+            log_f = open(log_path, 'a', encoding='utf-8')
+        except OSError:
+            log_f = None
+
+    def sink(label, line):
+        entry = line if label == 'stdout' else f'[stderr] {line}'
+        lines.append(entry)
+        if log_f:
+            try:
+                log_f.write(f'[{time.strftime("%Y-%m-%d %H:%M:%S")}] {entry}\n')
+                log_f.flush()
+            except OSError:
+                pass
+        if on_line:
+            try:
+                on_line(label, line)
+            except Exception:
+                pass
+
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, cwd=cwd, env=env,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # Grupo propio: al terminar se termina también cualquier hijo
+            **get_backend().spawn_kwargs(),
+        )
+        pumps = asyncio.gather(_pump(proc.stdout, 'stdout', sink), _pump(proc.stderr, 'stderr', sink))
+        timed_out = False
+        try:
+            await asyncio.wait_for(asyncio.shield(pumps), timeout=timeout)
+            await proc.wait()
+        except asyncio.TimeoutError:
+            timed_out = True
+            await terminate(proc)
+            try:
+                # Un nieto podría mantener abiertas las tuberías: no esperar indefinidamente
+                await asyncio.wait_for(pumps, timeout=5)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            await terminate(proc)
+            pumps.cancel()
+            await asyncio.gather(pumps, return_exceptions=True)
+            raise
+        return ProcessResult(proc.returncode, lines, time.monotonic() - started, timed_out=timed_out)
+    finally:
+        if log_f:
+            log_f.close()
+
+
+async def check_java(java='java', timeout=5):
+    """
+    Comprueba que `java` está disponible. Devuelve (ok, descripción).
+
+    `java -version` escribe en stderr; la primera línea sirve de descripción.
+    Si el ejecutable no existe la descripción es None.
+    """
+    try:
+        result = await run_streamed([java, '-version'], timeout=timeout, buffer_lines=5)
+    except OSError:
+        return False, None
+    first = result.lines[0] if result.lines else ''
+    if first.startswith('[stderr] '):
+        first = first[len('[stderr] '):]
+    return result.ok, first
+
@@ -0,0 +1,121 @@
+import io
+import time
+import asyncio
+
+import discord
+
+from utils.errors import log_exception
+
+# Límites de Discord (descripción de embed: 4096 caracteres)
+MAX_DESCRIPTION = 3900
+
+
+class ProgressReporter:
+    """
+    Un único mensaje (embed) que se edita con el estado de una operación larga.
+
+    Los métodos `line`, `detail` y `debug` son síncronos: solo actualizan el
+    estado y marcan el mensaje como pendiente. Una tarea en segundo plano
+    agrupa los cambios y edita el mensaje como mucho una vez cada
+    `min_interval` segundos, así que las esperas por rate limit de Discord
+    nunca frenan la operación. Las líneas de depuración no se publican: se
+    adjuntan como fichero al terminar.
+    """
+
+    def __init__(self, ctx, title, job=None, min_interval=2.0, max_lines=15):
+        self.ctx = ctx
+        self.title = title
+        self.job = job
+        self.min_interval = min_interval
+        self.max_lines = max_lines
+        self.lines = []
+        self.debug_lines = []
+        self.detail_text = ''
+        self.color = discord.Color.blurple()
+        self.message = None
+        self.started = time.monotonic()
+        self._dirty = asyncio.Event()
+        self._task = None
+        self._finished = False
+
+    # --- Estado (no bloquea) ---
+
+    def line(self, text):
+        """Añade una línea visible al resumen (p. ej. '✅ eula.txt creado')."""
+        self.lines.append(str(text))
+        self._dirty.set()
+
+    def detail(self, text):
+        """Texto de progreso en vivo (descarga, instalador...), sustituye al anterior."""
+        self.detail_text = text or ''
+        self._dirty.set()
+
+    def debug(self, text):
+        """Línea de depuración: no se publica, va al adjunto final."""
+        self.debug_lines.append(str(text))
+
+    def touch(self):
+        self._dirty.set()
+
+    # --- Render ---
+
+    def _render(self):
+        shown = self.lines[-self.max_lines:]
+        hidden = len(self.lines) - len(shown)
+        body = '\n'.join(shown)
+        if hidden:
+            body = f'… ({hidden} líneas anteriores)\n' + body
+        detail = self.detail_text or (self.job.progress if self.job else '')
+        if detail and not self._finished:
+            body += f'\n\n⏳ {detail}'
+        if len(body) > MAX_DESCRIPTION:
+            body = '…' + body[-MAX_DESCRIPTION:]
+        embed = discord.Embed(title=self.title, description=body or '…', color=self.color)
+        footer = f'{time.monotonic() - self.started:.0f}s'
+        if self.job is not None:
+            footer = f'{self.job.id} · {self.job.stage or "en cola"} · ' + footer
+        embed.set_footer(text=footer)
+        return embed
+
+    async def _flush(self):
+        embed = self._render()
+        try:
+            if self.message is None:
+                self.message = await self.ctx.send(embed=embed)
+            else:
+                await self.message.edit(embed=embed)
+        except discord.HTTPException as e:
+            log_exception(e, context=f'Progress message update failed ({self.title})')
+
+    async def _run(self):
+        while not self._finished:
+            await self._dirty.wait()
+            self._dirty.clear()
+            await self._flush()
+            await asyncio.sleep(self.min_interval)
+
+    # --- Ciclo de vida ---
+
+    async def start(self):
+        """Publica el mensaje inicial y arranca la tarea de edición."""
+        await self._flush()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def finish(self, ok=True, summary=None):
+        """Última edición (verde/roja) y, si hay trazas, un adjunto con ellas."""
+        self._finished = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if summary:
+            self.lines.append(summary)
+        self.color = discord.Color.green() if ok else discord.Color.red()
+        await self._flush()
+        if self.debug_lines:
+            data = '\n'.join(self.debug_lines).encode('utf-8')
+            try:
+                await self.ctx.send(file=discord.File(io.BytesIO(data), filename='install_debug.txt'))
+            except discord.HTTPException as e:
+                log_exception(e, context=f'Could not upload debug attachment ({self.title})')
@@ -0,0 +1,461 @@
+import os
+import time
+import struct
+import asyncio
+
+from utils.errors import log_exception
+
+# Tipos de paquete del protocolo RCON de Source/Minecraft
+TYPE_RESPONSE = 0
+TYPE_COMMAND = 2
+TYPE_AUTH = 3
+TYPE_AUTH_RESPONSE = 2
+# Tipo que el servidor no entiende: contesta "Unknown request" sin ejecutar nada.
+# Sirve de ping (keepalive) y de marcador de fin de respuesta.
+TYPE_SENTINEL = 100
+
+# Minecraft trocea las respuestas largas en paquetes de como mucho 4096 bytes
+MAX_RESPONSE_CHUNK = 4096
+MAX_PACKET = 4096 + 10 + 4096  # margen generoso para servidores modificados
+
+
+class RconError(Exception):
+    """Error de conexión o protocolo RCON."""
+
+
+class RconAuthError(RconError):
+    """El servidor rechazó la contraseña."""
+
+
+def encode_packet(request_id, ptype, body):
+    payload = struct.pack('<ii', request_id, ptype) + body.encode('utf-8') + b'\x00\x00'
+    return struct.pack('<i', len(payload)) + payload
+
+
+async def read_packet(reader):
+    """Lee un paquete y devuelve (id, tipo, cuerpo)."""
+    header = await reader.readexactly(4)
+    (length,) = struct.unpack('<i', header)
+    if length < 10 or length > MAX_PACKET:
+        raise RconError(f'Paquete RCON de tamaño inválido ({length})')
+    data = await reader.readexactly(length)
+    request_id, ptype = struct.unpack('<ii', data[:8])
+    return request_id, ptype, data[8:-2].decode('utf-8', errors='replace')
+
+
+class RconSession:
+    """
+    Una conexión RCON autenticada con un servidor.
+
+    Las respuestas se reparten por id de petición: cada comando espera solo
+    los paquetes con su id, así que la respuesta tardía de un comando que
+    agotó su timeout se descarta en lugar de atribuirse al siguiente.
+
+    En el cable los comandos van de uno en uno: el lector RCON de Minecraft
+    procesa un único paquete por `read()` y cierra la conexión si recibe dos
+    juntos, así que no se puede enviar el siguiente antes de tener respuesta.
+    Una respuesta de menos de 4096 bytes llega en un solo paquete; si el
+    primer trozo viene lleno se envía un marcador (`TYPE_SENTINEL`) y se
+    acumulan trozos hasta que llega su respuesta.
+    """
+
+    def __init__(self, host, port, password, timeout=5.0):
+        self.host = host
+        self.port = int(port)
+        self.password = password
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._next_id = 1
+        # id -> asyncio.Queue con los paquetes recibidos para esa petición
+        self._waiting = {}
+        self._send_lock = asyncio.Lock()
+        self.last_used = 0.0
+        self.connected_at = None
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing() \
+            and self._read_task is not None and not self._read_task.done()
+
+    def _new_id(self):
+        request_id = self._next_id
+        self._next_id = self._next_id + 1 if self._next_id < 0x7FFFFFFF else 1
+        return request_id
+
+    async def connect(self):
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), timeout=self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise RconError(f'No se pudo conectar a {self.host}:{self.port} ({e or "timeout"})') from e
+        self._read_task = asyncio.ensure_future(self._read_loop())
+        try:
+            await self._authenticate()
+        except BaseException:
+            await self.close()
+            raise
+        self.connected_at = self.last_used = time.monotonic()
+
+    async def _authenticate(self):
+        request_id = self._new_id()
+        queue = self._waiting[request_id] = asyncio.Queue()
+        # Si la contraseña es incorrecta el servidor contesta con id -1
+        failed = self._waiting[-1] = asyncio.Queue()
+        try:
+            self._writer.write(encode_packet(request_id, TYPE_AUTH, self.password or ''))
+            await self._writer.drain()
+            get_ok = asyncio.ensure_future(queue.get())
+            get_failed = asyncio.ensure_future(failed.get())
+            done, pending = await asyncio.wait({get_ok, get_failed, self._read_task},
+                                               timeout=self.timeout, return_when=asyncio.FIRST_COMPLETED)
+            for fut in (get_ok, get_failed):
+                if fut not in done:
+                    fut.cancel()
+            if get_failed in done and get_failed.result() is not None:
+                raise RconAuthError('Contraseña RCON incorrecta')
+            if not done:
+                raise RconError('Timeout autenticando RCON')
+            item = get_ok.result() if get_ok in done else None
+            # Algunos servidores mandan antes un RESPONSE vacío: el que cuenta es AUTH_RESPONSE
+            while item is not None and item[0] != TYPE_AUTH_RESPONSE:
+                item = await asyncio.wait_for(queue.get(), timeout=self.timeout)
+            if item is None:
+                raise RconError('El servidor cerró la conexión durante la autenticación')
+        finally:
+            self._waiting.pop(request_id, None)
+            self._waiting.pop(-1, None)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                request_id, ptype, body = await read_packet(self._reader)
+                queue = self._waiting.get(request_id)
+                if queue is not None:
+                    queue.put_nowait((ptype, body))
+                # Sin nadie esperando: respuesta de una petición abandonada, se descarta
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, RconError):
+            pass
+        finally:
+            # Despertar a quien espere: la conexión ha muerto
+            for queue in self._waiting.values():
+                queue.put_nowait(None)
+
+    async def _next_packet(self, queue, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        item = await asyncio.wait_for(queue.get(), timeout=remaining)
+        if item is None:
+            raise RconError('Conexión RCON cerrada por el servidor')
+        return item
+
+    async def command(self, cmd, timeout=None):
+        """Ejecuta `cmd` y devuelve la respuesta completa como texto."""
+        if not self.connected:
+            raise RconError('Sesión RCON no conectada')
+        deadline = time.monotonic() + (timeout or self.timeout)
+        async with self._send_lock:
+            request_id = self._new_id()
+            queue = self._waiting[request_id] = asyncio.Queue()
+            sentinel_id = None
+            try:
+                self._writer.write(encode_packet(request_id, TYPE_COMMAND, cmd))
+                await self._writer.drain()
+                _, body = await self._next_packet(queue, deadline)
+                if len(body.encode('utf-8')) < MAX_RESPONSE_CHUNK:
+                    self.last_used = time.monotonic()
+                    return body
+                # Respuesta troceada: pedir el marcador y juntar hasta que conteste
+                parts = [body]
+                sentinel_id = self._new_id()
+                sentinel = self._waiting[sentinel_id] = asyncio.Queue()
+                self._writer.write(encode_packet(sentinel_id, TYPE_SENTINEL, ''))
+                await self._writer.drain()
+                await self._next_packet(sentinel, deadline)
+                # El servidor contesta en orden: todos los trozos llegaron antes que el marcador
+                while not queue.empty():
+                    item = queue.get_nowait()
+                    if item is None:
+                        break
+                    parts.append(item[1])
+                self.last_used = time.monotonic()
+                return ''.join(parts)
+            except asyncio.TimeoutError:
+                # (en 3.11+ es un OSError: no confundirlo con un fallo de envío)
+                raise
+            except (ConnectionError, OSError) as e:
+                raise RconError(f'Error enviando a RCON: {e}') from e
+            finally:
+                self._waiting.pop(request_id, None)
+                if sentinel_id is not None:
+                    self._waiting.pop(sentinel_id, None)
+
+    async def ping(self, timeout=None):
+        """Keepalive: un paquete que no ejecuta nada. Devuelve el RTT en segundos."""
+        if not self.connected:
+            raise RconError('Sesión RCON no conectada')
+        started = time.monotonic()
+        deadline = started + (timeout or self.timeout)
+        async with self._send_lock:
+            request_id = self._new_id()
+            queue = self._waiting[request_id] = asyncio.Queue()
+            try:
+                self._writer.write(encode_packet(request_id, TYPE_SENTINEL, ''))
+                await self._writer.drain()
+                await self._next_packet(queue, deadline)
+            except asyncio.TimeoutError:
+                # (en 3.11+ es un OSError: no confundirlo con un fallo de envío)
+                raise
+            except (ConnectionError, OSError) as e:
+                raise RconError(f'Error enviando a RCON: {e}') from e
+            finally:
+                self._waiting.pop(request_id, None)
+        return time.monotonic() - started
+
+    async def close(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()
+                await asyncio.wait_for(self._writer.wait_closed(), timeout=2)
+            except (OSError, asyncio.TimeoutError):
+                pass
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._writer = None
+        self._read_task = None
+
+
+class RconPool:
+    """
+    Sesiones RCON persistentes, una por (host, puerto).
+
+    Cada comando reutiliza la sesión ya autenticada del servidor: un viaje de
+    ida y vuelta en lugar de conexión TCP + autenticación + cierre. Si la
+    conexión se cae se reconecta una vez de inmediato; tras fallos seguidos
+    al conectar se espera con backoff exponencial (`CNP_RCON_BACKOFF_MAX`)
+    antes de volver a intentarlo, fallando rápido mientras tanto. Una tarea
+    de keepalive hace ping a las sesiones inactivas (`CNP_RCON_KEEPALIVE`
+    segundos) y cierra las que no responden o llevan demasiado sin usarse
+    (`CNP_RCON_IDLE_CLOSE`).
+    """
+
+    def __init__(self, password=None, timeout=None, keepalive=None, idle_close=None, backoff_max=None):
+        self.password = password if password is not None else os.getenv('RCON_PASSWORD')
+        self.timeout = float(timeout or os.getenv('CNP_RCON_TIMEOUT', 5))
+        self.keepalive = float(keepalive or os.getenv('CNP_RCON_KEEPALIVE', 60))
+        self.idle_close = float(idle_close or os.getenv('CNP_RCON_IDLE_CLOSE', 900))
+        self.backoff_max = float(backoff_max or os.getenv('CNP_RCON_BACKOFF_MAX', 60))
+        self._sessions = {}
+        self._locks = {}
+        # (host, port) -> (fallos seguidos, instante del próximo intento)
+        self._backoff = {}
+        self._keepalive_task = None
+        self.stats = {'connects': 0, 'commands': 0, 'reconnects': 0, 'auth_failures': 0}
+
+    @staticmethod
+    def address(server_info):
+        """(host, puerto) RCON de una entrada de servers.json."""
+        return server_info.get('rcon_host', 'localhost'), int(server_info.get('rcon_port', 25575))
+
+    def _lock(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    async def session(self, host, port, password=None):
+        """Sesión conectada para (host, puerto), abriéndola si hace falta."""
+        key = (host, int(port))
+        session = self._sessions.get(key)
+        if session is not None and session.connected:
+            return session
+        async with self._lock(key):
+            session = self._sessions.get(key)
+            if session is not None and session.connected:
+                return session
+            failures, next_try = self._backoff.get(key, (0, 0.0))
+            wait = next_try - time.monotonic()
+            if wait > 0:
+                raise RconError(f'RCON de {host}:{port} no disponible; reintento en {wait:.0f}s')
+            if session is not None:
+                await session.close()
+                self.stats['reconnects'] += 1
+            session = RconSession(host, port, password or self.password, timeout=self.timeout)
+            try:
+                await session.connect()
+            except RconAuthError:
+                self.stats['auth_failures'] += 1
+                self._sessions.pop(key, None)
+                raise
+            except RconError:
+                failures += 1
+                self._backoff[key] = (failures, time.monotonic() + min(self.backoff_max, 2 ** (failures - 1)))
+                self._sessions.pop(key, None)
+                raise
+            self._backoff.pop(key, None)
+            self._sessions[key] = session
+            self.stats['connects'] += 1
+            self._ensure_keepalive()
+            return session
+
+    async def command(self, host, port, cmd, timeout=None, password=None):
+        """Ejecuta `cmd` en el servidor; reconecta una vez si la sesión se había caído."""
+        for attempt in (1, 2):
+            session = await self.session(host, port, password)
+            try:
+                result = await session.command(cmd, timeout=timeout)
+                self.stats['commands'] += 1
+                return result
+            except RconError:
+                if attempt == 2 or session.connected:
+                    raise
+                # La sesión murió (servidor reiniciado, conexión cortada): una nueva y reintentar
+            except asyncio.TimeoutError:
+                # El estado de la conexión es incierto tras un timeout: no reutilizarla
+                await self.discard(host, port)
+                raise
+
+    def is_reachable(self, host, port):
+        """False si el servidor está en backoff tras fallos de conexión."""
+        key = (host, int(port))
+        return key in self._sessions or key not in self._backoff
+
+    async def command_for(self, server_info, cmd, timeout=None):
+        host, port = self.address(server_info)
+        return await self.command(host, port, cmd, timeout=timeout)
+
+    async def discard(self, host, port):
+        """Cierra la sesión de un servidor (p. ej. al detenerlo)."""
+        key = (host, int(port))
+        session = self._sessions.pop(key, None)
+        self._backoff.pop(key, None)
+        if session is not None:
+            await session.close()
+
+    async def close_all(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            await session.close()
+
+    def _ensure_keepalive(self):
+        if self.keepalive > 0 and (self._keepalive_task is None or self._keepalive_task.done()):
+            self._keepalive_task = asyncio.ensure_future(self._keepalive_loop())
+
+    async def _keepalive_loop(self):
+        while self._sessions:
+            await asyncio.sleep(self.keepalive)
+            now = time.monotonic()
+            for key, session in list(self._sessions.items()):
+                if now - session.last_used < self.keepalive:
+                    continue
+                if now - session.last_used > self.idle_close:
+                    await self.discard(*key)
+                    continue
+                try:
+                    await session.ping()
+                except (RconError, asyncio.TimeoutError) as e:
+                    log_exception(e, context=f'RCON keepalive failed for {key[0]}:{key[1]}')
+                    await self.discard(*key)
+
+
+# --- Guiones y difusión ---
+
+def parse_script(text):
+    """
+    Líneas de un guion RCON: admite bloque de código (```...```), ignora
+    líneas vacías y comentarios (#) y quita la barra inicial de cada comando.
+    """
+    text = (text or '').strip()
+    if text.startswith('```'):
+        text = text[3:]
+        if text.endswith('```'):
+            text = text[:-3]
+        # ```txt, ```mcfunction...: la primera línea es el lenguaje si no lleva espacios
+        first, _, rest = text.partition('\n')
+        if rest and first.strip() and ' ' not in first.strip():
+            text = rest
+    commands = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        commands.append(line[1:] if line.startswith('/') else line)
+    return commands
+
+
+class ScriptResult:
+    """Resultado de un guion en un servidor: [(comando, ok, texto)], error global y tiempo."""
+
+    def __init__(self, server):
+        self.server = server
+        self.outputs = []
+        self.error = None
+        self.elapsed = 0.0
+
+    @property
+    def failed(self):
+        return sum(1 for _, ok, _ in self.outputs if not ok)
+
+    @property
+    def ok(self):
+        return self.error is None and self.failed == 0
+
+
+async def run_script(pool, server, server_info, commands, timeout=None, server_timeout=None, stop_on_error=False):
+    """
+    Ejecuta `commands` en orden por la sesión del pool de un servidor. El
+    tiempo total está limitado por `server_timeout`; cada comando, por
+    `timeout`. Nunca lanza: los errores quedan en el ScriptResult.
+    """
+    result = ScriptResult(server)
+    started = time.monotonic()
+    host, port = pool.address(server_info)
+
+    async def run_all():
+        for cmd in commands:
+            try:
+                text = await pool.command(host, port, cmd, timeout=timeout)
+                result.outputs.append((cmd, True, text))
+            except asyncio.TimeoutError:
+                result.outputs.append((cmd, False, 'timeout'))
+                if stop_on_error:
+                    return
+            except RconAuthError as e:
+                # Sin autenticar no va a funcionar ningún comando más
+                result.error = str(e)
+                return
+            except RconError as e:
+                if not pool.is_reachable(host, port):
+                    # No se pudo conectar: el resto del guion fallaría igual
+                    result.error = str(e)
+                    return
+                result.outputs.append((cmd, False, str(e)))
+                if stop_on_error:
+                    return
+
+    try:
+        await asyncio.wait_for(run_all(), timeout=server_timeout)
+    except asyncio.TimeoutError:
+        result.error = f'timeout del servidor ({server_timeout}s)'
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+async def broadcast(pool, targets, commands, timeout=None, server_timeout=None, stop_on_error=False):
+    """Ejecuta el guion en todos los `targets` ({nombre: info}) en paralelo. Devuelve {nombre: ScriptResult}."""
+    names = list(targets)
+    results = await asyncio.gather(*(
+        run_script(pool, name, targets[name], commands, timeout=timeout,
+                   server_timeout=server_timeout, stop_on_error=stop_on_error)
+        for name in names
+    ))
+    return dict(zip(names, results))
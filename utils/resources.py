@@ -0,0 +1,405 @@
+import os
+import copy
+import time
+import asyncio
+import threading
+from array import array
+
+from utils.errors import log_exception
+
+PROC = '/proc'
+# Clave del agente de Playit en `targets()`: una tupla nunca coincide con el nombre de un servidor
+TUNNEL_TARGET = ('tunnel', 'playit')
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+try:
+    CLK_TCK = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    CLK_TCK, PAGE_SIZE = 100, 4096
+
+
+def proc_available():
+    """Solo Linux: el muestreo lee /proc directamente (sin psutil)."""
+    return os.path.isdir(os.path.join(PROC, 'self'))
+
+
+def read_stat(pid):
+    """
+    (ppid, ticks de CPU, hilos, starttime, rss en bytes) de /proc/<pid>/stat,
+    o None si el proceso ya no existe.
+    """
+    try:
+        with open(f'{PROC}/{pid}/stat', 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # El nombre del proceso va entre paréntesis y puede contener espacios
+    fields = data[data.rfind(b')') + 2:].split()
+    try:
+        return (int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[17]), int(fields[19]),
+                int(fields[21]) * PAGE_SIZE)
+    except (IndexError, ValueError):
+        return None
+
+
+def read_io(pid):
+    """(bytes leídos, bytes escritos) en disco de /proc/<pid>/io, o (0, 0) si no se puede leer."""
+    read = written = 0
+    try:
+        with open(f'{PROC}/{pid}/io', 'rb') as f:
+            for line in f:
+                if line.startswith(b'read_bytes:'):
+                    read = int(line.split()[1])
+                elif line.startswith(b'write_bytes:'):
+                    written = int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return read, written
+
+
+def read_swap(pid):
+    """VmSwap en bytes de /proc/<pid>/status (0 si no aparece)."""
+    try:
+        with open(f'{PROC}/{pid}/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmSwap:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def children_map():
+    """{ppid: [pid, ...]} de todos los procesos del host (un recorrido completo de /proc)."""
+    children = {}
+    for entry in os.listdir(PROC):
+        if not entry.isdigit():
+            continue
+        stat = read_stat(entry)
+        if stat is not None:
+            children.setdefault(stat[0], []).append(int(entry))
+    return children
+
+
+def process_tree(root, children):
+    pids, pending = [], [root]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        pending.extend(children.get(pid, ()))
+    return pids
+
+
+def sparkline(values, width=30):
+    """Valores como una línea de bloques (▁…█), reducida a `width` caracteres promediando."""
+    values = list(values)
+    if not values:
+        return ''
+    if len(values) > width:
+        step = len(values) / width
+        values = [sum(chunk) / len(chunk) for chunk in
+                  (values[int(i * step):int((i + 1) * step)] or values[int(i * step):int(i * step) + 1]
+                   for i in range(width))]
+    low, high = min(values), max(values)
+    if high - low < 1e-9:
+        return SPARK_CHARS[0 if high <= 0 else 3] * len(values)
+    scale = (len(SPARK_CHARS) - 1) / (high - low)
+    return ''.join(SPARK_CHARS[int((v - low) * scale)] for v in values)
+
+
+class Ring:
+    """Serie de tamaño fijo sobre un `array` (sin objetos por muestra): la más antigua se sobrescribe."""
+
+    def __init__(self, size, typecode='f'):
+        self.size = size
+        self.data = array(typecode, bytes(array(typecode).itemsize * size))
+        self.pos = 0
+        self.count = 0
+
+    def append(self, value):
+        self.data[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def values(self):
+        if self.count < self.size:
+            return self.data[:self.count].tolist()
+        return (self.data[self.pos:] + self.data[:self.pos]).tolist()
+
+    @property
+    def last(self):
+        return self.data[self.pos - 1] if self.count else None
+
+    def copy(self):
+        ring = copy.copy(self)
+        ring.data = array(self.data.typecode, self.data)
+        return ring
+
+    def __len__(self):
+        return self.count
+
+
+class TreeStats:
+    """Series de un servidor (su árbol de procesos) y los contadores acumulados para Prometheus."""
+
+    METRICS = ('cpu', 'rss', 'threads', 'read', 'write')
+
+    def __init__(self, name, root, points):
+        self.name = name
+        # Etiquetas de Prometheus: kind="server" para servidores, kind="tunnel" para claves (tipo, nombre)
+        self.kind, self.label = name if isinstance(name, tuple) else ('server', name)
+        self.root = root
+        self.pids = {}  # pid -> starttime (detecta PIDs reutilizados)
+        self.previous = {}  # pid -> (ticks, bytes leídos, bytes escritos)
+        self.times = Ring(points, 'd')
+        self.series = {metric: Ring(points) for metric in self.METRICS}
+        self.cpu_seconds = 0.0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.rss = 0
+        self.swap = 0
+        self.threads = 0
+        self.processes = 0
+        self.last_sample = None
+
+    def current(self):
+        if not len(self.times):
+            return None
+        return {metric: ring.last for metric, ring in self.series.items()}
+
+    def copy(self):
+        """Copia desligada del muestreo (series incluidas) para leerla desde el loop."""
+        stats = copy.copy(self)
+        stats.times = self.times.copy()
+        stats.series = {metric: ring.copy() for metric, ring in self.series.items()}
+        return stats
+
+
+class ResourceSampler:
+    """
+    CPU, RAM, hilos y disco de cada servidor en marcha (y del agente de Playit).
+
+    Cada `CNP_METRICS_INTERVAL` segundos lee `/proc/<pid>/stat`, `status` e
+    `io` de todos los procesos de cada árbol. El árbol (script → java) se
+    descubre recorriendo todo /proc solo cada `rescan` muestras o cuando un
+    proceso desaparece; el resto de muestras solo abre los ficheros de los
+    PIDs conocidos, así que el coste crece con los servidores y no con los
+    procesos del host. Las series son `Ring` de `CNP_METRICS_POINTS` puntos.
+
+    `targets()` devuelve {nombre: pid raíz}; el agente de Playit va con la
+    clave `TUNNEL_TARGET` y se exporta con `kind="tunnel"`. Fuera de Linux no hay /proc y el
+    muestreo queda desactivado.
+
+    La muestra corre en un hilo: /proc se lee sin lock y los resultados se
+    aplican bajo `_lock`, el mismo que toman `get()` y `prometheus()` en el
+    loop. Un servidor que deja de estar en `targets()` se borra de `stats`.
+    """
+
+    def __init__(self, interval=None, points=None, rescan=None):
+        self.interval = float(os.getenv('CNP_METRICS_INTERVAL', 5) if interval is None else interval)
+        self.points = int(os.getenv('CNP_METRICS_POINTS', 120) if points is None else points)
+        self.rescan = int(os.getenv('CNP_METRICS_RESCAN', 12) if rescan is None else rescan)
+        self.enabled = self.interval > 0 and proc_available()
+        self.stats = {}
+        self._lock = threading.Lock()
+        self.targets = dict
+        self.samples = 0
+        # CPU gastada por el propio muestreo (segundos de hilo) y duración de la última muestra
+        self.cpu_spent = 0.0
+        self.last_duration = 0.0
+        self._needs_rescan = True
+        self._task = None
+
+    def start(self, targets):
+        self.targets = targets
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sample, self.targets())
+            except Exception as e:
+                log_exception(e, context='Resource sampling failed')
+            await asyncio.sleep(self.interval)
+
+    def sample(self, targets):
+        """Una muestra de todos los árboles (bloqueante: se llama desde un hilo)."""
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        now = time.time()
+        # Servidores detenidos fuera; mismo servidor con proceso nuevo: series nuevas
+        stats = {n: st for n, st in self.stats.items() if targets.get(n) == st.root}
+        for name, root in targets.items():
+            if name not in stats:
+                stats[name] = TreeStats(name, root, self.points)
+                self._needs_rescan = True
+        rescan = self._needs_rescan or self.samples % max(1, self.rescan) == 0
+        children = children_map() if rescan else None
+        self._needs_rescan = False
+        readings = [(stats[name], self._read_tree(stats[name], children)) for name in targets]
+        with self._lock:
+            for tree, reading in readings:
+                self._apply(tree, reading, now)
+            self.stats = stats
+            self.samples += 1
+            self.last_duration = time.perf_counter() - started
+            self.cpu_spent += time.thread_time() - cpu_started
+
+    def _read_tree(self, stats, children):
+        """Lee /proc para el árbol de `stats` sin modificarlo; `_apply` guarda el resultado."""
+        if children is not None:
+            pids = process_tree(stats.root, children)
+        else:
+            pids = list(stats.pids)
+        first = stats.last_sample is None
+        ticks_delta = read_delta = write_delta = 0
+        rss = swap = threads = 0
+        seen = {}
+        current = {}
+        for pid in pids:
+            stat = read_stat(pid)
+            if stat is None:
+                self._needs_rescan = True
+                continue
+            _, ticks, nthreads, starttime, resident = stat
+            known = stats.pids.get(pid)
+            if known is not None and known != starttime:
+                # PID reutilizado por otro proceso: el árbol ha cambiado
+                self._needs_rescan = True
+                continue
+            read, written = read_io(pid)
+            seen[pid] = starttime
+            current[pid] = (ticks, read, written)
+            prev = stats.previous.get(pid)
+            if prev is not None:
+                ticks_delta += max(0, ticks - prev[0])
+                read_delta += max(0, read - prev[1])
+                write_delta += max(0, written - prev[2])
+            elif not first:
+                # Proceso nacido desde la última muestra: todo lo suyo es nuevo
+                ticks_delta += ticks
+                read_delta += read
+                write_delta += written
+            rss += resident
+            swap += read_swap(pid)
+            threads += nthreads
+        return seen, current, ticks_delta, read_delta, write_delta, rss, swap, threads
+
+    def _apply(self, stats, reading, now):
+        seen, current, ticks_delta, read_delta, write_delta, rss, swap, threads = reading
+        first = stats.last_sample is None
+        stats.pids, stats.previous = seen, current
+        stats.rss, stats.swap, stats.threads, stats.processes = rss, swap, threads, len(seen)
+        stats.cpu_seconds += ticks_delta / CLK_TCK
+        stats.read_bytes += read_delta
+        stats.write_bytes += write_delta
+        if not first and seen:
+            elapsed = max(1e-6, now - stats.last_sample)
+            stats.times.append(now)
+            series = stats.series
+            series['cpu'].append(ticks_delta / CLK_TCK / elapsed * 100)
+            series['rss'].append(rss / 1024 / 1024)
+            series['threads'].append(threads)
+            series['read'].append(read_delta / elapsed)
+            series['write'].append(write_delta / elapsed)
+        stats.last_sample = now
+
+    def get(self, name):
+        """Copia de las series de `name`, o None si no está en marcha."""
+        with self._lock:
+            stats = self.stats.get(name)
+            return stats.copy() if stats is not None and stats.processes else None
+
+    # --- Exportación (formato de texto de Prometheus) ---
+
+    def prometheus(self):
+        with self._lock:
+            return self._prometheus()
+
+    def _prometheus(self):
+        live = [s for s in self.stats.values() if s.processes]
+        lines = []
+
+        def metric(name, kind, help_text, values):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for stats, value in values:
+                lines.append(f'{name}{{kind="{stats.kind}",server="{_label(stats.label)}"}} {value}')
+
+        metric('cnp_process_cpu_seconds_total', 'counter', 'CPU time of the server process tree.',
+               [(s, f'{s.cpu_seconds:.2f}') for s in live])
+        metric('cnp_process_resident_memory_bytes', 'gauge', 'Resident memory of the server process tree.',
+               [(s, s.rss) for s in live])
+        metric('cnp_process_swap_bytes', 'gauge', 'Swapped-out memory of the server process tree.',
+               [(s, s.swap) for s in live])
+        metric('cnp_process_threads', 'gauge', 'Threads in the server process tree.',
+               [(s, s.threads) for s in live])
+        metric('cnp_process_count', 'gauge', 'Processes in the server process tree.',
+               [(s, s.processes) for s in live])
+        metric('cnp_process_disk_read_bytes_total', 'counter', 'Bytes read from disk by the server process tree.',
+               [(s, s.read_bytes) for s in live])
+        metric('cnp_process_disk_written_bytes_total', 'counter', 'Bytes written to disk by the server process tree.',
+               [(s, s.write_bytes) for s in live])
+        lines.append('# HELP cnp_sampler_cpu_seconds_total CPU time spent by the resource sampler.')
+        lines.append('# TYPE cnp_sampler_cpu_seconds_total counter')
+        lines.append(f'cnp_sampler_cpu_seconds_total {self.cpu_spent:.4f}')
+        lines.append('# HELP cnp_sampler_last_duration_seconds Wall time of the last sample.')
+        lines.append('# TYPE cnp_sampler_last_duration_seconds gauge')
+        lines.append(f'cnp_sampler_last_duration_seconds {self.last_duration:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsServer:
+    """
+    Endpoint HTTP mínimo (solo `GET /metrics`) para que Prometheus lea el
+    muestreo. Escucha en `CNP_METRICS_BIND` (127.0.0.1 por defecto): no lleva
+    autenticación, así que no debe exponerse fuera del host.
+    """
+
+    def __init__(self, sampler, host='127.0.0.1', port=9465):
+        self.sampler = sampler
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._client, self.host, self.port)
+
+    async def close(self):
+        if self._server is not None:
+            server, self._server = self._server, None
+            server.close()
+            await server.wait_closed()
+
+    async def _client(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=5)
+            parts = request.split(b'\r\n', 1)[0].split()
+            if len(parts) < 2 or parts[0] not in (b'GET', b'HEAD'):
+                status, body, ctype = '405 Method Not Allowed', b'', 'text/plain'
+            elif parts[1].split(b'?')[0] != b'/metrics':
+                status, body, ctype = '404 Not Found', b'', 'text/plain'
+            else:
+                status, ctype = '200 OK', 'text/plain; version=0.0.4; charset=utf-8'
+                body = self.sampler.prometheus().encode('utf-8')
+            head = (f'HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\n'
+                    'Connection: close\r\n\r\n').encode('ascii')
+            writer.write(head if parts[:1] == [b'HEAD'] else head + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            log_exception(e, context='Metrics endpoint request failed')
+        finally:
+            writer.close()
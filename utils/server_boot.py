@@ -0,0 +1,119 @@
+import re
+import time
+import asyncio
+from collections import deque
+
+from utils.process_runner import terminate
+from utils.process_backend import get_backend
+
+# Línea que imprime el servidor cuando termina de cargar el mundo:
+# "[12:00:00] [Server thread/INFO]: Done (12.345s)! For help, type "help""
+DONE_RE = re.compile(r'Done \((?P<secs>[\d.,]+)s\)! For help')
+
+
+class BootResult:
+    def __init__(self):
+        self.ready = False
+        # Segundos medidos por el bot desde el arranque hasta la línea "Done"
+        self.time_to_ready = None
+        # Segundos que reporta el propio servidor en la línea "Done (...)"
+        self.reported_secs = None
+        self.stopped_cleanly = False
+        self.timed_out = False
+        self.returncode = None
+        self.elapsed = 0.0
+        self.lines = deque(maxlen=200)
+
+
+async def first_boot(cmd, cwd, timeout=300, stop_timeout=60, log_path=None):
+    """
+    Arranca el servidor hasta que está listo y lo detiene limpiamente.
+
+    Se observa la salida del proceso buscando la línea `Done (...)! For help`;
+    en cuanto aparece se envía `stop` por stdin para que guarde el mundo y
+    salga. Si no está listo en `timeout` segundos, o no sale tras el `stop`
+    en `stop_timeout`, se termina el proceso.
+    """
+    result = BootResult()
+    started = time.monotonic()
+    ready_event = asyncio.Event()
+    log_f = None
+    if log_path:
+        try:
+            log_f = open(log_path, 'a', encoding='utf-8')
+        except OSError:
+            log_f = None
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, cwd=cwd,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        **get_backend().spawn_kwargs(),
+    )
+
+    async def reader():
+        while True:
+            raw = await proc.stdout.readline()
+            if not raw:
+                return
+            line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+            result.lines.append(line)
+            if log_f:
+                try:
+                    log_f.write(line + '\n')
+                except OSError:
+                    pass
+            if not result.ready:
+                m = DONE_RE.search(line)
+                if m:
+                    result.ready = True
+                    result.time_to_ready = time.monotonic() - started
+                    try:
+                        result.reported_secs = float(m.group('secs').replace(',', '.'))
+                    except ValueError:
+                        pass
+                    ready_event.set()
+
+    reader_task = asyncio.ensure_future(reader())
+    exited = asyncio.ensure_future(proc.wait())
+    try:
+        ready_wait = asyncio.ensure_future(ready_event.wait())
+        await asyncio.wait({ready_wait, exited}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        ready_wait.cancel()
+
+        if result.ready and proc.returncode is None:
+            try:
+                proc.stdin.write(b'stop\n')
+                await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            try:
+                await asyncio.wait_for(asyncio.shield(exited), timeout=stop_timeout)
+                result.stopped_cleanly = True
+            except asyncio.TimeoutError:
+                await terminate(proc)
+        elif proc.returncode is None:
+            result.timed_out = True
+            # Pedir stop aunque no esté listo: el servidor lo atiende al terminar de cargar
+            try:
+                proc.stdin.write(b'stop\n')
+                await proc.stdin.drain()
+                await asyncio.wait_for(asyncio.shield(exited), timeout=min(stop_timeout, 30))
+            except (BrokenPipeError, ConnectionResetError, asyncio.TimeoutError):
+                await terminate(proc)
+    except asyncio.CancelledError:
+        await terminate(proc)
+        raise
+    finally:
+        await exited
+        try:
+            await asyncio.wait_for(reader_task, timeout=5)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            reader_task.cancel()
+        if log_f:
+            log_f.close()
+
+    result.returncode = proc.returncode
+    result.elapsed = time.monotonic() - started
+    return result
@@ -0,0 +1,112 @@
+import os
+import time
+import asyncio
+
+from utils.ports import server_ports, port_in_use
+
+# Líneas de logs/latest.log que indican que el mundo ya está guardado durante el apagado
+# (`save-all flush` también las escribe: el desplazamiento del log se toma después)
+SAVED_MARKERS = (
+    'All dimensions are saved',   # 1.17+
+    'All chunks are saved',       # ThreadedAnvilChunkStorage, versiones anteriores
+)
+
+
+def log_offset(path):
+    """Tamaño actual del log: a partir de aquí se leen solo las líneas nuevas."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+async def watch_log(path, offset, on_line, poll=0.2):
+    """
+    Sigue `path` desde `offset` y llama a `on_line(línea)` con cada línea
+    nueva hasta que `on_line` devuelva True o se cancele la tarea. Si el log
+    rota (el fichero encoge), vuelve a empezar desde el principio.
+    """
+    pending = b''
+    while True:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        if size is not None and size < offset:
+            offset, pending = 0, b''
+        if size is not None and size > offset:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+            offset += len(data)
+            pending += data
+            *lines, pending = pending.split(b'\n')
+            for raw in lines:
+                if on_line(raw.decode('utf-8', errors='replace').rstrip('\r')):
+                    return True
+        await asyncio.sleep(poll)
+
+
+class ShutdownResult:
+    """Cómo terminó un apagado: 'exited' (salió solo), 'saved' (guardó pero no salió) o 'timeout'."""
+
+    def __init__(self, outcome, elapsed, saved_after=None):
+        self.outcome = outcome
+        self.elapsed = elapsed
+        # Segundos hasta ver en el log que el mundo estaba guardado
+        self.saved_after = saved_after
+
+
+async def wait_for_exit(process, log_path, offset, deadline, saved_grace=10.0):
+    """
+    Espera a que `process` termine tras un `stop`, sin intervalos fijos: lo
+    despierta la salida del proceso. Si antes aparece en el log que el mundo
+    está guardado y el proceso no sale en `saved_grace` segundos (p. ej. un
+    mod que bloquea el apagado), se devuelve 'saved' para que se pueda matar
+    sin riesgo de perder datos.
+    """
+    started = time.monotonic()
+    saved = asyncio.Event()
+    marks = {}
+
+    def on_line(line):
+        if any(m in line for m in SAVED_MARKERS):
+            marks.setdefault('saved', time.monotonic() - started)
+            saved.set()
+            return True
+        return False
+
+    exit_task = asyncio.ensure_future(process.wait())
+    log_task = asyncio.ensure_future(watch_log(log_path, offset, on_line)) if log_path else None
+    try:
+        remaining = max(0.0, deadline - time.monotonic())
+        waiters = {exit_task} | ({log_task} if log_task else set())
+        done, _ = await asyncio.wait(waiters, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        if exit_task in done:
+            return ShutdownResult('exited', time.monotonic() - started, marks.get('saved'))
+        if saved.is_set():
+            remaining = max(0.0, min(saved_grace, deadline - time.monotonic()))
+            try:
+                await asyncio.wait_for(asyncio.shield(exit_task), timeout=remaining)
+                return ShutdownResult('exited', time.monotonic() - started, marks.get('saved'))
+            except asyncio.TimeoutError:
+                return ShutdownResult('saved', time.monotonic() - started, marks.get('saved'))
+        return ShutdownResult('timeout', time.monotonic() - started, marks.get('saved'))
+    finally:
+        for task in (exit_task, log_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def wait_ports_free(info, timeout=30.0, poll=0.2):
+    """Espera a que los puertos de juego y RCON del servidor queden libres. Devuelve los segundos esperados o None."""
+    ports = server_ports(info)
+    started = time.monotonic()
+    while True:
+        busy = await asyncio.to_thread(
+            lambda: port_in_use(ports['game'], 'game') or port_in_use(ports['rcon'], 'rcon'))
+        if not busy:
+            return time.monotonic() - started
+        if time.monotonic() - started >= timeout:
+            return None
+        await asyncio.sleep(poll)
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import socket
+import asyncio
+
+from mcstatus import JavaServer
+
+from utils.errors import log_exception
+from utils.rcon import RconError
+
+
+class StatusEntry:
+    """Resultado de un sondeo: lo que `!estado` muestra, y cuándo se obtuvo."""
+
+    def __init__(self, online, running=None, version=None, players_online=0, players_max=0, latency=None,
+                 players=None, error=None, duration=0.0):
+        self.online = online
+        # Si el proceso estaba en marcha (según el bot) al sondear; None si no se sabe
+        self.running = running
+        self.version = version
+        self.players_online = players_online
+        self.players_max = players_max
+        self.latency = latency
+        # Nombres de los jugadores (RCON `list`, o la muestra del ping); None si no se pudieron obtener
+        self.players = players
+        self.error = error
+        self.duration = duration
+        self.fetched = time.monotonic()
+        self.fetched_at = time.time()
+
+    @property
+    def age(self):
+        return time.monotonic() - self.fetched
+
+
+def parse_player_list(resp):
+    """Nombres de la respuesta de `/list` ("There are 2 of a max of 20 players online: a, b")."""
+    if ':' not in resp:
+        return None
+    names = [name.strip() for name in resp.split(':', 1)[1].split(',') if name.strip()]
+    return names or None
+
+
+class StatusService:
+    """
+    Estado de todos los servidores registrados, sondeado en segundo plano y
+    servido desde caché.
+
+    - Cada servidor tiene su ritmo: `fast` s mientras está en marcha pero no
+      responde (arrancando o colgado), `interval` s si está en línea e
+      `idle_interval` s si está apagado; un cambio de estado del proceso
+      (arranca, se detiene) provoca un sondeo inmediato.
+    - `get()` contesta con lo último que haya; si es más antiguo que
+      `max_age` lanza un sondeo en segundo plano. Las peticiones simultáneas
+      del mismo servidor comparten un único sondeo en curso (single-flight).
+    - La dirección (`address` en servers.json, con registro SRV) se resuelve
+      una vez y se guarda `dns_ttl` s; un fallo de conexión la invalida.
+    """
+
+    def __init__(self, config=None, rcon=None):
+        self.config = config
+        self.rcon = rcon
+        self.interval = float(os.getenv('CNP_STATUS_INTERVAL', 30))
+        self.fast_interval = float(os.getenv('CNP_STATUS_FAST_INTERVAL', 5))
+        self.idle_interval = float(os.getenv('CNP_STATUS_IDLE_INTERVAL', 300))
+        self.max_age = float(os.getenv('CNP_STATUS_MAX_AGE', 15))
+        self.timeout = float(os.getenv('CNP_STATUS_TIMEOUT', 3))
+        self.dns_ttl = float(os.getenv('CNP_STATUS_DNS_TTL', 300))
+        self.entries = {}
+        self.probes = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self._addresses = {}
+        self._running = lambda: None
+        self._task = None
+
+    def load_server_data(self):
+        """Carga la base de datos de servidores desde servers.json."""
+        if self.config:
+            return self.config.servers
+        try:
+            with open('servers.json', 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    # --- Ciclo de vida ---
+
+    def start(self, running=None):
+        """`running()` devuelve el conjunto de servidores en marcha (o None si no se sabe)."""
+        if running is not None:
+            self._running = running
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        tasks = [t for t in (self._task, *self._inflight.values()) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._inflight.clear()
+
+    def _due(self, name, running):
+        entry = self.entries.get(name)
+        if entry is None:
+            return True
+        is_running = None if running is None else name in running
+        if is_running is not None and entry.running is not None and is_running != entry.running:
+            return True
+        if entry.online:
+            wait = self.interval
+        elif is_running:
+            wait = self.fast_interval
+        else:
+            wait = self.idle_interval
+        return entry.age >= wait
+
+    async def _loop(self):
+        while True:
+            try:
+                running = self._running()
+                for name in list(self.load_server_data()):
+                    if name not in self._inflight and self._due(name, running):
+                        self.refresh(name)
+                for name in [n for n in self.entries if n not in self.load_server_data()]:
+                    # Servidor borrado de servers.json
+                    del self.entries[name]
+            except Exception as e:
+                log_exception(e, context='Status polling failed')
+            await asyncio.sleep(1)
+
+    # --- Consulta ---
+
+    def refresh(self, name):
+        """Tarea del sondeo de `name`: la que ya esté en curso o una nueva."""
+        task = self._inflight.get(name)
+        if task is not None and not task.done():
+            self.coalesced += 1
+            return task
+        task = asyncio.ensure_future(self._probe(name))
+        self._inflight[name] = task
+        task.add_done_callback(lambda t: self._inflight.pop(name, None) if self._inflight.get(name) is t else None)
+        return task
+
+    async def get(self, name, max_age=None):
+        """
+        (entrada, actualizando): lo último conocido de `name`. Solo espera a un
+        sondeo si no hay nada en caché; si lo hay pero es viejo, lo refresca en
+        segundo plano. (None, False) si el servidor no existe.
+        """
+        if name not in self.load_server_data():
+            return None, False
+        entry = self.entries.get(name)
+        if entry is None:
+            # Sin datos: esperar al sondeo (compartido con cualquier otro en curso)
+            return await asyncio.shield(self.refresh(name)), False
+        stale = entry.age > (self.max_age if max_age is None else max_age)
+        if stale:
+            self.refresh(name)
+        return entry, stale or name in self._inflight
+
+    # --- Sondeo ---
+
+    async def _resolve(self, address):
+        """(ip, puerto) de `address`, resolviendo SRV y DNS como mucho una vez cada `dns_ttl` s."""
+        cached = self._addresses.get(address)
+        if cached is not None and cached[2] > time.monotonic():
+            return cached[0], cached[1]
+        server = await JavaServer.async_lookup(address, timeout=self.timeout)
+        host, port = server.address.host, server.address.port
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        # IPv4 primero: un servidor que solo escucha en 0.0.0.0 no responde en ::1
+        ipv4 = [i for i in infos if i[0] == socket.AF_INET]
+        ip = (ipv4 or infos)[0][4][0] if infos else host
+        self._addresses[address] = (ip, port, time.monotonic() + self.dns_ttl)
+        return ip, port
+
+    async def _probe(self, name):
+        info = self.load_server_data().get(name)
+        if info is None:
+            return None
+        running = self._running()
+        is_running = None if running is None else name in running
+        address = info.get('address', 'localhost:25565')
+        started = time.monotonic()
+        self.probes += 1
+        try:
+            host, port = await self._resolve(address)
+            status = await JavaServer(host, port, timeout=self.timeout).async_status(tries=1)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Puede que la IP haya cambiado: la próxima vez se vuelve a resolver
+            self._addresses.pop(address, None)
+            entry = StatusEntry(False, running=is_running, error=str(e) or type(e).__name__,
+                                duration=time.monotonic() - started)
+            self.entries[name] = entry
+            return entry
+
+        players = None
+        if status.players.online > 0:
+            players = await self._player_names(name, info)
+            if players is None and status.players.sample:
+                players = [p.name for p in status.players.sample]
+        entry = StatusEntry(True, running=is_running, version=status.version.name,
+                            players_online=status.players.online, players_max=status.players.max,
+                            latency=status.latency, players=players, duration=time.monotonic() - started)
+        self.entries[name] = entry
+        return entry
+
+    async def _player_names(self, name, info):
+        if self.rcon is None or not self.rcon.password:
+            return None
+        try:
+            resp = await self.rcon.command(info.get('rcon_host', 'localhost'), info.get('rcon_port', 25575), 'list',
+                                           timeout=self.timeout)
+            return parse_player_list(resp)
+        except (RconError, OSError, asyncio.TimeoutError) as e:
+            log_exception(e, context=f'RCON error while fetching players for {name}')
+            return None
@@ -0,0 +1,288 @@
+import os
+import time
+import asyncio
+from collections import deque
+
+from mcstatus import JavaServer
+
+from utils.errors import log_exception
+from utils.ports import server_ports
+
+
+class ServerHealth:
+    """Estado de vigilancia de un servidor."""
+
+    def __init__(self, name):
+        self.name = name
+        # running | starting | restarting | crashloop | stopped
+        self.state = 'starting'
+        self.process = None
+        self.started_at = None
+        self.healthy_once = False
+        self.failed_probes = 0
+        # Instantes de las caídas recientes (para backoff y detección de bucles)
+        self.crashes = deque()
+        self.last_probe = None  # {'ping': ms|None, 'rcon': ms|None, 'at': epoch}
+        self.next_restart = None
+        self.expected_exit = False
+        self.watch_task = None
+        self.restart_task = None
+
+
+class Supervisor:
+    """
+    Vigila los servidores que arranca el bot.
+
+    - Cada proceso tiene una tarea que espera a que termine (sin sondeo): si
+      sale sin que nadie lo haya pedido es una caída.
+    - Cada `CNP_SUPERVISOR_INTERVAL` segundos se comprueba que el proceso siga
+      vivo y que el servidor responda a SLP (ping de la lista de servidores)
+      o a RCON. Tras `CNP_SUPERVISOR_HUNG_PROBES` sondeos seguidos sin
+      respuesta se considera colgado y se reinicia. Durante el arranque
+      (`CNP_SUPERVISOR_STARTUP_GRACE` s, o hasta el primer sondeo bueno) no
+      se cuentan fallos.
+    - Las caídas se reinician con backoff exponencial
+      (`CNP_RESTART_BACKOFF_BASE` … `CNP_RESTART_BACKOFF_MAX`); con
+      `CNP_CRASHLOOP_COUNT` caídas en `CNP_CRASHLOOP_WINDOW` s se deja de
+      reintentar hasta un `!iniciar` manual. `CNP_AUTO_RESTART=0` solo avisa.
+
+    `manager` es el cog de gestión de servidores: se usan su
+    `running_servers`, `load_server_data`, `backend`, `force_grace` y
+    `_internal_start_server`. `notify(servidor, texto)` envía las alertas.
+    """
+
+    def __init__(self, manager, pool, notify):
+        self.manager = manager
+        self.pool = pool
+        self.notify = notify
+        self.interval = float(os.getenv('CNP_SUPERVISOR_INTERVAL', 30))
+        self.startup_grace = float(os.getenv('CNP_SUPERVISOR_STARTUP_GRACE', 300))
+        self.hung_probes = int(os.getenv('CNP_SUPERVISOR_HUNG_PROBES', 4))
+        self.probe_timeout = float(os.getenv('CNP_SUPERVISOR_PROBE_TIMEOUT', 5))
+        self.backoff_base = float(os.getenv('CNP_RESTART_BACKOFF_BASE', 10))
+        self.backoff_max = float(os.getenv('CNP_RESTART_BACKOFF_MAX', 600))
+        self.crashloop_count = int(os.getenv('CNP_CRASHLOOP_COUNT', 5))
+        self.crashloop_window = float(os.getenv('CNP_CRASHLOOP_WINDOW', 1800))
+        self.enabled = os.getenv('CNP_SUPERVISOR', '1') != '0'
+        self.auto_restart = os.getenv('CNP_AUTO_RESTART', '1') != '0'
+        self.health = {}
+        self._probe_task = None
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        if self.enabled and (self._probe_task is None or self._probe_task.done()):
+            self._probe_task = asyncio.ensure_future(self._probe_loop())
+
+    async def stop(self):
+        tasks = [self._probe_task] if self._probe_task else []
+        for h in self.health.values():
+            tasks += [t for t in (h.watch_task, h.restart_task) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._probe_task = None
+
+    # --- Registro de procesos ---
+
+    def watch(self, name, process):
+        """Empieza a vigilar `process` (recién arrancado) como servidor `name`."""
+        h = self.health.get(name) or ServerHealth(name)
+        self.health[name] = h
+        if h.watch_task and not h.watch_task.done():
+            h.watch_task.cancel()
+        h.process = process
+        h.state = 'running'
+        h.started_at = time.monotonic()
+        h.healthy_once = False
+        h.failed_probes = 0
+        h.expected_exit = False
+        h.next_restart = None
+        h.watch_task = asyncio.ensure_future(self._watch_exit(h, process))
+
+    def expect_exit(self, name):
+        """El proceso va a terminar a propósito (`!detener`): no es una caída."""
+        h = self.health.get(name)
+        if h:
+            h.expected_exit = True
+
+    def forget(self, name):
+        """
+        Deja de vigilar `name` (detenido o arrancado a mano) y cancela un
+        reinicio pendiente; el historial de caídas empieza de cero.
+        """
+        h = self.health.get(name)
+        if not h:
+            return
+        for task in (h.watch_task, h.restart_task):
+            if task and not task.done() and task is not asyncio.current_task():
+                task.cancel()
+        h.state = 'stopped'
+        h.next_restart = None
+        h.crashes.clear()
+
+    # --- Caídas ---
+
+    async def _watch_exit(self, h, process):
+        try:
+            code = await process.wait()
+        except asyncio.CancelledError:
+            return
+        if h.expected_exit or h.process is not process:
+            return
+        details = ''
+        console = getattr(process, 'console', None)
+        if console is not None and console.lines:
+            # Lo último que escribió antes de caer (normalmente la excepción)
+            tail = [line[:200] for line in console.tail(6)]
+            details = '\n```\n' + '\n'.join(tail).replace('```', "'''") + '\n```'
+        if getattr(process, 'attached', False):
+            # Proceso reenganchado tras reiniciar el bot: su código de salida no se puede saber
+            await self._crashed(h, 'el proceso terminó', details)
+        else:
+            await self._crashed(h, f'el proceso terminó con código {code}', details)
+
+    def _backoff(self, h):
+        now = time.monotonic()
+        while h.crashes and now - h.crashes[0] > self.crashloop_window:
+            h.crashes.popleft()
+        return min(self.backoff_max, self.backoff_base * 2 ** max(0, len(h.crashes) - 1))
+
+    async def _crashed(self, h, reason, details=''):
+        running = self.manager.running_servers
+        if running.get(h.name) is h.process:
+            running.pop(h.name, None)
+            registry = getattr(self.manager, 'registry', None)
+            if registry is not None:
+                registry.remove(h.name)
+        h.crashes.append(time.monotonic())
+        delay = self._backoff(h)
+        if len(h.crashes) >= self.crashloop_count:
+            h.state = 'crashloop'
+            await self._release_tunnel(h.name)
+            await self.notify(h.name, f'🛑 `{h.name}` se ha caído {len(h.crashes)} veces en '
+                              f'{self.crashloop_window / 60:.0f} min ({reason}). Reinicio automático desactivado '
+                              f'hasta un `!iniciar {h.name}` manual; revisa `logs/latest.log` y los crash-reports.' + details)
+            return
+        if not self.auto_restart:
+            h.state = 'stopped'
+            await self._release_tunnel(h.name)
+            await self.notify(h.name, f'⚠️ `{h.name}` se ha caído ({reason}). El reinicio automático está '
+                                      'desactivado (`CNP_AUTO_RESTART=0`).' + details)
+            return
+        h.state = 'restarting'
+        h.next_restart = time.time() + delay
+        await self.notify(h.name, f'⚠️ `{h.name}` se ha caído ({reason}). Reinicio automático en {delay:.0f}s '
+                          f'(caída {len(h.crashes)} de {self.crashloop_count} antes de desistir).' + details)
+        h.restart_task = asyncio.ensure_future(self._restart_later(h, delay))
+
+    async def _release_tunnel(self, name):
+        """Sin reinicio a la vista, el servidor deja de contar para el túnel de Playit."""
+        tunnel = getattr(self.manager, 'tunnel', None)
+        if tunnel is not None:
+            await tunnel.release(name)
+
+    async def _restart_later(self, h, delay):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        h.next_restart = None
+        # Ya no se cancela desde forget(): cortar un arranque a medias dejaría un proceso huérfano
+        h.restart_task = None
+        try:
+            started = await self.manager._internal_start_server(_Alerts(self.notify, h.name), h.name)
+        except Exception as e:
+            log_exception(e, context=f'Supervisor restart failed for {h.name}')
+            started = False
+        if not started and h.state == 'restarting':
+            # No llegó a arrancar: cuenta como otra caída (con más backoff)
+            await self._crashed(h, 'no se pudo reiniciar')
+
+    # --- Sondeos de salud ---
+
+    async def probe(self, name, info):
+        """(ping_ms, rcon_ms): None en lo que no responda."""
+        ports = server_ports(info)
+
+        async def slp():
+            server = JavaServer('127.0.0.1', ports['game'], timeout=self.probe_timeout)
+            status = await server.async_status(tries=1)
+            return status.latency
+
+        async def rcon():
+            if not self.pool.password:
+                return None
+            session = await self.pool.session(info.get('rcon_host', 'localhost'), ports['rcon'])
+            return await session.ping(timeout=self.probe_timeout) * 1000
+
+        limit = self.probe_timeout + 1
+        ping, rc = await asyncio.gather(asyncio.wait_for(slp(), timeout=limit),
+                                        asyncio.wait_for(rcon(), timeout=limit), return_exceptions=True)
+        ping = None if isinstance(ping, BaseException) else ping
+        rc = None if isinstance(rc, BaseException) else rc
+        return ping, rc
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self._probe_all()
+            except Exception as e:
+                log_exception(e, context='Supervisor probe loop')
+
+    async def _probe_all(self):
+        servers = self.manager.load_server_data()
+        checks = [h for h in self.health.values() if h.state == 'running' and h.name in servers]
+        results = await asyncio.gather(*(self.probe(h.name, servers[h.name]) for h in checks))
+        now = time.monotonic()
+        for h, (ping, rc) in zip(checks, results):
+            if h.state != 'running' or h.process is None or h.process.poll() is not None:
+                # La tarea de salida se encarga de las caídas
+                continue
+            h.last_probe = {'ping': ping, 'rcon': rc, 'at': time.time()}
+            if ping is not None or rc is not None:
+                h.healthy_once = True
+                h.failed_probes = 0
+                continue
+            if not h.healthy_once and now - h.started_at < self.startup_grace:
+                continue
+            h.failed_probes += 1
+            if h.failed_probes >= self.hung_probes:
+                await self._hung(h)
+
+    async def _hung(self, h):
+        h.state = 'restarting'
+        await self.notify(h.name, f'⚠️ `{h.name}` no responde a ping ni a RCON desde hace {h.failed_probes} sondeos '
+                          f'(~{h.failed_probes * self.interval:.0f}s) aunque el proceso sigue vivo. Reiniciándolo.')
+        # Sin RCON no hay cierre ordenado posible: SIGTERM (la JVM guarda al salir) y, si no, kill
+        h.expected_exit = True
+        try:
+            await self.manager.backend.terminate(h.process, grace=self.manager.force_grace)
+        except Exception as e:
+            log_exception(e, context=f'Supervisor could not stop hung server {h.name}')
+        h.expected_exit = False
+        info = self.manager.load_server_data().get(h.name, {})
+        await self.pool.discard(*self.pool.address(info))
+        await self._crashed(h, 'colgado')
+
+    # --- Informe ---
+
+    def describe(self, name):
+        h = self.health.get(name)
+        if not h:
+            return None
+        self._backoff(h)
+        return h
+
+
+class _Alerts:
+    """Sustituto de `ctx` para los arranques/paradas automáticos: los mensajes van al canal de alertas."""
+
+    def __init__(self, notify, name):
+        self._notify = notify
+        self.name = name
+
+    async def send(self, content=None, **kwargs):
+        if content:
+            await self._notify(self.name, f'[{self.name}] {content}')
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import shutil
+
+from utils.artifact_cache import link_or_copy
+from utils.install_checkpoint import CHECKPOINT_FILE
+from utils.log_index import INDEX_FILE, JOURNAL_FILE
+
+# Directorios cuyo contenido no cambia entre servidores (se enlazan)
+IMMUTABLE_DIRS = {'libraries', 'versions', '.fabric', 'mods', 'plugins', 'bundler'}
+# Extensiones inmutables en cualquier lugar (jars, zips de resource packs)
+IMMUTABLE_EXTS = {'.jar', '.zip'}
+# Lo que no tiene sentido llevar a un clon (el índice de actividad es historia del servidor original)
+SKIP_DIRS = {'logs', 'crash-reports', 'debug'}
+SKIP_FILES = {'session.lock', 'install_debug.log', CHECKPOINT_FILE, INDEX_FILE, INDEX_FILE + '.tmp', JOURNAL_FILE}
+
+
+def _is_immutable(rel_path):
+    parts = rel_path.replace('\\', '/').split('/')
+    if parts[0] in IMMUTABLE_DIRS:
+        return True
+    return os.path.splitext(rel_path)[1].lower() in IMMUTABLE_EXTS
+
+
+def clone_tree(src, dst):
+    """
+    Replica la carpeta `src` en `dst` (que no debe existir).
+
+    Jars, librerías y mods se enlazan (hard link o reflink, ver
+    `link_or_copy`); el mundo y la configuración se copian de verdad para que
+    el clon pueda modificarlos. Devuelve un dict con contadores.
+    """
+    stats = {'linked': 0, 'copied': 0, 'bytes_copied': 0, 'methods': {}}
+    os.makedirs(dst)
+    for root, dirs, files in os.walk(src):
+        rel_root = os.path.relpath(root, src)
+        if rel_root == '.':
+            rel_root = ''
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for d in dirs:
+            os.makedirs(os.path.join(dst, rel_root, d), exist_ok=True)
+        for name in files:
+            if name in SKIP_FILES or name.endswith('.part'):
+                continue
+            rel = os.path.join(rel_root, name)
+            s = os.path.join(src, rel)
+            d = os.path.join(dst, rel)
+            if _is_immutable(rel):
+                method = link_or_copy(s, d)
+                stats['linked'] += 1
+                stats['methods'][method] = stats['methods'].get(method, 0) + 1
+            else:
+                shutil.copy2(s, d)
+                stats['copied'] += 1
+                stats['bytes_copied'] += os.path.getsize(d)
+    return stats
+
+
+def read_properties(path):
+    props = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#') or '=' not in line:
+                    continue
+                k, v = line.split('=', 1)
+                props[k.strip()] = v.strip()
+    except FileNotFoundError:
+        pass
+    return props
+
+
+def rewrite_properties(path, updates):
+    """Actualiza claves de `server.properties` conservando el resto del archivo."""
+    lines = []
+    pending = dict(updates)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                key = line.split('=', 1)[0].strip() if '=' in line and not line.lstrip().startswith('#') else None
+                if key in pending:
+                    lines.append(f'{key}={pending.pop(key)}\n')
+                else:
+                    lines.append(line if line.endswith('\n') else line + '\n')
+    except FileNotFoundError:
+        lines.append('# Archivo generado por CraftNPlay\n')
+    for key, value in pending.items():
+        lines.append(f'{key}={value}\n')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+
+
+class TemplateStore:
+    """Plantillas ("golden servers") registradas en `templates.json`."""
+
+    def __init__(self, path='templates.json'):
+        self.path = path
+        self.templates = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.templates = json.load(f) or {}
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            self.templates = {}
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.templates, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            pass
+
+    def get(self, name):
+        return self.templates.get(name)
+
+    def add(self, name, server_name, path, server_type=None, version=None, script='run.bat'):
+        self.templates[name] = {
+            'server': server_name,
+            'path': path,
+            'type': server_type,
+            'version': version,
+            'script': script,
+            'registered_at': time.time(),
+        }
+        self.save()
+
+    def remove(self, name):
+        if self.templates.pop(name, None) is not None:
+            self.save()
+            return True
+        return False
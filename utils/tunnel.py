@@ -0,0 +1,266 @@
+import os
+import re
+import time
+import shutil
+import asyncio
+
+from utils.errors import log_exception
+from utils.console import ConsoleBuffer
+
+# Líneas del agente que indican que el túnel está conectado (se puede cambiar con CNP_PLAYIT_READY_PATTERN)
+READY_PATTERN = r'tunnel running|tunnels? registered|agent (?:is )?(?:connected|registered)|connected to playit'
+# El agente aún no está vinculado a una cuenta: hay que abrir el enlace de reclamación
+CLAIM_RE = re.compile(r'https://playit\.gg/(?:claim|mc)/\S+')
+
+
+class PlayitTunnel:
+    """
+    Agente de Playit.gg compartido por todos los servidores.
+
+    - `acquire(servidor)` lo arranca si no está en marcha y vuelve enseguida:
+      no espera a que conecte. La conexión se detecta leyendo su salida
+      (`READY_PATTERN`), no con una pausa fija; `wait_ready()` permite
+      esperarla a quien lo necesite.
+    - Cuenta qué servidores lo usan: `release(servidor)` solo lo cierra
+      cuando no queda ninguno, tras `linger` segundos (un `!reiniciar` no lo
+      tumba y lo vuelve a levantar).
+    - Si el agente muere mientras algún servidor lo usa, se relanza con
+      backoff exponencial (`backoff_base` … `backoff_max`).
+
+    Estados: disabled | stopped | starting | ready | unconfirmed (arrancado
+    pero sin confirmar la conexión, p. ej. reenganchado o sin salida
+    reconocible) | restarting | missing (no se encuentra el ejecutable).
+    """
+
+    def __init__(self, path, args=(), backend=None, registry=None, notify=None):
+        self.path = path
+        self.args = list(args)
+        self.backend = backend
+        self.registry = registry
+        # notify(texto): avisos (caídas del agente, vinculación pendiente)
+        self.notify = notify
+        pattern = os.getenv('CNP_PLAYIT_READY_PATTERN') or READY_PATTERN
+        self.ready_re = re.compile(pattern, re.IGNORECASE)
+        self.ready_timeout = float(os.getenv('CNP_PLAYIT_READY_TIMEOUT', 60))
+        self.linger = float(os.getenv('CNP_PLAYIT_LINGER', 30))
+        self.backoff_base = float(os.getenv('CNP_PLAYIT_BACKOFF_BASE', 5))
+        self.backoff_max = float(os.getenv('CNP_PLAYIT_BACKOFF_MAX', 300))
+        self.state = 'disabled' if not self.enabled else 'stopped'
+        self.refs = set()
+        self.process = None
+        self.console = ConsoleBuffer(max_lines=200, max_len=512)
+        self.console.listeners.append(self._on_line)
+        self.ready = asyncio.Event()
+        self.started_at = None
+        self.ready_after = None
+        self.failures = 0
+        self.needs_claim = False
+        self._lock = asyncio.Lock()
+        self._stopping = False
+        self._watch_task = None
+        self._timeout_task = None
+        self._linger_task = None
+        self._restart_task = None
+
+    @property
+    def enabled(self):
+        return bool(self.path) and self.path.lower() not in ('off', 'no', 'none', '0')
+
+    def executable(self):
+        """Ruta real del agente, o None si no existe."""
+        if not self.enabled:
+            return None
+        if os.path.isfile(self.path):
+            return self.path
+        return shutil.which(self.path)
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    # --- Referencias ---
+
+    async def acquire(self, server_name):
+        """
+        El servidor necesita el túnel. Devuelve 'running' (ya estaba), 'started'
+        (lanzado ahora; la conexión llega después), 'disabled' o 'missing'.
+        """
+        if not self.enabled:
+            return 'disabled'
+        self.refs.add(server_name)
+        self._cancel('_linger_task')
+        async with self._lock:
+            if self.running:
+                return 'running'
+            if self._restart_task is not None and not self._restart_task.done():
+                # Ya hay un relanzamiento programado tras una caída: adelantarlo
+                self._cancel('_restart_task')
+            return 'started' if await self._spawn() else 'missing'
+
+    async def release(self, server_name, linger=None):
+        """
+        El servidor ya no lo necesita; sin referencias, se cierra tras `linger`
+        s (0: ya). Devuelve 'kept' (otros lo usan), 'stopped', 'lingering' o None.
+        """
+        self.refs.discard(server_name)
+        if self.refs:
+            return 'kept'
+        self._cancel('_restart_task')
+        if not self.running:
+            return None
+        delay = self.linger if linger is None else linger
+        self._cancel('_linger_task')
+        if delay <= 0:
+            await self.stop()
+            return 'stopped'
+        self._linger_task = asyncio.ensure_future(self._stop_later(delay))
+        return 'lingering'
+
+    async def _stop_later(self, delay):
+        await asyncio.sleep(delay)
+        self._linger_task = None
+        if not self.refs:
+            await self.stop()
+
+    async def wait_ready(self, timeout=None):
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    # --- Proceso ---
+
+    async def _spawn(self):
+        path = self.executable()
+        if path is None:
+            self.state = 'missing'
+            log_exception(FileNotFoundError(self.path), context='Playit executable missing')
+            return False
+        self.ready.clear()
+        self.ready_after = None
+        self.needs_claim = False
+        self.started_at = time.monotonic()
+        self.state = 'starting'
+        self.console.append(f'--- {time.strftime("%Y-%m-%d %H:%M:%S")} arranque del agente ---')
+        try:
+            self.process = await self.backend.start(path, os.path.dirname(path) or None, name='playit',
+                                                    console=self.console, args=self.args)
+        except OSError as e:
+            self.state = 'missing'
+            log_exception(e, context='Error starting Playit process')
+            return False
+        if self.registry is not None:
+            self.registry.record_playit(self.process, command=[path, *self.args])
+        self._watch(self.process)
+        self._cancel('_timeout_task')
+        self._timeout_task = asyncio.ensure_future(self._ready_timeout(self.process))
+        return True
+
+    def adopt(self, process):
+        """Agente que sigue vivo de una ejecución anterior del bot (no se puede leer su salida)."""
+        self.process = process
+        self.state = 'unconfirmed'
+        self.started_at = time.monotonic()
+        self._watch(process)
+
+    def _watch(self, process):
+        self._cancel('_watch_task')
+        self._watch_task = asyncio.ensure_future(self._watch_exit(process))
+
+    async def _ready_timeout(self, process):
+        await asyncio.sleep(self.ready_timeout)
+        if self.process is process and self.state == 'starting':
+            self.state = 'unconfirmed'
+            log_exception(TimeoutError('Playit readiness not detected'),
+                          context=f'Playit running but no ready line in {self.ready_timeout:.0f}s')
+
+    def _on_line(self, line):
+        if self.state in ('starting', 'unconfirmed') and self.ready_re.search(line):
+            self.state = 'ready'
+            self.ready_after = time.monotonic() - self.started_at
+            self.ready.set()
+            return
+        claim = CLAIM_RE.search(line)
+        if claim and not self.needs_claim:
+            self.needs_claim = True
+            # El enlace permite vincular el agente a cualquier cuenta: solo a la consola del bot
+            print(f'  ⚠️ Playit.gg necesita vincularse: {claim.group(0)}')
+            if self.notify:
+                asyncio.ensure_future(self.notify(
+                    '⚠️ El agente de Playit.gg no está vinculado a ninguna cuenta; el enlace para '
+                    'vincularlo está en la consola del bot.'))
+
+    async def _watch_exit(self, process):
+        try:
+            await process.wait()
+        except asyncio.CancelledError:
+            return
+        if self.process is not process or self._stopping:
+            return
+        self.process = None
+        self.ready.clear()
+        if self.registry is not None:
+            self.registry.remove_playit()
+        if not self.refs:
+            self.state = 'stopped'
+            return
+        # Se estabiliza si aguantó conectado un rato: el backoff vuelve a empezar
+        if self.ready_after is not None and time.monotonic() - self.started_at > 600:
+            self.failures = 0
+        self.failures += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (self.failures - 1))
+        self.state = 'restarting'
+        tail = ' | '.join(line for line in self.console.tail(3) if line)
+        if self.notify:
+            await self.notify(f'⚠️ El túnel de Playit.gg se ha cerrado solo (fallo {self.failures}); '
+                              f'se relanza en {delay:.0f}s.' + (f' Últimas líneas: `{tail[:300]}`' if tail else ''))
+        self._restart_task = asyncio.ensure_future(self._restart_later(delay))
+
+    async def _restart_later(self, delay):
+        await asyncio.sleep(delay)
+        self._restart_task = None
+        async with self._lock:
+            if self.refs and not self.running:
+                if not await self._spawn() and self.notify:
+                    await self.notify('❌ No se pudo relanzar Playit.gg: no se encuentra el ejecutable.')
+
+    async def restart(self):
+        """Relanza el agente sin tocar los servidores que lo usan. Devuelve 'started' o 'missing'."""
+        await self.stop()
+        async with self._lock:
+            return 'started' if await self._spawn() else 'missing'
+
+    async def stop(self):
+        """Cierra el agente (y todo su grupo de procesos)."""
+        for name in ('_linger_task', '_restart_task', '_timeout_task'):
+            self._cancel(name)
+        process = self.process
+        if process is None:
+            return False
+        self._stopping = True
+        try:
+            if process.poll() is None:
+                await self.backend.terminate(process, grace=5)
+        except Exception as e:
+            log_exception(e, context='Error stopping Playit')
+        finally:
+            self._stopping = False
+            self._cancel('_watch_task')
+            self.process = None
+            self.ready.clear()
+            self.state = 'stopped'
+            if self.registry is not None:
+                self.registry.remove_playit()
+        return True
+
+    async def close(self):
+        """Al descargar el cog: deja de vigilar, pero el agente sigue (como los servidores) para reengancharse."""
+        for name in ('_linger_task', '_restart_task', '_timeout_task', '_watch_task'):
+            self._cancel(name)
+
+    def _cancel(self, name):
+        task = getattr(self, name)
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+        setattr(self, name, None)